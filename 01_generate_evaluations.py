@@ -2,12 +2,17 @@
 GitHub Action用装備評価生成スクリプト
 直近10件（URL_Numberが上位10件）の装備評価を生成
 既存の評価ファイルはスキップ
+スコアDB生成・HTML生成・PNG生成の実行メトリクスを表示（--metrics-json で JSON、--metrics-db で指定DBにも記録）
+- equipments_mart_score.db はリポジトリにコミットされるため、メトリクスは書き込まない
 """
+import argparse
 import sqlite3
 import sys
-import subprocess
 from pathlib import Path
+import generate_equipment_mart_score_db
+from ability_evaluator import load_evaluation_context
 from generate_equipment_evaluation import generate_evaluation_html, save_evaluation_file, generate_preview_image
+from pipeline_metrics import measure_stage, merge_metrics, print_metrics, save_metrics
 
 DB_FILE = "ryuon_equipments.db"
 OUTPUT_DIR = Path("evaluation_sheets")
@@ -51,8 +56,22 @@ def check_file_exists(equipment_name: str, rarity: str, url_number: int) -> bool
     return False
 
 
-def main():
-    """メイン処理"""
+def save_run_metrics(metrics: list, json_path: str = None, db_path: str = None):
+    """計測結果を表示（json_path / db_path 指定時はそこにも記録）"""
+    if not metrics:
+        return
+    metrics = merge_metrics(metrics)
+    conn = sqlite3.connect(db_path) if db_path else None
+    try:
+        save_metrics(conn, metrics, run_name="generate-evaluations", json_path=json_path)
+    finally:
+        if conn is not None:
+            conn.close()
+    print_metrics(metrics)
+
+
+def generate_all(metrics: list):
+    """スコアDB生成 → 直近10件の評価HTML・PNG生成（各処理のメトリクスを metrics に追加）"""
     print("=" * 60)
     print("GitHub Action用装備評価生成")
     print("=" * 60)
@@ -60,11 +79,9 @@ def main():
     # スコアDBを先に生成
     print("\n[1/2] equipments_mart_score.db を生成します...")
     try:
-        subprocess.run(
-            [sys.executable, "generate_equipment_mart_score_db.py"],
-            check=True,
-        )
-    except subprocess.CalledProcessError as e:
+        with measure_stage("generate_equipment_mart_score_db", records=metrics):
+            generate_equipment_mart_score_db.main()
+    except Exception as e:
         print(f"✗ スコアDB生成エラー: {e}")
         sys.exit(1)
 
@@ -87,6 +104,9 @@ def main():
     print("評価ファイル生成開始")
     print("=" * 60 + "\n")
     
+    # アビリティ評価の母集団・解析結果は全件で共有（装備ごとに mart を読み直さない）
+    context = load_evaluation_context(conn)
+
     success_count = 0
     skip_count = 0
     error_count = 0
@@ -100,14 +120,17 @@ def main():
                 continue
             
             # HTML生成
-            content, url_num = generate_evaluation_html(conn, equipment_name, rarity)
+            with measure_stage("evaluation_html", conn, metrics):
+                content, url_num = generate_evaluation_html(conn, equipment_name, rarity, context)
+                if content:
+                    html_filepath = save_evaluation_file(equipment_name, rarity, content, url_num)
             if content:
-                html_filepath = save_evaluation_file(equipment_name, rarity, content, url_num)
                 success_count += 1
                 
                 # 画像生成
                 try:
-                    generate_preview_image(html_filepath)
+                    with measure_stage("preview_png", records=metrics):
+                        generate_preview_image(html_filepath)
                     image_count += 1
                 except Exception as e:
                     print(f"⚠ 画像生成エラー ({equipment_name}): {e}")
@@ -135,5 +158,23 @@ def main():
         sys.exit(1)
 
 
+def main():
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="直近10件の装備評価を生成")
+    parser.add_argument("--metrics-json", default=None, help="実行メトリクスの JSON 出力先（任意）")
+    parser.add_argument(
+        "--metrics-db",
+        default=None,
+        help="実行メトリクスを pipeline_run_metrics に追記する DB（任意。コミット対象の DB は指定しない）",
+    )
+    args = parser.parse_args()
+
+    metrics = []
+    try:
+        generate_all(metrics)
+    finally:
+        save_run_metrics(metrics, json_path=args.metrics_json, db_path=args.metrics_db)
+
+
 if __name__ == "__main__":
     main()
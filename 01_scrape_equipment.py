@@ -9,6 +9,8 @@ import os
 import time
 import sqlite3
 
+from db_schema import ensure_schema
+
 IMG_DIR = "static"
 DB_PATH = "ryuon_equipments.db"
 
@@ -21,9 +23,8 @@ os.makedirs(IMG_DIR, exist_ok=True)
 
 
 # ===== DB関連 =====
-def init_db():
+def init_db(conn: sqlite3.Connection):
     """テーブルが無ければ作成"""
-    conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     cur.execute("""
         CREATE TABLE IF NOT EXISTS src_equipments (
@@ -44,10 +45,8 @@ def init_db():
         )
     """)
     conn.commit()
-    conn.close()
 
-def insert_to_db(equips):
-    conn = sqlite3.connect(DB_PATH)
+def insert_to_db(conn: sqlite3.Connection, equips):
     cur = conn.cursor()
     for eq in equips:
         cur.execute("""
@@ -62,14 +61,11 @@ def insert_to_db(equips):
             eq.get("URL_Number"), eq.get("IMG_URL")
         ))
     conn.commit()
-    conn.close()
 
-def get_db_max_url():
-    conn = sqlite3.connect(DB_PATH)
+def get_db_max_url(conn: sqlite3.Connection):
     cur = conn.cursor()
     cur.execute("SELECT MAX(URL_Number) FROM src_equipments")
     row = cur.fetchone()
-    conn.close()
     return row[0] if row and row[0] else 0
 
 
@@ -204,33 +200,43 @@ def parse_equipment_tables(equipment_info_table_list, base_url: str, url_num, no
     return equips
 
 
-def get_news_max_url():
-    """ニュース一覧ページから最大URL番号を取得"""
+def get_news_ids():
+    """ニュース一覧ページに掲載中のURL番号を取得（昇順）"""
     url = "https://ryu.sega-online.jp/news/"
     headers = {"User-Agent": "Mozilla/5.0"}
     resp = requests.get(url, headers=headers, timeout=30)
     resp.raise_for_status()
     soup = BeautifulSoup(resp.text, "html.parser")
 
-    max_id = 0
+    news_ids = set()
     for a in soup.select("ul.news__list a[href]"):
         m = re.search(r"/news/(\d+)/", a["href"])
         if m:
-            val = int(m.group(1))
-            max_id = max(max_id, val)
+            news_ids.add(int(m.group(1)))
+    return sorted(news_ids)
+
 
-    if max_id == 0:
+def get_news_max_url(news_ids=None):
+    """ニュース一覧ページから最大URL番号を取得（news_ids を渡した場合は一覧を取得しない）"""
+    if news_ids is None:
+        news_ids = get_news_ids()
+    if not news_ids:
         raise RuntimeError("ニュース一覧から最大IDを取得できませんでした")
-    return max_id
+    return news_ids[-1]
 
 
-if __name__ == "__main__":
-    init_db()
-    load_dotenv()
-    now_branch = os.getenv("NOW_BRANCH")
-    print(now_branch)
+def run(conn: sqlite3.Connection, now_branch, time_budget_sec=None, news_ids=None):
+    """
+    スクレイピング本体
+    time_budget_sec を指定した場合は経過時間が超えた時点で打ち切る
+    news_ids: 取得済みのニュース一覧（get_news_ids の結果）。省略時はここで取得する
+    戻り値: 範囲内を最後まで取得できたか（打ち切り・取得エラーがあれば False）
+    """
+    init_db(conn)
+    started = time.monotonic()
+    completed = True
 
-    news_max = get_news_max_url()
+    news_max = get_news_max_url(news_ids)
     
     # 最新から20件をスクレイピング（URL番号は作成順のため、漏れを防ぐため広めに取得）
     start = news_max - 20
@@ -243,19 +249,39 @@ if __name__ == "__main__":
     # end = get_news_max_url()
     print(f"スクレイピング範囲: {start} ～ {end}")
     for num in range(start, end + 1):
+        if time_budget_sec is not None and time.monotonic() - started > time_budget_sec:
+            print(f"時間切れのため打ち切り: {num} 以降は未処理")
+            completed = False
+            break
         url = f"https://ryu.sega-online.jp/news/{num}/"
         try:
             tables = get_equipment_tables(url)
         except Exception as e:
             print(f"エラー: {num} ({e})")
+            completed = False
             time.sleep(1)
             continue
         if len(tables) > 0:
             equips = parse_equipment_tables(tables, url, num, now_branch)
-            insert_to_db(equips)
+            insert_to_db(conn, equips)
             print(f"DB登録完了: {num}")
         else:
             print(f"空登録: {num}")
         
         time.sleep(1)
+
+    ensure_schema(conn)
     print("スクレイピング完了")
+    return completed
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    now_branch = os.getenv("NOW_BRANCH")
+    print(now_branch)
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        run(conn, now_branch)
+    finally:
+        conn.close()
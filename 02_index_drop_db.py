@@ -3,6 +3,9 @@ from __future__ import annotations
 import sqlite3
 from pathlib import Path
 
+from db_schema import ensure_schema
+from equipment_search import refresh_search_index
+
 # ==== 設定（パス事故防止：このファイルと同じ場所の ryuon_equipments.db を参照） ====
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "ryuon_equipments.db"
@@ -61,11 +64,19 @@ ORDER BY "URL_Number" ASC;
     conn.execute('ALTER TABLE "new_src_equipments" RENAME TO "src_equipments"')
 
 
+def run(conn: sqlite3.Connection) -> None:
+    rebuild_src_equipments(conn)
+    conn.commit()
+    # 未登録の新装備を検索インデックスに反映
+    refresh_search_index(conn)
+    # 再作成で消えた src_equipments のインデックスを補完
+    ensure_schema(conn)
+
+
 def main() -> None:
     conn = sqlite3.connect(str(DB_PATH))
     try:
-        rebuild_src_equipments(conn)
-        conn.commit()
+        run(conn)
     finally:
         conn.close()
 
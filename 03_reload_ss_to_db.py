@@ -8,6 +8,9 @@ from datetime import datetime, timezone, timedelta
 from pathlib import Path
 import csv
 
+from change_markers import frame_marker, stamp_table_marker
+from db_schema import ensure_schema
+
 DB_FILE = "ryuon_equipments.db"
 UNCONFIRMED_SHEET = "unconfirmed_equipments"
 JST = timezone(timedelta(hours=9))
@@ -73,6 +76,9 @@ def save_to_db(sheet_name: str, df: pd.DataFrame, conn: sqlite3.Connection):
         df = df[df["装備名"] != "装備名"]
     table_name = SHEET_TO_TABLE.get(sheet_name, sheet_name)
     df.to_sql(table_name, conn, if_exists="replace", index=False)
+    # 内容が前回と同じならマーカーは変わらない（05 で差分なし扱い）
+    stamp_table_marker(conn, table_name, frame_marker(df))
+    conn.commit()
     print(f"✅ {sheet_name} を保存しました ({len(df)}件)")
 
 
@@ -100,14 +106,12 @@ def _get_confirmed_table_names_from_db(conn: sqlite3.Connection) -> list[str]:
     return [row[0] for row in cur.fetchall()]
 
 
-def main():
+def run(conn: sqlite3.Connection):
     creds_info, spreadsheet_key = load_credentials_and_key()
     scope = ["https://www.googleapis.com/auth/spreadsheets"]
     credentials = service_account.Credentials.from_service_account_info(creds_info, scopes=scope)
     gc = gspread.authorize(credentials)
 
-    conn = sqlite3.connect(DB_FILE)
-
     # confirmed_* テーブルを DB から検出（初回は空のためフォールバックあり）
     confirmed_from_db = _get_confirmed_table_names_from_db(conn)
 
@@ -161,6 +165,7 @@ def main():
                     SELECT 装備名, レアリティ FROM ({delete_sql})
                 )
             """)
+            stamp_table_marker(conn, UNCONFIRMED_SHEET)
             conn.commit()
             print(f"🧹 DB unconfirmed_equipments から確認済み重複 {len(confirmed_in_unconfirmed)} 件を削除しました")
 
@@ -188,9 +193,17 @@ def main():
     commit_message = os.getenv("GITHUB_COMMIT_MESSAGE", "local run")
     insert_log(row_counts, target_sheets, commit_message)
 
-    conn.close()
+    ensure_schema(conn)
     print(f"🎉 全シートを {DB_FILE} に保存 & ログ更新しました")
 
 
+def main():
+    conn = sqlite3.connect(DB_FILE)
+    try:
+        run(conn)
+    finally:
+        conn.close()
+
+
 if __name__ == "__main__":
     main()
@@ -15,6 +15,9 @@ import gspread
 from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
+from change_markers import stamp_table_marker
+from db_schema import ensure_schema
+
 
 DB_PATH = "ryuon_equipments.db"
 
@@ -122,6 +125,8 @@ def upsert_unconfirmed_to_sqlite(conn: sqlite3.Connection, df: pd.DataFrame, tab
     conn.commit()
 
     df.to_sql(table_name, con=conn, if_exists="append", index=False)
+    stamp_table_marker(conn, table_name)
+    conn.commit()
 
 
 # =========================
@@ -504,43 +509,21 @@ def write_df_to_sheet(df: pd.DataFrame, spreadsheet_key: str, creds_info: dict,
         ws.update("A1", values, value_input_option="USER_ENTERED")
 
 
-# =========================
-# main（デフォルトでDB+Sheet両方に書く）
-# =========================
-def main() -> None:
-    parser = argparse.ArgumentParser(
-        description="Build unconfirmed_df and write to SQLite + Google Sheets (default)."
-    )
-    parser.add_argument("--static-dir", default="static", help="画像ディレクトリ (default: static)")
-    parser.add_argument("--no-write-db", action="store_true", help="DBへの書き込みを無効化")
-    parser.add_argument("--no-write-sheet", action="store_true", help="シートへの書き込みを無効化")
-
-    # staying_check_equipment_list を使わず明示指定したい場合
-    parser.add_argument("--sheet-name", default=None, help="書き込み先シート名（未指定なら staying_check_equipment_list から解決）")
-    parser.add_argument("--table-name", default=None, help="書き込み先テーブル名（未指定なら staying_check_equipment_list から解決）")
-
-    # 参照自動探索に失敗した時の任意override
-    parser.add_argument("--ref-weapon", default=None, help="武器参照画像パス（任意）")
-    parser.add_argument("--ref-armor", default=None, help="防具参照画像パス（任意）")
-    parser.add_argument("--ref-accessory", default=None, help="装飾参照画像パス（任意）")
-
-    args = parser.parse_args()
-
-    write_db = not args.no_write_db
-    write_sheet = not args.no_write_sheet
-    if not (write_db or write_sheet):
-        raise SystemExit("no-write-db と no-write-sheet の両方が指定されているため何もしません。")
-
-    static_dir = Path(args.static_dir)
-    conn = sqlite3.connect(DB_PATH)
-
+def run(
+    conn: sqlite3.Connection,
+    static_dir: Path = Path("static"),
+    write_db: bool = True,
+    write_sheet: bool = True,
+    sheet_name: str | None = None,
+    table_name: str | None = None,
+    ref_paths: dict[str, Path] | None = None,
+) -> None:
+    """unconfirmed_df を作成して DB / シートへ書き込む（接続は呼び出し側で管理）"""
     # 1) non_check候補
     unconfirmed_df = build_unconfirmed_candidates_df(conn)
 
     # 2) 装備種類付与
-    if args.ref_weapon and args.ref_armor and args.ref_accessory:
-        ref_paths = {"武器": Path(args.ref_weapon), "防具": Path(args.ref_armor), "装飾": Path(args.ref_accessory)}
-    else:
+    if ref_paths is None:
         ref_paths = find_reference_images(conn, static_dir)
 
     refs = build_reference_icons(ref_paths)
@@ -559,8 +542,6 @@ def main() -> None:
     unconfirmed_df = reorder_columns_for_output(unconfirmed_df)
 
     # 7) 書き込み先解決
-    sheet_name = args.sheet_name
-    table_name = args.table_name
     if sheet_name is None or table_name is None:
         default_sheet, default_table = resolve_unconfirmed_sheet_and_table()
         sheet_name = sheet_name or default_sheet
@@ -569,6 +550,7 @@ def main() -> None:
     # 8) DBへ書き込み
     if write_db:
         upsert_unconfirmed_to_sqlite(conn, unconfirmed_df, table_name=table_name)
+        ensure_schema(conn)
         print(f"[DB] wrote table='{table_name}' rows={len(unconfirmed_df)} (upsert by 装備名+レアリティ)")
 
     # 9) Sheetへ書き込み（DESIRED_COLUMNS順でフル上書き）
@@ -580,7 +562,52 @@ def main() -> None:
     print("Reference images:", {k: str(v) for k, v in ref_paths.items()})
     print("装備種類 counts:\n", unconfirmed_df["装備種類"].value_counts(dropna=False))
     print("アビリティカテゴリ null:", int(unconfirmed_df["アビリティカテゴリ"].isna().sum()))
-    conn.close()
+
+
+# =========================
+# main（デフォルトでDB+Sheet両方に書く）
+# =========================
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Build unconfirmed_df and write to SQLite + Google Sheets (default)."
+    )
+    parser.add_argument("--static-dir", default="static", help="画像ディレクトリ (default: static)")
+    parser.add_argument("--no-write-db", action="store_true", help="DBへの書き込みを無効化")
+    parser.add_argument("--no-write-sheet", action="store_true", help="シートへの書き込みを無効化")
+
+    # staying_check_equipment_list を使わず明示指定したい場合
+    parser.add_argument("--sheet-name", default=None, help="書き込み先シート名（未指定なら staying_check_equipment_list から解決）")
+    parser.add_argument("--table-name", default=None, help="書き込み先テーブル名（未指定なら staying_check_equipment_list から解決）")
+
+    # 参照自動探索に失敗した時の任意override
+    parser.add_argument("--ref-weapon", default=None, help="武器参照画像パス（任意）")
+    parser.add_argument("--ref-armor", default=None, help="防具参照画像パス（任意）")
+    parser.add_argument("--ref-accessory", default=None, help="装飾参照画像パス（任意）")
+
+    args = parser.parse_args()
+
+    write_db = not args.no_write_db
+    write_sheet = not args.no_write_sheet
+    if not (write_db or write_sheet):
+        raise SystemExit("no-write-db と no-write-sheet の両方が指定されているため何もしません。")
+
+    ref_paths = None
+    if args.ref_weapon and args.ref_armor and args.ref_accessory:
+        ref_paths = {"武器": Path(args.ref_weapon), "防具": Path(args.ref_armor), "装飾": Path(args.ref_accessory)}
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        run(
+            conn,
+            static_dir=Path(args.static_dir),
+            write_db=write_db,
+            write_sheet=write_sheet,
+            sheet_name=args.sheet_name,
+            table_name=args.table_name,
+            ref_paths=ref_paths,
+        )
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
@@ -1,81 +1,321 @@
 import sqlite3
-import pandas as pd
+
+from ability_evaluator import refresh_ability_parsed
+from change_markers import get_table_markers
+from db_schema import ensure_schema
+from equipment_search import refresh_search_index
 
 DB_FILE = "ryuon_equipments.db"
 EQUIP_TYPES = ["武器", "防具", "装飾"]
+MART_TABLE = "mart_equipments"
+BUILD_STATE_TABLE = "mart_build_state"
+# mart_equipments の各行がどのソーステーブル由来か（source_table, 装備名, レアリティ）
+SOURCE_KEYS_TABLE = "mart_source_keys"
+
+# mart_equipments の列定義（列名, 型）
+MART_COLUMNS = [
+    ("装備名", "TEXT"),
+    ("装備番号", "TEXT"),
+    ("装備種類", "TEXT"),
+    ("レアリティ", "TEXT"),
+    ("体力", "INTEGER"),
+    ("攻撃力", "INTEGER"),
+    ("防御力", "INTEGER"),
+    ("会心率", "REAL"),
+    ("回避率", "REAL"),
+    ("命中率", "REAL"),
+    ("アビリティ", "TEXT"),
+    ("アビリティカテゴリ", "TEXT"),
+]
+
+
+def _table_columns(conn: sqlite3.Connection, table_name: str) -> list[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+
+
+def _numeric_expr(col: str, sql_type: str) -> str:
+    """pd.to_numeric(errors="coerce") 相当のキャスト（数値化できない文字列は NULL）"""
+    return f"""CASE
+        WHEN typeof("{col}") IN ('integer', 'real') THEN CAST("{col}" AS {sql_type})
+        WHEN typeof("{col}") = 'text'
+             AND ltrim(trim("{col}"), '+-') <> ''
+             AND ltrim(trim("{col}"), '+-') NOT GLOB '*[^0-9.]*'
+            THEN CAST(trim("{col}") AS {sql_type})
+    END"""
+
+
+def _source_select(conn: sqlite3.Connection, table_name: str) -> str:
+    """
+    ソーステーブル1件分の SELECT 文（型変換込み）を作成
+    装備種類列がない or 全空の場合はテーブル名から推測
+    """
+    columns = set(_table_columns(conn, table_name))
+
+    fallback_type = None
+    if table_name != "unconfirmed_equipments":
+        has_type = "装備種類" in columns and conn.execute(
+            f"""SELECT 1 FROM "{table_name}" WHERE "装備種類" IS NOT NULL AND "装備種類" != '' LIMIT 1"""
+        ).fetchone()
+        if not has_type:
+            fallback_type = next((t for t in EQUIP_TYPES if table_name.endswith(t)), None)
+
+    select_exprs = []
+    for col, sql_type in MART_COLUMNS:
+        if col == "装備種類" and fallback_type:
+            expr = f"'{fallback_type}'"
+        elif col not in columns:
+            expr = "NULL"
+        elif sql_type == "TEXT":
+            expr = f'CAST("{col}" AS TEXT)'
+        else:
+            expr = _numeric_expr(col, sql_type)
+        select_exprs.append(f'{expr} AS "{col}"')
+
+    return f'SELECT {", ".join(select_exprs)} FROM "{table_name}"'
+
+
+def _ensure_mart_table(conn: sqlite3.Connection) -> bool:
+    """mart_equipments を用意する。列構成が違う場合は作り直す。戻り値: 作り直したか"""
+    expected = [col for col, _ in MART_COLUMNS]
+    if _table_columns(conn, MART_TABLE) == expected:
+        return False
+
+    conn.execute(f'DROP TABLE IF EXISTS "{MART_TABLE}"')
+    column_defs = ",\n".join(f'  "{col}" {sql_type}' for col, sql_type in MART_COLUMNS)
+    conn.execute(f'CREATE TABLE "{MART_TABLE}" (\n{column_defs}\n)')
+    conn.execute(f'DROP TABLE IF EXISTS "{BUILD_STATE_TABLE}"')
+    conn.execute(f'DROP TABLE IF EXISTS "{SOURCE_KEYS_TABLE}"')
+    return True
+
+
+def _ensure_source_keys_table(conn: sqlite3.Connection) -> bool:
+    """ソーステーブルごとのキー表を用意する。戻り値: 新しく作ったか（それまでの mart 行の由来は不明）"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (SOURCE_KEYS_TABLE,)
+    ).fetchone()
+    if exists:
+        return False
+    conn.execute(f'CREATE TABLE "{SOURCE_KEYS_TABLE}" (source_table TEXT, "装備名" TEXT, "レアリティ" TEXT)')
+    conn.execute(f'CREATE INDEX "idx_{SOURCE_KEYS_TABLE}_table" ON "{SOURCE_KEYS_TABLE}" (source_table)')
+    conn.execute(f'CREATE INDEX "idx_{SOURCE_KEYS_TABLE}_key" ON "{SOURCE_KEYS_TABLE}" ("装備名", "レアリティ")')
+    return True
+
+
+def _key_join(left: str, right: str) -> str:
+    return f'{left}."装備名" IS {right}."装備名" AND {left}."レアリティ" IS {right}."レアリティ"'
 
 
-def create_mart_equipments():
+def _row_match(left: str, right: str) -> str:
+    """全列が一致（NULL 同士も一致）"""
+    return " AND ".join(f'{left}."{col}" IS {right}."{col}"' for col, _ in MART_COLUMNS)
+
+
+def _load_build_state(conn: sqlite3.Connection) -> dict[str, str | None]:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{BUILD_STATE_TABLE}" (
+            source_table TEXT PRIMARY KEY,
+            marker TEXT
+        )
+        """
+    )
+    return dict(conn.execute(f'SELECT source_table, marker FROM "{BUILD_STATE_TABLE}"').fetchall())
+
+
+def create_mart_equipments(conn: sqlite3.Connection | None = None, full_refresh: bool = False):
     """
     confirmed_* テーブル（動的検出）と unconfirmed_equipments を統合して
     mart_equipments テーブルを作成する
+
+    - 統合・型変換は SQLite 内（INSERT ... SELECT / UNION ALL）で行う
+    - table_change_markers のマーカーが前回反映時から変わったテーブルだけを対象にし、
+      内容が変わった（装備名, レアリティ）の行だけを入れ替える
+      - mart の行の由来は mart_source_keys に記録し、削除側も変更・削除テーブル由来の行だけを比較する
+        （比較・削除・追加はすべて（装備名, レアリティ）のインデックス経由で、変更のないテーブルは読まない）
+    - full_refresh=True の場合はマーカーに関係なく全テーブルと mart 全体を比較する（mart を直接いじられた場合の復旧用）
+    - conn 未指定時は DB_FILE を開いて最後に閉じる
     """
-    conn = sqlite3.connect(DB_FILE)
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
 
     # confirmed_* テーブルを DB から動的に検出
     cur.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'confirmed_%' ORDER BY name"
     )
-    confirmed_tables = [row[0] for row in cur.fetchall()]
+    source_tables = [row[0] for row in cur.fetchall()]
 
-    if not confirmed_tables:
+    if not source_tables:
         print("⚠️  confirmed_* テーブルが見つかりません。処理を中断します")
-        conn.close()
+        if own_conn:
+            conn.close()
         return
 
-    all_df_list = []
-
-    for table_name in confirmed_tables:
-        print(f"Reading {table_name}...")
-        df = pd.read_sql(f'SELECT * FROM "{table_name}"', conn)
-
-        # 装備種類列がない or 全空の場合はテーブル名から推測
-        if "装備種類" not in df.columns or df["装備種類"].replace("", pd.NA).isna().all():
-            equip_type = next((t for t in EQUIP_TYPES if table_name.endswith(t)), None)
-            if equip_type:
-                df["装備種類"] = equip_type
-
-        all_df_list.append(df)
-
-    # unconfirmed_equipments を読み込み
+    # unconfirmed_equipments を追加
     cur.execute(
         "SELECT name FROM sqlite_master WHERE type='table' AND name='unconfirmed_equipments'"
     )
     if cur.fetchone():
-        print("Reading unconfirmed_equipments...")
-        df_unconfirmed = pd.read_sql("SELECT * FROM unconfirmed_equipments", conn)
-        all_df_list.append(df_unconfirmed)
+        source_tables.append("unconfirmed_equipments")
     else:
         print("⚠️  unconfirmed_equipments テーブルが見つかりません")
 
-    print("Concatenating all dataframes...")
-    master_df = pd.concat(all_df_list, ignore_index=True)
+    try:
+        cur.execute("BEGIN")
+        rebuilt = _ensure_mart_table(conn)
+        # 由来の記録がない mart は全体を比較する
+        full_scan = _ensure_source_keys_table(conn) or full_refresh
+        applied = _load_build_state(conn)
+        markers = get_table_markers(conn)
+
+        # マーカー未記録のテーブルは毎回「変更あり」扱い
+        changed_tables = [
+            t for t in source_tables
+            if full_scan or markers.get(t) is None or markers.get(t) != applied.get(t)
+        ]
+        removed_tables = [t for t in applied if t not in source_tables]
+
+        if rebuilt:
+            print("Creating mart_equipments table...")
+        if not changed_tables and not removed_tables:
+            cur.execute("ROLLBACK")
+            print("差分なし: mart_equipments は更新しませんでした")
+            refresh_search_index(conn)
+            refresh_ability_parsed(conn)
+            ensure_schema(conn)
+            if own_conn:
+                conn.close()
+            return
+
+        for table_name in changed_tables:
+            print(f"Reading {table_name}... (変更あり)")
+        for table_name in removed_tables:
+            print(f"{table_name} は削除されました")
+
+        column_list = ", ".join(f'"{col}"' for col, _ in MART_COLUMNS)
 
-    print("Normalizing data types...")
-    for col in ["体力", "攻撃力", "防御力"]:
-        if col in master_df.columns:
-            master_df[col] = pd.to_numeric(master_df[col], errors="coerce").astype("Int64")
+        # 変更テーブルの現在の行（型変換済み）。列は型なしにして値をそのまま比較する
+        cur.execute("DROP TABLE IF EXISTS temp.mart_changed_source")
+        cur.execute(f"CREATE TEMP TABLE mart_changed_source (source_table, {column_list})")
+        for table_name in changed_tables:
+            cur.execute(
+                f"INSERT INTO temp.mart_changed_source SELECT ?, * FROM ({_source_select(conn, table_name)})",
+                (table_name,),
+            )
+        cur.execute('CREATE INDEX temp.idx_mart_changed_source_key ON mart_changed_source ("装備名", "レアリティ")')
 
-    for col in ["会心率", "回避率", "命中率"]:
-        if col in master_df.columns:
-            master_df[col] = pd.to_numeric(master_df[col], errors="coerce")
+        # 変更前の行: 変更・削除テーブル由来の mart 行（full_scan 時は mart 全体）
+        if full_scan:
+            old_rows = f'"{MART_TABLE}" AS m'
+            old_params: list[str] = []
+        else:
+            old_tables = changed_tables + removed_tables
+            old_rows = f"""(
+                SELECT DISTINCT m.* FROM "{SOURCE_KEYS_TABLE}" AS k
+                JOIN "{MART_TABLE}" AS m ON {_key_join("m", "k")}
+                WHERE k.source_table IN ({", ".join("?" for _ in old_tables)})
+            ) AS m"""
+            old_params = old_tables
 
-    for col in ["装備名", "装備番号", "レアリティ", "アビリティ", "アビリティカテゴリ", "装備種類"]:
-        if col in master_df.columns:
-            master_df[col] = master_df[col].astype(str).replace("nan", None)
+        # 内容が変わった装備のキー
+        # - 変更テーブルにあって mart にない行（追加・更新）
+        # - 変更・削除テーブル由来の mart 行で、変更テーブルにない行（削除・更新前の値）
+        #   別のテーブルにも同じキーがある場合は余分に入れ替わるだけで、結果は変わらない
+        cur.execute("DROP TABLE IF EXISTS temp.mart_changed_keys")
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE mart_changed_keys AS
+            SELECT s."装備名", s."レアリティ" FROM temp.mart_changed_source AS s
+            WHERE NOT EXISTS (SELECT 1 FROM "{MART_TABLE}" AS m WHERE {_row_match("m", "s")})
+            UNION
+            SELECT m."装備名", m."レアリティ" FROM {old_rows}
+            WHERE NOT EXISTS (SELECT 1 FROM temp.mart_changed_source AS s WHERE {_row_match("s", "m")})
+            """,
+            old_params,
+        )
+        changed_keys = cur.execute("SELECT COUNT(*) FROM temp.mart_changed_keys").fetchone()[0]
 
-    print("Creating mart_equipments table...")
-    cur.execute("DROP TABLE IF EXISTS mart_equipments")
-    master_df.to_sql("mart_equipments", conn, if_exists="replace", index=False)
+        # 由来の記録を変更テーブルの現在の行で置き換える
+        if full_scan:
+            cur.execute(f'DELETE FROM "{SOURCE_KEYS_TABLE}"')
+        else:
+            cur.executemany(
+                f'DELETE FROM "{SOURCE_KEYS_TABLE}" WHERE source_table = ?',
+                [(t,) for t in changed_tables + removed_tables],
+            )
+        cur.execute(
+            f"""
+            INSERT INTO "{SOURCE_KEYS_TABLE}" (source_table, "装備名", "レアリティ")
+            SELECT source_table, "装備名", "レアリティ" FROM temp.mart_changed_source
+            """
+        )
 
-    count = cur.execute("SELECT COUNT(*) FROM mart_equipments").fetchone()[0]
-    print(f"✓ mart_equipments に {count} 件のレコードを作成しました")
+        # 変わったキーを持つ変更なしテーブル（同じキーが複数テーブルにある場合）も入れ直しの対象にする
+        other_tables = {
+            row[0]
+            for row in cur.execute(
+                f"""
+                SELECT DISTINCT k.source_table FROM temp.mart_changed_keys AS c
+                JOIN "{SOURCE_KEYS_TABLE}" AS k ON {_key_join("k", "c")}
+                """
+            )
+        } - set(changed_tables)
 
-    for row in cur.execute("SELECT 装備種類, COUNT(*) FROM mart_equipments GROUP BY 装備種類"):
+        cur.execute(
+            f"""
+            DELETE FROM "{MART_TABLE}" WHERE rowid IN (
+                SELECT m.rowid FROM temp.mart_changed_keys AS c
+                JOIN "{MART_TABLE}" AS m ON {_key_join("m", "c")}
+            )
+            """
+        )
+        deleted = cur.rowcount
+        insert_sources = [f"SELECT {column_list} FROM temp.mart_changed_source"]
+        insert_sources += [_source_select(conn, t) for t in source_tables if t in other_tables]
+        cur.execute(
+            f"""
+            INSERT INTO "{MART_TABLE}" ({column_list})
+            SELECT {column_list} FROM ({" UNION ALL ".join(insert_sources)}) AS s
+            WHERE EXISTS (SELECT 1 FROM temp.mart_changed_keys AS c WHERE {_key_join("c", "s")})
+            """
+        )
+        inserted = cur.rowcount
+
+        cur.executemany(
+            f"""
+            INSERT INTO "{BUILD_STATE_TABLE}" (source_table, marker) VALUES (?, ?)
+            ON CONFLICT(source_table) DO UPDATE SET marker = excluded.marker
+            """,
+            [(t, markers.get(t)) for t in changed_tables],
+        )
+        cur.executemany(
+            f'DELETE FROM "{BUILD_STATE_TABLE}" WHERE source_table = ?',
+            [(t,) for t in removed_tables],
+        )
+        cur.execute("DROP TABLE temp.mart_changed_source")
+        cur.execute("DROP TABLE temp.mart_changed_keys")
+        cur.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            cur.execute("ROLLBACK")
+        if own_conn:
+            conn.close()
+        raise
+
+    print(f"✓ 変更装備 {changed_keys} 件（削除 {deleted} 行 / 追加 {inserted} 行）を反映しました")
+
+    count = cur.execute(f'SELECT COUNT(*) FROM "{MART_TABLE}"').fetchone()[0]
+    print(f"✓ mart_equipments は {count} 件です")
+
+    for row in cur.execute(f'SELECT 装備種類, COUNT(*) FROM "{MART_TABLE}" GROUP BY 装備種類'):
         print(f"  - {row[0]}: {row[1]}件")
 
-    conn.close()
+    refresh_search_index(conn)
+    refresh_ability_parsed(conn)
+    ensure_schema(conn)
+    if own_conn:
+        conn.close()
     print("\nmart_equipments 作成完了!")
 
 
@@ -12,11 +12,12 @@ JST = timezone(timedelta(hours=9))
 FIXED_TABLES = ["mst_ability_category", "unconfirmed_equipments"]
 
 
-def fetch_counts() -> dict[str, int]:
-    if not DB_PATH.exists():
-        raise FileNotFoundError(f"{DB_PATH} が見つかりません")
-
-    conn = sqlite3.connect(DB_PATH)
+def fetch_counts(conn: sqlite3.Connection | None = None) -> dict[str, int]:
+    own_conn = conn is None
+    if own_conn:
+        if not DB_PATH.exists():
+            raise FileNotFoundError(f"{DB_PATH} が見つかりません")
+        conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
         # confirmed_* テーブルを動的に検出 + 固定テーブルを追加
@@ -32,7 +33,8 @@ def fetch_counts() -> dict[str, int]:
             counts[table_name] = int(row[0]) if row else 0
         return counts
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 def load_rows() -> list[dict[str, str]]:
@@ -100,8 +102,8 @@ def update_csv_if_needed(counts: dict[str, int]) -> bool:
     return True
 
 
-def main() -> None:
-    counts = fetch_counts()
+def main(conn: sqlite3.Connection | None = None) -> None:
+    counts = fetch_counts(conn)
     update_csv_if_needed(counts)
 
 
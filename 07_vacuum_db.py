@@ -5,11 +5,13 @@
 import sqlite3
 from pathlib import Path
 
+from db_schema import ensure_schema
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "ryuon_equipments.db"
 
 
-def vacuum_database():
+def vacuum_database(conn: sqlite3.Connection | None = None):
     """
     データベースをVACUUMして最適化する
     - 未使用の領域を解放
@@ -17,14 +19,22 @@ def vacuum_database():
     - インデックスを再構築
     """
     print("Database VACUUM開始...")
-    conn = sqlite3.connect(str(DB_PATH))
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(str(DB_PATH))
+    isolation_level = conn.isolation_level
     try:
+        # インデックス補完・統計情報更新を済ませてからVACUUM
+        ensure_schema(conn)
         # VACUUMはトランザクション外で実行する必要がある
+        conn.commit()
         conn.isolation_level = None
         conn.execute("VACUUM")
         print("✓ Database VACUUMが完了しました")
     finally:
-        conn.close()
+        conn.isolation_level = isolation_level
+        if own_conn:
+            conn.close()
 
 
 if __name__ == "__main__":
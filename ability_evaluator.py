@@ -2,18 +2,44 @@
 アビリティ評価モジュール
 アビリティの発動条件・カテゴリ重要度・効果量スコアから総合評価を計算
 """
+import csv
+import hashlib
+import io
+import json
 import re
 import sqlite3
+import threading
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
+
 DB_FILE = "ryuon_equipments.db"
 CATEGORY_SETTINGS_FILE = Path("config/ability_category_settings.csv")
 LEGACY_CATEGORY_SETTINGS_FILE = Path("mock_評価/ability_category_settings.csv")
 DEFAULT_CATEGORY_IMPORTANCE = 60.0
 DEFAULT_CATEGORY_EFFECT_WEIGHT = 1.0
 
-_CATEGORY_SETTINGS_CACHE = None
+# evaluate_ability の戻り値のキー（evaluate_abilities の列）
+ABILITY_RESULT_COLUMNS = [
+    "score",
+    "importance",
+    "condition_rate",
+    "condition_text",
+    "effect_score",
+    "effect_value",
+    "min_effect_value",
+    "max_effect_value",
+    "representative_category",
+    "categories",
+    "category_breakdown",
+    "rarity",
+    "effect_weight",
+    "effect_rank",
+]
 
 
 def _to_float_or_none(value) -> Optional[float]:
@@ -36,7 +62,41 @@ def _to_float_or_none(value) -> Optional[float]:
         return None
 
 
-def _load_category_settings() -> Dict[str, Dict[str, float]]:
+class CategorySettings:
+    """
+    カテゴリ設定CSVのスナップショット（作成後は変更しない。CSV が変わったら別のスナップショットに差し替える）
+    - version: CSV 内容の sha256 先頭16桁（ファイルがなければ "default"）。スコアのキャッシュキーに使う
+    - stamp: 読み込み時のファイルの (パス, 更新日時ns, サイズ)
+    """
+    __slots__ = ("version", "stamp", "settings")
+
+    def __init__(self, settings: Dict[str, Dict[str, Optional[float]]], version: str, stamp: Optional[Tuple]):
+        object.__setattr__(self, "settings", MappingProxyType({k: MappingProxyType(dict(v)) for k, v in settings.items()}))
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "stamp", stamp)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CategorySettings は変更できません")
+
+    def __repr__(self) -> str:
+        return f"CategorySettings(version={self.version!r}, categories={len(self.settings)})"
+
+    def importance(self, category: str) -> float:
+        """カテゴリ重要度（CSV設定 > 既定値）"""
+        value = self.settings.get(category, {}).get("importance")
+        return DEFAULT_CATEGORY_IMPORTANCE if value is None else value
+
+    def effect_weight(self, category: str) -> float:
+        """カテゴリ効果係数（CSV設定 > 既定値）"""
+        value = self.settings.get(category, {}).get("effect_weight")
+        return DEFAULT_CATEGORY_EFFECT_WEIGHT if value is None else value
+
+
+_SETTINGS_LOCK = threading.Lock()
+_SETTINGS_SNAPSHOT: Optional[CategorySettings] = None
+
+
+def _parse_category_settings(content: bytes) -> Dict[str, Dict[str, Optional[float]]]:
     """
     カテゴリ設定CSVを読み込む
 
@@ -45,82 +105,237 @@ def _load_category_settings() -> Dict[str, Dict[str, float]]:
     - 重要度 / importance
     - 効果係数 / effect_weight
     """
-    global _CATEGORY_SETTINGS_CACHE
-
-    if _CATEGORY_SETTINGS_CACHE is not None:
-        return _CATEGORY_SETTINGS_CACHE
-
-    settings: Dict[str, Dict[str, float]] = {}
+    settings: Dict[str, Dict[str, Optional[float]]] = {}
+    reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig"), newline=""))
+    for row in reader:
+        category = (row.get("カテゴリ") or row.get("category") or "").strip()
+        if not category:
+            continue
 
-    settings_file = CATEGORY_SETTINGS_FILE if CATEGORY_SETTINGS_FILE.exists() else LEGACY_CATEGORY_SETTINGS_FILE
+        importance = _to_float_or_none(row.get("重要度") or row.get("importance"))
+        effect_weight = _to_float_or_none(row.get("効果係数") or row.get("effect_weight"))
 
-    if not settings_file.exists():
-        _CATEGORY_SETTINGS_CACHE = settings
-        return settings
+        settings[category] = {
+            "importance": importance,
+            "effect_weight": effect_weight
+        }
+    return settings
 
-    import csv
 
-    with settings_file.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            category = (row.get("カテゴリ") or row.get("category") or "").strip()
-            if not category:
-                continue
+def _file_stamp(path: Path) -> Optional[Tuple[str, int, int]]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return str(path), stat.st_mtime_ns, stat.st_size
 
-            importance = _to_float_or_none(row.get("重要度") or row.get("importance"))
-            effect_weight = _to_float_or_none(row.get("効果係数") or row.get("effect_weight"))
 
-            settings[category] = {
-                "importance": importance,
-                "effect_weight": effect_weight
-            }
+def category_settings() -> CategorySettings:
+    """
+    現在のカテゴリ設定スナップショット
+    - CSV の更新日時・サイズが前回と同じなら stat だけで返す
+    - 変わっていたら読み直して差し替える（内容が同じなら version はそのまま）
+    - 差し替えはロック内で1回だけ行い、読み手は参照を1回取るだけ（Streamlit の複数セッションから呼んでよい）
+    """
+    global _SETTINGS_SNAPSHOT
 
-    _CATEGORY_SETTINGS_CACHE = settings
-    return settings
+    settings_file = CATEGORY_SETTINGS_FILE if CATEGORY_SETTINGS_FILE.exists() else LEGACY_CATEGORY_SETTINGS_FILE
+    stamp = _file_stamp(settings_file)
+    snapshot = _SETTINGS_SNAPSHOT
+    if snapshot is not None and snapshot.stamp == stamp:
+        return snapshot
+
+    with _SETTINGS_LOCK:
+        snapshot = _SETTINGS_SNAPSHOT
+        if snapshot is not None and snapshot.stamp == stamp:
+            return snapshot
+        try:
+            content = settings_file.read_bytes() if stamp is not None else None
+        except FileNotFoundError:
+            content = None
+        version = hashlib.sha256(content).hexdigest()[:16] if content is not None else "default"
+        if snapshot is not None and snapshot.version == version:
+            snapshot = CategorySettings(snapshot.settings, version, stamp)
+        else:
+            snapshot = CategorySettings(_parse_category_settings(content) if content is not None else {}, version, stamp)
+        _SETTINGS_SNAPSHOT = snapshot
+    return snapshot
+
+
+def load_category_settings_file(path: Path) -> CategorySettings:
+    """任意のカテゴリ設定CSVをスナップショットとして読む（現在の設定は差し替えない。重みの試算用）"""
+    path = Path(path)
+    content = path.read_bytes()
+    return CategorySettings(_parse_category_settings(content), hashlib.sha256(content).hexdigest()[:16], _file_stamp(path))
+
+
+def category_settings_version() -> str:
+    """カテゴリ設定のバージョン（CSV の内容が変わったときだけ変わる）"""
+    return category_settings().version
 
 
 def get_category_importance(category: str) -> float:
     """カテゴリ重要度を取得（CSV設定 > 既定値）"""
-    settings = _load_category_settings()
-    if category in settings and settings[category].get("importance") is not None:
-        return settings[category]["importance"]
-    return DEFAULT_CATEGORY_IMPORTANCE
+    return category_settings().importance(category)
 
 
 def get_category_effect_weight(category: str) -> float:
     """カテゴリ効果係数を取得（CSV設定 > 既定値）"""
-    settings = _load_category_settings()
-    if category in settings and settings[category].get("effect_weight") is not None:
-        return settings[category]["effect_weight"]
-    return DEFAULT_CATEGORY_EFFECT_WEIGHT
+    return category_settings().effect_weight(category)
+
+# =========================
+# アビリティ文の解析
+# =========================
+_WHITESPACE = re.compile(r'\s+')
+
+# 確率・数値
+_PROBABILITY_BRACKET = re.compile(r'(\d+)\[(\d+)\]%の確率')
+_PROBABILITY = re.compile(r'(\d+(?:\.\d+)?)%の確率')
+_SECONDS = re.compile(r'(\d+(?:\.\d+)?)秒間')
+_DAMAGE = re.compile(r'(\d+(?:\.\d+)?)ダメージ')
+_PERCENT = re.compile(r'(\d+(?:\.\d+)?)%')
+
+# 発動条件（数値を取り出すもの。キーワードの判定は _CONDITION_RULES）
+_HP_ABOVE = re.compile(r'(?:HP|残HP|残りHP|体力).*?(\d+)%?以上')
+_HP_BELOW = re.compile(r'(?:HP|残HP|残りHP|体力).*?(\d+)%?以下')
+_HOLDER_COUNT = re.compile(r'(\d+)(?:人|名|体)以上')
+
+# 効果量
+_PROBABILITY_TRIGGER = re.compile(r'(?:\d+(?:\.\d+)?|\d+\[\d+\])%の確率で(.*)')
+_BRACKET_PERCENT = re.compile(r'(\d+)\[(\d+)\]%')
+_COUNT_MULTIPLIER = re.compile(r'(?:人数|生存数|不在数)×(\d+(?:\.\d+)?)%')
+_ENEMY_ALIVE_EFFECT = re.compile(r'(?:敵生存数|敵生存人数|敵生存者)×.*?(\d+(?:\.\d+)?)%')
+_ALLY_ALIVE_EFFECT = re.compile(r'(?:味方生存数|味方生存人数|味方生存者)×.*?(\d+(?:\.\d+)?)%')
+_ENEMY_COUNT_MULTIPLIER = re.compile(r'敵人数×(\d+(?:\.\d+)?)%')
+_ENEMY_COUNT_EFFECT = re.compile(r'敵人数×.*?(\d+(?:\.\d+)?)%')
+_ALLY_COUNT_MULTIPLIER = re.compile(r'味方人数×(\d+(?:\.\d+)?)%')
+_ALLY_COUNT_EFFECT = re.compile(r'味方人数×.*?(\d+(?:\.\d+)?)%')
+_TRIGGER_EFFECT = re.compile(r'-?(\d+(?:\.\d+)?)%(?:上昇|減少|強化|加速|進行|回復)')
+_TRIGGER_EFFECT_ALT = re.compile(r'-?(\d+(?:\.\d+)?)%(?=.*(?:上昇|減少|強化|加速|進行|回復))')
+_HP_CONDITION_PART = re.compile(r'(?:残)?HP\d+%(?:以上|以下)')
+_COUNT_CONDITION_PART = re.compile(r'(?:敵|味方)(?:生存|不在)(?:者|人数|数)?\d*(?:人|名|体)?(?:以上|以下)')
+_EFFECT_PERCENT = re.compile(r'-?(\d+(?:\.\d+)?)%')
+_NUMBER_UP_DOWN = re.compile(r'(\d+)(?:UP|上昇|減少)', re.IGNORECASE)
+_NUMBER_UP = re.compile(r'(\d+)(?:UP|上昇)', re.IGNORECASE)
+
+# 確率トリガーの後ろにあれば効果量を持たない扱いにする語（状態異常系）
+_TRIGGER_ABNORMAL_KEYWORDS = ["状態異常", "魅了", "出血", "毒", "機能停止", "封印", "打撲", "混乱", "泥酔", "回復不可"]
+
+
+class AbilityRecord:
+    """
+    アビリティ文の解析結果（parse_ability で作成、カテゴリに依存しない特徴をまとめて保持）
+    - text: ％→%・改行除去（発動条件の判定用）
+    - compact: text から空白も除去（効果量の抽出用）
+    """
+    __slots__ = (
+        "text",
+        "compact",
+        "probability",
+        "condition_rate",
+        "condition_text",
+        "hp_above",
+        "hp_below",
+        "holder_count",
+        "seconds",
+        "damage",
+        "percent",
+        "effect_probability",
+        "bracket",
+        "count_effect",
+        "effect_blocked",
+        "generic_effect",
+        "number_up_down",
+        "number_up",
+        "status_abnormal_value",
+        "special_effect_value",
+    )
+
+    def __repr__(self) -> str:
+        return f"AbilityRecord({self.text!r}, condition_rate={self.condition_rate}, generic_effect={self.generic_effect})"
+
+
+def _group_float(pattern: re.Pattern, text: str) -> Optional[float]:
+    match = pattern.search(text)
+    return float(match.group(1)) if match else None
+
+
+def _group_int(pattern: re.Pattern, text: str) -> Optional[int]:
+    match = pattern.search(text)
+    return int(match.group(1)) if match else None
+
 
 def _extract_probability_percent(text: str) -> Optional[float]:
     """テキストから発動確率(%)を抽出"""
     normalized = text.replace('％', '%')
-    bracket_match = re.search(r'(\d+)\[(\d+)\]%の確率', normalized)
+    bracket_match = _PROBABILITY_BRACKET.search(normalized)
     if bracket_match:
         return float(max(int(bracket_match.group(1)), int(bracket_match.group(2))))
+    return _group_float(_PROBABILITY, normalized)
 
-    match = re.search(r'(\d+(?:\.\d+)?)%の確率', normalized)
-    if match:
-        return float(match.group(1))
-    return None
+
+def _extract_seconds(text: str) -> Optional[float]:
+    """テキストから秒数を抽出（例: 4秒間, 3.0秒間）"""
+    return _group_float(_SECONDS, text)
+
+
+def _extract_damage_number(text: str) -> Optional[float]:
+    """テキストからダメージ値を抽出（例: 16000ダメージ）"""
+    return _group_float(_DAMAGE, text)
+
+
+def _extract_percent_number(text: str) -> Optional[float]:
+    """テキストから%値を抽出（例: 8%）"""
+    return _group_float(_PERCENT, text.replace('％', '%'))
+
+
+def parse_ability(ability_text: Optional[str]) -> AbilityRecord:
+    """アビリティ文を1回だけ正規化して各特徴を抽出（同じ文は使い回す）"""
+    return _parse_ability(ability_text or "")
+
+
+@lru_cache(maxsize=4096)
+def _parse_ability(ability_text: str) -> AbilityRecord:
+    record = AbilityRecord()
+    text = ability_text.replace('％', '%').replace('\n', '').replace('\r', '')
+    compact = _WHITESPACE.sub('', text)
+    record.text = text
+    record.compact = compact
+
+    # 発動条件（text）
+    record.probability = _extract_probability_percent(text)
+    record.hp_above = _group_int(_HP_ABOVE, text)
+    record.hp_below = _group_int(_HP_BELOW, text)
+    record.holder_count = _group_int(_HOLDER_COUNT, text)
+    record.condition_rate = _condition_rate(record)
+    stripped = text.strip()
+    if not stripped:
+        record.condition_text = ""
+    elif "敵の人数×" in stripped:
+        record.condition_text = "敵依存"
+    else:
+        record.condition_text = "常時"
+
+    # 効果量（compact）
+    record.seconds = _extract_seconds(compact)
+    record.damage = _extract_damage_number(compact)
+    record.percent = _extract_percent_number(compact)
+    record.effect_probability = _extract_probability_percent(compact)
+    record.number_up_down = _group_int(_NUMBER_UP_DOWN, compact)
+    record.number_up = _group_int(_NUMBER_UP, compact)
+    record.status_abnormal_value = _status_abnormal_effect_value(record)
+    record.special_effect_value = _special_effect_value(record)
+    _set_generic_effect(record)
+    return record
 
 
 def extract_condition_text(ability_text: str) -> str:
     """アビリティ文から発動条件テキストを抽出（運用ルール簡易版）"""
-    text = (ability_text or "").replace('％', '%').replace('\n', '').replace('\r', '').strip()
-    if not text:
-        return ""
-
     # ルール:
     # - アビリティなし(空文字)のみ空欄
     # - 「敵の人数×」を含む場合は敵依存
     # - それ以外は常時
-    if "敵の人数×" in text:
-        return "敵依存"
-
-    return "常時"
+    return parse_ability(ability_text).condition_text
 
 
 # 発動条件の評価倍率
@@ -128,137 +343,158 @@ def evaluate_condition(ability_text: str) -> float:
     """
     発動条件倍率を評価（ユーザー指定ルール）
     """
-    text = (ability_text or "").replace('％', '%').replace('\n', '').replace('\r', '')
+    return parse_ability(ability_text).condition_rate
 
-    # 「状態異常を除く全ダメージ増加/カット」は状態異常時条件ではなく常時効果として扱う
-    if (
-        ("状態異常を除く" in text or "状態異常以外" in text)
-        and ("ダメージ増加" in text or "ダメージカット" in text)
-    ):
-        # HP/人数などの明示条件がない場合のみ常時扱い
-        if not any(x in text for x in ["時", "とき", "以上", "以下", "人数", "生存", "不在", "特性", "通常攻撃", "攻撃時", "被ダメージ"]):
-            return 1.0
 
-    # 「自身の与〜」は常時効果（能力値上昇）
-    # 例: 自身の与状態異常成功確率を14%上昇
-    if re.search(r'自身の与', text):
+# =========================
+# 発動条件のルール表
+# =========================
+def _hp_above_rate(record: AbilityRecord) -> float:
+    if record.hp_above < 50:
         return 1.0
+    if record.hp_above == 50:
+        return 0.95
+    return 0.9
+
 
+def _hp_below_rate(record: AbilityRecord) -> float:
+    if record.hp_below < 50:
+        return 0.5
+    if record.hp_below == 50:
+        return 0.55
+    return 0.6
+
+
+def _normal_attack_rate(record: AbilityRecord) -> float:
+    probability = record.probability
+    if probability and probability > 0:
+        return 1 - 1 / probability
+    return 0.9
+
+
+_STATUS_ABNORMAL_EXCLUDED = ["状態異常を除く", "状態異常以外"]
+_DAMAGE_UP_OR_CUT = ["ダメージ増加", "ダメージカット"]
+# HP/人数などの明示条件
+_EXPLICIT_CONDITION_KEYWORDS = ["時", "とき", "以上", "以下", "人数", "生存", "不在", "特性", "通常攻撃", "攻撃時", "被ダメージ"]
+_MAIN_TRAITS = ["組長", "東条会", "東城会", "街の住人", "水商売"]
+_AT_LEAST_COUNT = ["人以上", "名以上", "体以上"]
+# 明確な条件キーワード
+_CONDITION_KEYWORDS = ["時", "とき", "以上", "以下", "人数", "生存", "不在", "確率"]
+DEFAULT_CONDITION_RATE = 0.75
+
+# 発動倍率のルール（上から順に評価し、最初に当てはまったルールの倍率を使う）
+# - any_of: 各グループのキーワードをそれぞれ1つ以上含む
+# - none_of: どのキーワードも含まない
+# - followed_by: (前, 後) 前のいずれかより後ろに後のいずれかがある（正規表現の「前.*後」）
+# - prefix: 前後の空白を除いた文がこの語で始まる
+# - field: parse_ability で抽出した値（HP閾値・人数）が None でない / holder_in: 人数がこの中にある
+# - rate: 倍率（関数なら record から計算）
+_CONDITION_RULES = [
+    # 「状態異常を除く全ダメージ増加/カット」は状態異常時条件ではなく常時効果として扱う
+    # （HP/人数などの明示条件がない場合のみ）
+    {"any_of": [_STATUS_ABNORMAL_EXCLUDED, _DAMAGE_UP_OR_CUT], "none_of": _EXPLICIT_CONDITION_KEYWORDS, "rate": 1.0},
+    # 「自身の与〜」は常時効果（能力値上昇）
+    # 例: 自身の与状態異常成功確率を14%上昇
+    {"any_of": [["自身の与"]], "rate": 1.0},
     # 状態異常時（最優先）
     # 自身/自分が状態異常時: 0.5
-    if re.search(r'(自身|自分).*(状態異常時|状態異常)', text):
-        return 0.5
+    {"followed_by": (["自身", "自分"], ["状態異常"]), "rate": 0.5},
     # 敵/相手が状態異常時: 1.0
-    if re.search(r'(敵|相手).*(状態異常時|状態異常)', text):
-        return 1.0
+    {"followed_by": (["敵", "相手"], ["状態異常"]), "rate": 1.0},
     # 主語省略の状態異常時は自身扱い
-    if '状態異常時' in text:
-        return 0.5
-
+    {"any_of": [["状態異常時"]], "rate": 0.5},
     # 常時発動/開始時/ドンパチ・タイマン時
     # 「状態異常時」のような文字列内の「常時」誤検知を避ける
-    if (
-        "常時発動" in text
-        or text.strip().startswith("常時")
-        or "バトル開始" in text
-        or "ドンパチ・タイマン" in text
-    ):
-        return 1.0
-
+    {"any_of": [["常時発動", "バトル開始", "ドンパチ・タイマン"]], "rate": 1.0},
+    {"prefix": "常時", "rate": 1.0},
     # クエストクリア時
-    if "クエストクリア" in text:
-        return 1.0
-
+    {"any_of": [["クエストクリア"]], "rate": 1.0},
     # HP%以上
-    hp_above_match = re.search(r'(?:HP|残HP|残りHP|体力).*?(\d+)%?以上', text)
-    if hp_above_match:
-        hp_threshold = int(hp_above_match.group(1))
-        if hp_threshold < 50:
-            return 1.0
-        if hp_threshold == 50:
-            return 0.95
-        return 0.9
-
+    {"field": "hp_above", "rate": _hp_above_rate},
     # 特性保有者2or3人以上
-    holder_count_match = re.search(r'(\d+)(?:人|名|体)以上', text)
-    if "特性" in text and holder_count_match and int(holder_count_match.group(1)) in (2, 3):
-        main_traits = ["組長", "東条会", "東城会", "街の住人", "水商売"]
-        if any(trait in text for trait in main_traits) and "味方" in text:
-            return 0.95
-        return 0.7
-
+    {"any_of": [["特性"], _MAIN_TRAITS, ["味方"]], "holder_in": (2, 3), "rate": 0.95},
+    {"any_of": [["特性"]], "holder_in": (2, 3), "rate": 0.7},
     # 人数×条件（敵/味方、生存/不在）
-    if re.search(r'(敵|味方)(生存人数|生存数|不在人数|不在数|人数)×', text):
-        return 1.0
-
+    {"any_of": [[
+        f"{side}{count}×"
+        for side in ["敵", "味方"]
+        for count in ["生存人数", "生存数", "不在人数", "不在数", "人数"]
+    ]], "rate": 1.0},
     # 敵生存者**人以上
-    if re.search(r'敵(生存|の生存)(者|人数|数).*(?:人|名|体)以上', text):
-        return 0.8
-
+    {"followed_by": ([f"敵{alive}{unit}" for alive in ["生存", "の生存"] for unit in ["者", "人数", "数"]], _AT_LEAST_COUNT),
+     "rate": 0.8},
     # 味方生存**人以上
-    if re.search(r'味方(生存|の生存)(者|人数|数).*(?:人|名|体)以上', text):
-        return 1.0
-
+    {"followed_by": ([f"味方{alive}{unit}" for alive in ["生存", "の生存"] for unit in ["者", "人数", "数"]], _AT_LEAST_COUNT),
+     "rate": 1.0},
     # ヒートゲージ条件（条件文のみを対象）
     # 例: ヒートゲージが50%以上のとき / 残ヒートゲージ○○以下
     # ※「ヒートゲージ上昇量15%上昇」のような効果文は条件ではない
-    if re.search(r'(?:残)?ヒートゲージ.*(?:以上|以下|のとき|時)', text) or re.search(r'ヒートゲージが', text):
-        return 0.5
-
+    {"followed_by": (["ヒートゲージ"], ["以上", "以下", "のとき", "時"]), "rate": 0.5},
+    {"any_of": [["ヒートゲージが"]], "rate": 0.5},
     # HP%以下
-    hp_below_match = re.search(r'(?:HP|残HP|残りHP|体力).*?(\d+)%?以下', text)
-    if hp_below_match:
-        hp_threshold = int(hp_below_match.group(1))
-        if hp_threshold < 50:
-            return 0.5
-        if hp_threshold == 50:
-            return 0.55
-        return 0.6
-
+    {"field": "hp_below", "rate": _hp_below_rate},
     # 攻撃時
-    if "攻撃時" in text and "通常攻撃" not in text:
-        return 1.0
-
+    {"any_of": [["攻撃時"]], "none_of": ["通常攻撃"], "rate": 1.0},
     # 通常攻撃時
-    if "通常攻撃" in text:
-        probability = _extract_probability_percent(text)
-        if probability and probability > 0:
-            return 1 - 1 / probability
-        return 0.9
-
+    {"any_of": [["通常攻撃"]], "rate": _normal_attack_rate},
     # 明確な条件キーワードがない場合は常時扱い
-    if not any(x in text for x in ["時", "とき", "以上", "以下", "人数", "生存", "不在", "確率"]):
-        return 1.0
+    {"none_of": _CONDITION_KEYWORDS, "rate": 1.0},
+]
 
-    # 既定値
-    return 0.75
 
+def _alternation(words: List[str]) -> str:
+    return "(?:" + "|".join(re.escape(w) for w in words) + ")"
 
-def _extract_seconds(text: str) -> Optional[float]:
-    """テキストから秒数を抽出（例: 4秒間, 3.0秒間）"""
-    sec_match = re.search(r'(\d+(?:\.\d+)?)秒間', text)
-    if sec_match:
-        return float(sec_match.group(1))
-    return None
 
+def _compile_rule(rule: Dict) -> Tuple:
+    """
+    ルールを (必須語, 正規表現, field, holder_in, rate) に
+    - キーワード条件は先読みをつなげた1つの正規表現（文頭から match するだけで全条件を判定）
+    - 1語だけのグループがあれば、その語を str の in で先に確かめる（大半のルールはここで外れる）
+    """
+    any_of = rule.get("any_of", [])
+    followed_by = rule.get("followed_by")
+    single_groups = [group[0] for group in [*any_of, *(followed_by or ())] if len(group) == 1]
+    literal = single_groups[0] if single_groups else None
+    # in で確かめる語だけのグループは正規表現に入れない
+    parts = [f"(?=.*{_alternation(group)})" for group in any_of if group != [literal]]
+    if rule.get("none_of"):
+        parts.append(f"(?!.*{_alternation(rule['none_of'])})")
+    if followed_by:
+        before, after = followed_by
+        parts.append(f"(?=.*{_alternation(before)}.*{_alternation(after)})")
+    if rule.get("prefix"):
+        # text.strip().startswith(prefix) と同じ
+        parts.append(r"\s*" + re.escape(rule["prefix"]))
+    return (
+        literal,
+        re.compile("".join(parts)) if parts else None,
+        rule.get("field"),
+        rule.get("holder_in"),
+        rule["rate"],
+    )
 
-def _extract_damage_number(text: str) -> Optional[float]:
-    """テキストからダメージ値を抽出（例: 16000ダメージ）"""
-    dmg_match = re.search(r'(\d+(?:\.\d+)?)ダメージ', text)
-    if dmg_match:
-        return float(dmg_match.group(1))
-    return None
 
+_COMPILED_CONDITION_RULES = [_compile_rule(rule) for rule in _CONDITION_RULES]
 
-def _extract_percent_number(text: str) -> Optional[float]:
-    """テキストから%値を抽出（例: 8%）"""
-    pct_match = re.search(r'(\d+(?:\.\d+)?)%', text.replace('％', '%'))
-    if pct_match:
-        return float(pct_match.group(1))
-    return None
+
+def _condition_rate(record: AbilityRecord) -> float:
+    """ルール表を上から評価し、最初に当てはまったルールの倍率"""
+    text = record.text
+    for literal, pattern, field, holder_in, rate in _COMPILED_CONDITION_RULES:
+        if literal is not None and literal not in text:
+            continue
+        if field is not None and getattr(record, field) is None:
+            continue
+        if holder_in is not None and record.holder_count not in holder_in:
+            continue
+        if pattern is not None and pattern.match(text) is None:
+            continue
+        return rate(record) if callable(rate) else rate
+    return DEFAULT_CONDITION_RATE
 
 
-def _extract_status_abnormal_effect_value(text: str) -> Optional[float]:
+def _status_abnormal_effect_value(record: AbilityRecord) -> Optional[float]:
     """
     状態異常付与カテゴリの例外ロジック
     - 魅了/封印/混乱/麻痺/回復不可/失神: base + 5*s
@@ -267,7 +503,8 @@ def _extract_status_abnormal_effect_value(text: str) -> Optional[float]:
     - 骨折: 50 + ダメージ/1000 + 2*s
     - 拘束: 100
     """
-    duration = _extract_seconds(text) or 0.0
+    text = record.compact
+    duration = record.seconds or 0.0
 
     if "拘束" in text:
         return 100.0
@@ -285,45 +522,153 @@ def _extract_status_abnormal_effect_value(text: str) -> Optional[float]:
             return base + 5.0 * duration
 
     if "出血" in text:
-        percent = _extract_percent_number(text) or 0.0
+        percent = record.percent or 0.0
         return 90.0 + percent
 
     if "打撲" in text:
-        damage = _extract_damage_number(text) or 0.0
+        damage = record.damage or 0.0
         return 80.0 + damage / 1000.0
 
     if "骨折" in text:
-        damage = _extract_damage_number(text) or 0.0
+        damage = record.damage or 0.0
         return 50.0 + damage / 1000.0 + 2.0 * duration
 
     return None
 
 
-def _extract_special_effect_value(text: str) -> Optional[float]:
+def _special_effect_value(record: AbilityRecord) -> Optional[float]:
     """
     特殊効果付与カテゴリの例外ロジック
     - ステータス上昇阻害/クールタイム阻害: 65 + 5*s
     - その他: 100
     """
-    duration = _extract_seconds(text) or 0.0
-    if "ステータス上昇阻害" in text or "クールタイム阻害" in text:
+    duration = record.seconds or 0.0
+    if "ステータス上昇阻害" in record.compact or "クールタイム阻害" in record.compact:
         return 65.0 + 5.0 * duration
     return 100.0
 
 
+def _count_effect_value(text: str) -> Optional[float]:
+    """人数依存パターン（敵人数×5% → 25% など）の効果量"""
+    # 敵生存人数×、敵生存数×、敵不在人数×、敵不在数× 等の表記ゆれに対応
+    if "人数×" in text or "生存数×" in text or "不在数×" in text:
+        multiplier_match = _COUNT_MULTIPLIER.search(text)
+        if multiplier_match:
+            rate = float(multiplier_match.group(1))
+            # キーワードで人数を判定
+            if "敵生存人数×" in text or "敵生存数×" in text or "敵生存者×" in text:
+                return rate * 5  # 敵生存 5人
+            elif "敵不在人数×" in text or "敵不在数×" in text:
+                return rate * 4  # 敵不在 4人（5人-1人）
+            elif "味方生存人数×" in text or "味方生存数×" in text or "味方生存者×" in text:
+                return rate * 5  # 味方生存 5人
+            elif "味方不在人数×" in text or "味方不在数×" in text:
+                return rate * 4  # 味方不在 4人
+            # デフォルトは敵5人と判定
+            return rate * 5
+
+        # 敵生存数×の後ろから最初の%を抽出（敵生存数××○○を..%上昇パターン）
+        if "敵生存数×" in text or "敵生存人数×" in text:
+            rate = _group_float(_ENEMY_ALIVE_EFFECT, text)
+            if rate is not None:
+                return rate * 5  # 敵 5人
+
+        if "味方生存数×" in text or "味方生存人数×" in text:
+            rate = _group_float(_ALLY_ALIVE_EFFECT, text)
+            if rate is not None:
+                return rate * 5  # 味方 5人
+
+    # 敵人数× または 味方人数× （明示されない人数依存）
+    if "敵人数×" in text:
+        # 敵人数×と%の間に他の文字がある場合も拾う
+        rate = _group_float(_ENEMY_COUNT_MULTIPLIER, text)
+        if rate is None:
+            rate = _group_float(_ENEMY_COUNT_EFFECT, text)
+        if rate is not None:
+            return rate * 5  # 敵 5人
+    elif "味方人数×" in text:
+        rate = _group_float(_ALLY_COUNT_MULTIPLIER, text)
+        if rate is None:
+            rate = _group_float(_ALLY_COUNT_EFFECT, text)
+        if rate is not None:
+            return rate * 5  # 味方 5人
+    return None
+
+
+def _set_generic_effect(record: AbilityRecord) -> None:
+    """
+    カテゴリに依存しない効果量（extract_effect_value の 1〜4）
+    effect_blocked: 確率トリガーの後ろが状態異常系（効果量なしで確定）
+    """
+    text = record.compact
+
+    # 確率トリガーの有無を判定（例: 20%の確率で / 4[12]%の確率で）
+    # 「...%の確率で」より後ろだけを効果抽出対象にする
+    trigger_match = _PROBABILITY_TRIGGER.search(text)
+    has_probability_trigger = trigger_match is not None
+    post_trigger_text = trigger_match.group(1) if trigger_match else text
+
+    # 1. 括弧内の複数値（2[6]%）
+    # ただし確率トリガーを持つ文では、確率部分を誤抽出しないよう後段テキストのみ対象
+    bracket_match = _BRACKET_PERCENT.search(post_trigger_text)
+    record.bracket = (
+        max(float(bracket_match.group(1)), float(bracket_match.group(2))) if bracket_match else None
+    )
+    # 2. 人数依存パターン
+    record.count_effect = _count_effect_value(text)
+    record.effect_blocked = False
+    record.generic_effect = None
+
+    if record.bracket is not None:
+        record.generic_effect = record.bracket
+        return
+    if record.count_effect is not None:
+        record.generic_effect = record.count_effect
+        return
+
+    # 3. 確率トリガー系の特殊処理
+    # 「○%の確率で△%上昇(減少/進行/回復)」なら△を効果値にする
+    if has_probability_trigger:
+        # 状態異常系キーワード（カテゴリ以外でも保険的に除外）
+        if any(x in post_trigger_text for x in _TRIGGER_ABNORMAL_KEYWORDS):
+            record.effect_blocked = True
+            return
+
+        # 効果%（上昇/減少/強化/加速/進行/回復）を抽出
+        # 先に進行/加速があり、文末に%が来るなどを広く拾う
+        for pattern in (_TRIGGER_EFFECT, _TRIGGER_EFFECT_ALT):
+            value = _group_float(pattern, post_trigger_text)
+            if value is not None:
+                record.generic_effect = value
+                return
+
+    # 4. 効果部分の%を抽出（条件部分のHP%・人数条件は除外）
+    text_for_effect = post_trigger_text
+    text_for_effect = _HP_CONDITION_PART.sub('', text_for_effect)
+    text_for_effect = _COUNT_CONDITION_PART.sub('', text_for_effect)
+    record.generic_effect = _group_float(_EFFECT_PERCENT, text_for_effect)
+
+
 def calculate_effect_score(
     ability_text: str,
     category: str,
     equipment_type: str,
     equipment_name: Optional[str] = None,
     rarity: Optional[str] = None,
+    population: Optional[List[float]] = None,
+    context: Optional["EvaluationContext"] = None,
 ) -> Tuple[float, Optional[float], Optional[float], Optional[float]]:
     """
     効果量スコアを計算
     効果量スコア = 100 * (e - min_e) / (max_e - min_e)
     ※正規化母集団は装備種類×カテゴリ
+    population: 母集団の効果量（指定時はDBを参照しない）
+    context: 指定時は母集団をコンテキストから取る（DBを参照しない。population が優先）
     """
-    effect_value = extract_effect_value(ability_text, category)
+    if context is not None:
+        effect_value = context.effect_value(ability_text, category)
+    else:
+        effect_value = extract_effect_value(ability_text, category)
 
     # 例外: 神田のスーツ_SSRは e=25
     if equipment_name == "神田のスーツ" and rarity == "SSR":
@@ -332,33 +677,47 @@ def calculate_effect_score(
     if effect_value is None:
         return 0.0, None, None, None
 
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT アビリティ, アビリティカテゴリ
-        FROM mart_equipments
-                WHERE 装備種類 = ?
-                    AND アビリティ IS NOT NULL
-          AND アビリティ != ''
-          AND アビリティカテゴリ IS NOT NULL
-          AND アビリティカテゴリ != ''
-        """, (equipment_type,))
-
-    values = []
-    for ability, categories in cur.fetchall():
-        split_categories = [c.strip() for c in re.split(r'[,，＋]', categories or '') if c.strip()]
-        if category not in split_categories:
-            continue
-        val = extract_effect_value(ability, category)
-        if val is not None:
-            values.append(val)
-    conn.close()
+    if population is not None:
+        values = list(population)
+    elif context is not None:
+        values = context.effect_populations.get((equipment_type, category), [])
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT アビリティ, アビリティカテゴリ
+            FROM mart_equipments
+                    WHERE 装備種類 = ?
+                        AND アビリティ IS NOT NULL
+              AND アビリティ != ''
+              AND アビリティカテゴリ IS NOT NULL
+              AND アビリティカテゴリ != ''
+            """, (equipment_type,))
+
+        parsed = load_ability_parsed(conn)
+        values = []
+        for ability, categories in cur.fetchall():
+            split_categories = [c.strip() for c in re.split(r'[,，＋]', categories or '') if c.strip()]
+            if category not in split_categories:
+                continue
+            val = parsed_effect_value(parsed, ability, category)
+            if val is not None:
+                values.append(val)
+        conn.close()
 
     if not values:
-        return 100.0, effect_value, effect_value, effect_value
+        return _normalize_effect_value(effect_value, None, None)
+    return _normalize_effect_value(effect_value, min(values), max(values))
 
-    max_val = max(values)
-    min_val = min(values)
+
+def _normalize_effect_value(
+    effect_value: float,
+    min_val: Optional[float],
+    max_val: Optional[float],
+) -> Tuple[float, Optional[float], Optional[float], Optional[float]]:
+    """母集団の最小・最大から効果量スコアを計算（母集団が空なら min/max ともに None）"""
+    if min_val is None or max_val is None:
+        return 100.0, effect_value, effect_value, effect_value
 
     if max_val == min_val:
         return 100.0, effect_value, min_val, max_val
@@ -378,176 +737,527 @@ def extract_effect_value(ability_text: str, category: str) -> Optional[float]:
     3. 通常攻撃時の確率パターン：効果値を抽出
     4. 効果部分の%を抽出（条件部分のHP%は除外）
     5. 数値表記
+    （1〜4 はカテゴリに依存しないため parse_ability で文ごとに1回だけ計算）
     """
-    # テキストを正規化（改行・余分スペースを除去、％→%に統一）
-    text = ability_text.replace('\n', '').replace('\r', '').strip()
-    text = text.replace('％', '%')
-    # 複数スペースをまとめる
-    text = re.sub(r'\s+', '', text)
-    
+    record = parse_ability(ability_text)
+
     # 例外2: 状態異常付与カテゴリ
-    if category == "状態異常付与":
-        special_val = _extract_status_abnormal_effect_value(text)
-        if special_val is not None:
-            return special_val
+    if category == "状態異常付与" and record.status_abnormal_value is not None:
+        return record.status_abnormal_value
 
     # 例外3: 特殊効果付与カテゴリ
-    if category == "特殊効果付与":
-        special_val = _extract_special_effect_value(text)
-        if special_val is not None:
-            return special_val
+    if category == "特殊効果付与" and record.special_effect_value is not None:
+        return record.special_effect_value
 
     # 例外4: ダメージ無効化カテゴリ
     if category == "ダメージ無効化":
         # 5%の確率で無効化 -> 80 + 5
-        probability = _extract_probability_percent(text)
-        if probability is not None:
-            return 80.0 + probability
-        percent = _extract_percent_number(text)
-        if percent is not None:
-            return 80.0 + percent
+        if record.effect_probability is not None:
+            return 80.0 + record.effect_probability
+        if record.percent is not None:
+            return 80.0 + record.percent
         return 80.0
 
-    # 確率トリガーの有無を判定（例: 20%の確率で / 4[12]%の確率で）
-    has_probability_trigger = bool(re.search(r'(?:\d+(?:\.\d+)?|\d+\[\d+\])%の確率で', text))
-    post_trigger_text = text
-    if has_probability_trigger:
-        # 「...%の確率で」より後ろだけを効果抽出対象にする
-        split_match = re.search(r'(?:\d+(?:\.\d+)?|\d+\[\d+\])%の確率で(.*)', text)
-        if split_match:
-            post_trigger_text = split_match.group(1)
-
-    # 1. 括弧内の複数値（2[6]%）
-    # ただし確率トリガーを持つ文では、確率部分を誤抽出しないよう後段テキストのみ対象
-    bracket_match = re.search(r'(\d+)\[(\d+)\]%', post_trigger_text)
-    if bracket_match:
-        base_value = float(bracket_match.group(1))
-        bracket_value = float(bracket_match.group(2))
-        return max(base_value, bracket_value)
-    
-    # 2. 人数依存パターンを優先処理
-    # 敵生存人数×、敵生存数×、敵不在人数×、敵不在数× 等の表記ゆれに対応
-    if "人数×" in text or "生存数×" in text or "不在数×" in text:
-        multiplier_match = re.search(r'(?:人数|生存数|不在数)×(\d+(?:\.\d+)?)%', text)
-        if multiplier_match:
-            rate = float(multiplier_match.group(1))
-            # キーワードで人数を判定
-            if "敵生存人数×" in text or "敵生存数×" in text or "敵生存者×" in text:
-                return rate * 5  # 敵生存 5人
-            elif "敵不在人数×" in text or "敵不在数×" in text:
-                return rate * 4  # 敵不在 4人（5人-1人）
-            elif "味方生存人数×" in text or "味方生存数×" in text or "味方生存者×" in text:
-                return rate * 5  # 味方生存 5人
-            elif "味方不在人数×" in text or "味方不在数×" in text:
-                return rate * 4  # 味方不在 4人
-            # デフォルトは敵5人と判定
-            return rate * 5
-        
-        # 敵生存数×の後ろから最初の%を抽出（敵生存数××○○を..%上昇パターン）
-        if "敵生存数×" in text or "敵生存人数×" in text:
-            effect_match = re.search(r'(?:敵生存数|敵生存人数|敵生存者)×.*?(\d+(?:\.\d+)?)%', text)
-            if effect_match:
-                rate = float(effect_match.group(1))
-                return rate * 5  # 敵 5人
-        
-        if "味方生存数×" in text or "味方生存人数×" in text:
-            effect_match = re.search(r'(?:味方生存数|味方生存人数|味方生存者)×.*?(\d+(?:\.\d+)?)%', text)
-            if effect_match:
-                rate = float(effect_match.group(1))
-                return rate * 5  # 味方 5人
-    
-    # 敵人数× または 味方人数× （明示されない人数依存）
-    if "敵人数×" in text:
-        multiplier_match = re.search(r'敵人数×(\d+(?:\.\d+)?)%', text)
-        if multiplier_match:
-            rate = float(multiplier_match.group(1))
-            return rate * 5  # 敵 5人
-        # 敵人数×と%の間に他の文字がある場合
-        effect_match = re.search(r'敵人数×.*?(\d+(?:\.\d+)?)%', text)
-        if effect_match:
-            rate = float(effect_match.group(1))
-            return rate * 5
-    
-    elif "味方人数×" in text:
-        multiplier_match = re.search(r'味方人数×(\d+(?:\.\d+)?)%', text)
-        if multiplier_match:
-            rate = float(multiplier_match.group(1))
-            return rate * 5  # 味方 5人
-        # 味方人数×と%の間に他の文字がある場合
-        effect_match = re.search(r'味方人数×.*?(\d+(?:\.\d+)?)%', text)
-        if effect_match:
-            rate = float(effect_match.group(1))
-            return rate * 5
-    
-    # 3. 確率トリガー系の特殊処理
-    # 「○%の確率で△%上昇(減少/進行/回復)」なら△を効果値にする
-    if has_probability_trigger:
-        # 状態異常系キーワード（カテゴリ以外でも保険的に除外）
-        if any(x in post_trigger_text for x in ["状態異常", "魅了", "出血", "毒", "機能停止", "封印", "打撲", "混乱", "泥酔", "回復不可"]):
-            return None
-
-        # 効果%（上昇/減少/強化/加速/進行/回復）を抽出
-        effect_match = re.search(r'-?(\d+(?:\.\d+)?)%(?:上昇|減少|強化|加速|進行|回復)', post_trigger_text)
-        if effect_match:
-            return float(effect_match.group(1))
+    if record.effect_blocked:
+        return None
+    if record.generic_effect is not None:
+        return record.generic_effect
 
-        # 先に進行/加速があり、文末に%が来るなどを広く拾う
-        effect_match_alt = re.search(r'-?(\d+(?:\.\d+)?)%(?=.*(?:上昇|減少|強化|加速|進行|回復))', post_trigger_text)
-        if effect_match_alt:
-            return float(effect_match_alt.group(1))
-    
-    # 4. 効果部分の%を抽出（条件部分のHP%は除外）
-    # 複数の%がある場合は、条件部分（HP%, 人数条件）を除外してから抽出
-    
-    # 条件キーワードを一時置換
-    text_for_effect = post_trigger_text if has_probability_trigger else text
-    # 条件部分を削除
-    text_for_effect = re.sub(r'(?:残)?HP\d+%(?:以上|以下)', '', text_for_effect)
-    text_for_effect = re.sub(r'(?:敵|味方)(?:生存|不在)(?:者|人数|数)?\d*(?:人|名|体)?(?:以上|以下)', '', text_for_effect)
-    
-    # 効果部分から最初の%を抽出
-    effect_match = re.search(r'-?(\d+(?:\.\d+)?)%', text_for_effect)
-    if effect_match:
-        return float(effect_match.group(1))
-    
     # 5. 数値表記（攻撃力200UPなど）
     if category in ["攻撃力上昇", "攻撃力減少", "敵攻撃減少"]:
-        num_match = re.search(r'(\d+)(?:UP|上昇|減少)', text, re.IGNORECASE)
-        if num_match:
+        if record.number_up_down is not None:
             # 攻撃力は数値/20で%換算
-            return float(num_match.group(1)) / 20
-    
+            return float(record.number_up_down) / 20
+
     if category in ["防御力上昇", "防御力減少", "敵防御減少"]:
-        num_match = re.search(r'(\d+)(?:UP|上昇|減少)', text, re.IGNORECASE)
-        if num_match:
+        if record.number_up_down is not None:
             # 防御力は数値/20で%換算
-            return float(num_match.group(1)) / 20
-    
+            return float(record.number_up_down) / 20
+
     if category == "体力上昇":
-        num_match = re.search(r'(\d+)(?:UP|上昇)', text, re.IGNORECASE)
-        if num_match:
+        if record.number_up is not None:
             # 体力は数値のまま
-            return float(num_match.group(1))
-    
+            return float(record.number_up)
+
     return None
 
 
-def calculate_category_rarity(category: str, equipment_type: str) -> float:
+# =========================
+# 解析結果テーブル（ability_parsed）
+# =========================
+ABILITY_PARSED_TABLE = "ability_parsed"
+# 解析ロジックを変えたら上げる（古い版の行は読み込み時に無視し、次の refresh で作り直す）
+ABILITY_PARSER_VERSION = 1
+
+
+@lru_cache(maxsize=4096)
+def _text_hash(normalized_text: str) -> str:
+    return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+
+
+def ability_text_hash(ability_text: Optional[str]) -> str:
+    """ability_parsed のキー（parse_ability で正規化した文の sha256）"""
+    return _text_hash(parse_ability(ability_text).text)
+
+
+def refresh_ability_parsed(conn: sqlite3.Connection) -> Tuple[int, int]:
+    """
+    mart_equipments のアビリティ文を ability_parsed に反映（新しい文・カテゴリが増えた文・解析版が古い文だけ解析）
+    効果量は文が mart で持つカテゴリごとに JSON（{カテゴリ: 効果量}）で保持
+    戻り値: (削除行数, 追加・更新行数)
+    """
+    has_mart = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mart_equipments'"
+    ).fetchone()
+    if not has_mart:
+        return 0, 0
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{ABILITY_PARSED_TABLE}" (
+            text_hash TEXT PRIMARY KEY,
+            アビリティ TEXT NOT NULL,
+            発動確率 REAL,
+            発動倍率 REAL,
+            発動条件 TEXT,
+            効果量 TEXT NOT NULL,
+            parser_version INTEGER NOT NULL
+        )
+        """
+    )
+
+    # 正規化後の文ごとに、mart で使われているカテゴリをまとめる
+    needed: Dict[str, Tuple[str, set]] = {}
+    for ability_text, categories in conn.execute(
+        "SELECT アビリティ, アビリティカテゴリ FROM mart_equipments WHERE アビリティ IS NOT NULL AND アビリティ != ''"
+    ):
+        key = ability_text_hash(ability_text)
+        if key not in needed:
+            needed[key] = (parse_ability(ability_text).text, set())
+        needed[key][1].update(_split_categories(categories))
+
+    stored = {
+        key: (version, set(json.loads(effects)))
+        for key, version, effects in conn.execute(
+            f'SELECT text_hash, parser_version, 効果量 FROM "{ABILITY_PARSED_TABLE}"'
+        )
+    }
+
+    removed = [(key,) for key in stored if key not in needed]
+    rows = []
+    for key, (text, categories) in needed.items():
+        version, stored_categories = stored.get(key, (None, set()))
+        if version == ABILITY_PARSER_VERSION and categories <= stored_categories:
+            continue
+        record = parse_ability(text)
+        effects = {cat: extract_effect_value(text, cat) for cat in sorted(categories)}
+        rows.append((
+            key,
+            text,
+            record.probability,
+            record.condition_rate,
+            record.condition_text,
+            json.dumps(effects, ensure_ascii=False),
+            ABILITY_PARSER_VERSION,
+        ))
+
+    conn.executemany(f'DELETE FROM "{ABILITY_PARSED_TABLE}" WHERE text_hash = ?', removed)
+    conn.executemany(f'INSERT OR REPLACE INTO "{ABILITY_PARSED_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    if removed or rows:
+        print(f"✓ アビリティ解析結果更新: 削除 {len(removed)} 行 / 解析 {len(rows)} 行")
+    return len(removed), len(rows)
+
+
+def load_ability_parsed(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    """
+    ability_parsed を {text_hash: {probability, condition_rate, condition_text, effects}} で読む
+    テーブルがない場合は空（各 parsed_* 関数はその場で解析する）
+    """
+    has_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ABILITY_PARSED_TABLE,)
+    ).fetchone()
+    if not has_table:
+        return {}
+    rows = conn.execute(
+        f"""
+        SELECT text_hash, 発動確率, 発動倍率, 発動条件, 効果量
+        FROM "{ABILITY_PARSED_TABLE}"
+        WHERE parser_version = ?
+        """,
+        (ABILITY_PARSER_VERSION,),
+    ).fetchall()
+    return {
+        key: {
+            "probability": probability,
+            "condition_rate": condition_rate,
+            "condition_text": condition_text,
+            "effects": json.loads(effects),
+        }
+        for key, probability, condition_rate, condition_text, effects in rows
+    }
+
+
+def _parsed_entry(parsed: Optional[Dict[str, Dict]], ability_text: Optional[str]) -> Optional[Dict]:
+    if not parsed or not isinstance(ability_text, str):
+        return None
+    return parsed.get(ability_text_hash(ability_text))
+
+
+def parsed_effect_value(parsed: Optional[Dict[str, Dict]], ability_text: str, category: str) -> Optional[float]:
+    """extract_effect_value と同じ値（ability_parsed にあればそれを使う）"""
+    entry = _parsed_entry(parsed, ability_text)
+    if entry is not None and category in entry["effects"]:
+        return entry["effects"][category]
+    return extract_effect_value(ability_text, category)
+
+
+def parsed_condition(parsed: Optional[Dict[str, Dict]], ability_text: str) -> Tuple[float, str]:
+    """(evaluate_condition, extract_condition_text) と同じ値（ability_parsed にあればそれを使う）"""
+    entry = _parsed_entry(parsed, ability_text)
+    if entry is not None:
+        return entry["condition_rate"], entry["condition_text"]
+    return evaluate_condition(ability_text), extract_condition_text(ability_text)
+
+
+def parsed_probability(parsed: Optional[Dict[str, Dict]], ability_text: Optional[str]) -> Optional[float]:
+    """アビリティ文の発動確率(%)（ability_parsed にあればそれを使う）。文でなければ None"""
+    if not isinstance(ability_text, str):
+        return None
+    entry = _parsed_entry(parsed, ability_text)
+    if entry is not None:
+        return entry["probability"]
+    return parse_ability(ability_text).probability
+
+
+# =========================
+# SQL 関数
+# =========================
+def _sql_effect_value(ability_text, category) -> Optional[float]:
+    if not isinstance(ability_text, str) or not isinstance(category, str):
+        return None
+    return extract_effect_value(ability_text, category)
+
+
+def _sql_condition_rate(ability_text) -> Optional[float]:
+    return evaluate_condition(ability_text) if isinstance(ability_text, str) else None
+
+
+def _sql_condition_text(ability_text) -> Optional[str]:
+    return extract_condition_text(ability_text) if isinstance(ability_text, str) else None
+
+
+def _sql_probability(ability_text) -> Optional[float]:
+    return parse_ability(ability_text).probability if isinstance(ability_text, str) else None
+
+
+# SQL 関数名 -> (引数の数, 関数)。引数が文字列でなければ NULL を返す
+ABILITY_SQL_FUNCTIONS = {
+    "ability_effect_value": (2, _sql_effect_value),
+    "ability_condition_rate": (1, _sql_condition_rate),
+    "ability_condition_text": (1, _sql_condition_text),
+    "ability_probability": (1, _sql_probability),
+}
+
+
+def register_sql_functions(conn: sqlite3.Connection) -> None:
+    """
+    アビリティ解析を SQL 関数として接続に登録（オプトイン。登録した接続の中でだけ使える）
+    - ability_effect_value(アビリティ, カテゴリ) / ability_condition_rate(アビリティ)
+      ability_condition_text(アビリティ) / ability_probability(アビリティ)
+    - 値は extract_effect_value / evaluate_condition / extract_condition_text / 発動確率(%) と同じ
+    - deterministic=True で登録するので WHERE / ORDER BY のほか式インデックスにも使える
+      式インデックスを作ったテーブルは関数を登録していない接続（sqlite3 CLI など）から更新できなくなるため、
+      共有する DB ファイルには作らず、分析用のコピーや TEMP テーブルに作る
+    """
+    for name, (num_params, func) in ABILITY_SQL_FUNCTIONS.items():
+        conn.create_function(name, num_params, func, deterministic=True)
+
+
+# =========================
+# 評価コンテキスト
+# =========================
+def _none_if_na(value):
+    return None if not isinstance(value, str) and pd.isna(value) else value
+
+
+# ステータス順位の比較母集団を作る列
+RANKING_STATUS_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "回避率", "命中率"]
+
+
+def _combo_scores(values1: np.ndarray, values2: np.ndarray, bounds: tuple) -> np.ndarray:
+    """2ステータスを母集団の min-max で 0〜100 にして平均（calculate_build_type_combination_rankings と同じ式）"""
+    min1, max1, min2, max2 = bounds
+    s1 = np.full(len(values1), 100.0) if max1 == min1 else 100.0 * (values1 - min1) / (max1 - min1)
+    s2 = np.full(len(values2), 100.0) if max2 == min2 else 100.0 * (values2 - min2) / (max2 - min2)
+    return (s1 + s2) / 2
+
+
+def _with_value(values: np.ndarray, value: float) -> np.ndarray:
+    return np.insert(values, np.searchsorted(values, value), value)
+
+
+def _count_greater(sorted_values: np.ndarray, value: float) -> int:
+    return len(sorted_values) - int(np.searchsorted(sorted_values, value, side="right"))
+
+
+def _build_ranking_populations(mart: pd.DataFrame) -> Dict[str, Dict]:
+    """
+    ステータス順位の比較母集団ごとの昇順配列（generate_equipment_evaluation の SQL と同じ条件）
+    - status: (装備種類, レアリティ, ステータス) -> 昇順配列（同装備種類のみで比較するステータスはレアリティ None）
+    - combos: (装備種類, レアリティ, ステータス1, ステータス2) -> {"values", "bounds", "combo"}
+    """
+    from generate_equipment_evaluation import RARITY_BASED_STATS
+
+    mart = mart[["装備種類", "レアリティ", *RANKING_STATUS_COLUMNS]]
+    mart = mart[mart["装備種類"].notna()].copy()
+    for col in RANKING_STATUS_COLUMNS:
+        mart[col] = pd.to_numeric(mart[col], errors="coerce")
+
+    status = {}
+    for col in RANKING_STATUS_COLUMNS:
+        keys = ["装備種類", "レアリティ"] if col in RARITY_BASED_STATS else ["装備種類"]
+        positive = mart[mart[col] > 0]
+        for key, group in positive.groupby(keys):
+            key = key if isinstance(key, tuple) else (key,)
+            if len(key) == 1:
+                key = (key[0], None)
+            status[(*key, col)] = np.sort(group[col].to_numpy(dtype=float))
+
+    combos = {}
+    for (equip_type, rarity), group in mart[mart["レアリティ"].notna()].groupby(["装備種類", "レアリティ"]):
+        for i, col1 in enumerate(RANKING_STATUS_COLUMNS):
+            for col2 in RANKING_STATUS_COLUMNS[i + 1:]:
+                both = group[(group[col1] > 0) & (group[col2] > 0)]
+                if both.empty:
+                    continue
+                values1 = both[col1].to_numpy(dtype=float)
+                values2 = both[col2].to_numpy(dtype=float)
+                bounds = (values1.min(), values1.max(), values2.min(), values2.max())
+                entry = {"values": (values1, values2), "bounds": bounds}
+                entry["combo"] = np.sort(_combo_scores(values1, values2, bounds))
+                # 組み合わせは列順どちら向きでも引けるようにする
+                combos[(equip_type, rarity, col1, col2)] = entry
+                combos[(equip_type, rarity, col2, col1)] = {
+                    "values": (values2, values1),
+                    "bounds": (bounds[2], bounds[3], bounds[0], bounds[1]),
+                    "combo": entry["combo"],
+                }
+    return {"status": status, "combos": combos}
+
+
+class EvaluationContext:
+    """
+    評価に使う mart_equipments のスナップショット（作成時に1回だけ集計し、評価中は SQL を発行しない）
+    - mart: mart_equipments の DataFrame（列 装備種類, アビリティ, アビリティカテゴリ があればよい。任意の DataFrame でも作れる）
+    - parsed: ability_parsed の内容（ない文はその場で解析）
+    - settings: カテゴリ設定のスナップショット
+    - 集計は各 calculate_* 関数の SQL と同じ条件（装備種類が NULL の行は含めない）
+      - category_counts: (装備種類, アビリティカテゴリ) -> 件数（calculate_category_rarity）
+      - category_effects: (装備種類, アビリティカテゴリ) -> 効果量（calculate_effect_rank、カテゴリ文字列の完全一致）
+      - effect_populations: (装備種類, カテゴリ) -> 効果量（calculate_effect_score、複数カテゴリは分割）
+    - ステータス順位（status_rankings / build_type_rankings）の母集団は初回呼び出し時に作る
+    """
+    __slots__ = (
+        "mart", "parsed", "settings", "category_counts", "category_effects", "effect_populations", "_ranking_populations",
+    )
+
+    def __init__(
+        self,
+        mart: pd.DataFrame,
+        parsed: Optional[Dict[str, Dict]] = None,
+        settings: Optional[CategorySettings] = None,
+    ):
+        self.mart = mart
+        self.parsed = parsed or {}
+        self.settings = settings if settings is not None else category_settings()
+        self.category_counts: Dict[Tuple[str, str], int] = {}
+        self.category_effects: Dict[Tuple[str, str], List[float]] = {}
+        self.effect_populations: Dict[Tuple[str, str], List[float]] = {}
+        self._ranking_populations: Optional[Dict[str, Dict]] = None
+
+        rows = mart[["装備種類", "アビリティ", "アビリティカテゴリ"]].itertuples(index=False)
+        for equipment_type, ability, categories in rows:
+            equipment_type, ability, categories = _none_if_na(equipment_type), _none_if_na(ability), _none_if_na(categories)
+            if equipment_type is None or categories is None:
+                continue
+            key = (equipment_type, categories)
+            self.category_counts[key] = self.category_counts.get(key, 0) + 1
+            if ability is None:
+                continue
+            value = parsed_effect_value(self.parsed, ability, categories)
+            if value is not None:
+                self.category_effects.setdefault(key, []).append(value)
+            if ability == "" or categories == "":
+                continue
+            for cat in _split_categories(categories):
+                value = parsed_effect_value(self.parsed, ability, cat)
+                if value is not None:
+                    self.effect_populations.setdefault((equipment_type, cat), []).append(value)
+
+    def __repr__(self) -> str:
+        return f"EvaluationContext(rows={len(self.mart)}, settings={self.settings.version!r})"
+
+    def effect_value(self, ability_text: str, category: str) -> Optional[float]:
+        return parsed_effect_value(self.parsed, ability_text, category)
+
+    def condition(self, ability_text: str) -> Tuple[float, str]:
+        return parsed_condition(self.parsed, ability_text)
+
+    def effect_range(self, equipment_type: str, category: str) -> Tuple[Optional[float], Optional[float]]:
+        """効果量スコアの母集団の (最小, 最大)。母集団が空なら (None, None)"""
+        values = self.effect_populations.get((equipment_type, category))
+        if not values:
+            return None, None
+        return min(values), max(values)
+
+    def ranking_populations(self) -> Dict[str, Dict]:
+        if self._ranking_populations is None:
+            self._ranking_populations = _build_ranking_populations(self.mart)
+        return self._ranking_populations
+
+    def status_rankings(self, equipment: Dict, include_self: bool = False) -> Dict:
+        """
+        calculate_status_rankings と同じ内容（DB を参照しない）
+        include_self: 装備を母集団に加えて評価する（mart にまだない装備の仮評価用）
+        """
+        from generate_equipment_evaluation import RARITY_BASED_STATS, STATUS_COLUMNS
+
+        populations = self.ranking_populations()["status"]
+        equipment_type = equipment["装備種類"]
+        rarity = equipment.get("レアリティ")
+        rankings = {}
+        for status in STATUS_COLUMNS.get(equipment_type, []):
+            current_value = equipment.get(status)
+            if pd.isna(current_value) or current_value is None or current_value == 0:
+                continue
+            try:
+                current_value = float(current_value)
+            except (ValueError, TypeError):
+                continue
+
+            group_rarity = rarity if status in RARITY_BASED_STATS else None
+            values = populations.get((equipment_type, group_rarity, status), np.array([]))
+            if include_self and current_value > 0:
+                values = _with_value(values, current_value)
+            if len(values) == 0:
+                continue
+
+            max_value = values[-1]
+            min_value = values[0]
+            if max_value == min_value:
+                score = 100.0
+            else:
+                score = 100.0 * (current_value - min_value) / (max_value - min_value)
+            rankings[status] = {
+                "rank": _count_greater(values, current_value) + 1,
+                "total": len(values),
+                "diff": max_value - current_value,
+                "value": current_value,
+                "max": max_value,
+                "min": min_value,
+                "score": score,
+            }
+        return rankings
+
+    def build_type_rankings(self, equipment: Dict, include_self: bool = False) -> Dict:
+        """
+        calculate_build_type_combination_rankings と同じ内容（DB を参照しない）
+        include_self: 装備を母集団に加えて評価する（mart にまだない装備の仮評価用）
+        """
+        from generate_equipment_evaluation import BUILD_TYPE_DISPLAY, build_type_pairs
+
+        populations = self.ranking_populations()["combos"]
+        equipment_type = equipment.get("装備種類")
+        rarity = equipment.get("レアリティ")
+        combination_rankings = {}
+        if not equipment_type or not rarity:
+            return combination_rankings
+
+        for build_type, pairs in build_type_pairs(equipment).items():
+            for status1, status2 in pairs:
+                entry = populations.get((equipment_type, rarity, status1, status2))
+                try:
+                    current1 = float(equipment.get(status1, 0) or 0)
+                    current2 = float(equipment.get(status2, 0) or 0)
+                except (ValueError, TypeError):
+                    continue
+                joins = include_self and current1 > 0 and current2 > 0
+                if entry is None and not joins:
+                    continue
+
+                if entry is None:
+                    bounds = (current1, current1, current2, current2)
+                    combo = np.array([])
+                else:
+                    bounds = entry["bounds"]
+                    combo = entry["combo"]
+                if joins and not (bounds[0] <= current1 <= bounds[1] and bounds[2] <= current2 <= bounds[3]):
+                    # 自分が母集団の最小・最大を更新する場合は組み合わせスコアを計算し直す
+                    values1, values2 = entry["values"] if entry is not None else (np.array([]), np.array([]))
+                    values1 = np.append(values1, current1)
+                    values2 = np.append(values2, current2)
+                    bounds = (values1.min(), values1.max(), values2.min(), values2.max())
+                    combo = np.sort(_combo_scores(values1, values2, bounds))
+                    joins = False
+
+                min1, max1, min2, max2 = bounds
+                score1 = 100.0 if max1 == min1 else 100.0 * (current1 - min1) / (max1 - min1)
+                score2 = 100.0 if max2 == min2 else 100.0 * (current2 - min2) / (max2 - min2)
+                combo_score = (score1 + score2) / 2
+                if joins:
+                    combo = _with_value(combo, combo_score)
+
+                combination_rankings[f"{build_type}:{status1}・{status2}"] = {
+                    "rank": _count_greater(combo, combo_score) + 1,
+                    "total": len(combo),
+                    "diff": float(combo[-1] - combo_score),
+                    "value": float(current1 + current2),
+                    "score": float(combo_score),
+                    "statuses": [status1, status2],
+                    "build_type": build_type,
+                    "build_type_display": BUILD_TYPE_DISPLAY[build_type],
+                    "combo_name": f"{status1}・{status2}",
+                }
+        return combination_rankings
+
+
+def load_evaluation_context(
+    conn: Optional[sqlite3.Connection] = None,
+    settings: Optional[CategorySettings] = None,
+) -> EvaluationContext:
+    """mart_equipments と ability_parsed を1回読んで EvaluationContext を作る（conn 省略時は DB_FILE）"""
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
+    try:
+        mart = pd.read_sql("SELECT * FROM mart_equipments", conn)
+        parsed = load_ability_parsed(conn)
+    finally:
+        if own_conn:
+            conn.close()
+    return EvaluationContext(mart, parsed, settings)
+
+
+def calculate_category_rarity(category: str, equipment_type: str, context: Optional[EvaluationContext] = None) -> float:
     """
     カテゴリの希少性を計算（0~100）
     同じ装備種類内で、同じカテゴリを持つ装備が少ないほど高得点
+    context: 指定時は DB を参照しない
     """
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    
-    # 同じ装備種類内で同じカテゴリの装備数を取得
-    cur.execute("""
-        SELECT COUNT(*) 
-        FROM mart_equipments 
-        WHERE アビリティカテゴリ = ? AND 装備種類 = ?
-    """, (category, equipment_type))
-    count = cur.fetchone()[0]
-    conn.close()
+    if context is not None:
+        count = context.category_counts.get((equipment_type, category), 0)
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        cur = conn.cursor()
+
+        # 同じ装備種類内で同じカテゴリの装備数を取得
+        cur.execute("""
+            SELECT COUNT(*) 
+            FROM mart_equipments 
+            WHERE アビリティカテゴリ = ? AND 装備種類 = ?
+        """, (category, equipment_type))
+        count = cur.fetchone()[0]
+        conn.close()
     
     # 装備数が少ないほど高得点（最大100点）
     # 1個: 100点、10個: 50点、50個以上: 0点
@@ -561,31 +1271,40 @@ def calculate_category_rarity(category: str, equipment_type: str) -> float:
         return 0
 
 
-def calculate_effect_rank(ability_text: str, category: str, equipment_type: str) -> float:
+def calculate_effect_rank(
+    ability_text: str, category: str, equipment_type: str, context: Optional[EvaluationContext] = None
+) -> float:
     """
     同じ装備種類内、同じカテゴリ内での効果量ランクを計算（0.5~1.0）
+    context: 指定時は DB を参照しない
     """
-    effect_value = extract_effect_value(ability_text, category)
+    if context is not None:
+        effect_value = context.effect_value(ability_text, category)
+    else:
+        effect_value = extract_effect_value(ability_text, category)
     if effect_value is None:
         return 0.75  # デフォルト値
-    
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    
-    # 同じ装備種類内で同じカテゴリの全装備の効果量を取得
-    cur.execute("""
-        SELECT アビリティ 
-        FROM mart_equipments 
-        WHERE アビリティカテゴリ = ? AND 装備種類 = ? AND アビリティ IS NOT NULL
-    """, (category, equipment_type))
-    
-    values = []
-    for row in cur.fetchall():
-        val = extract_effect_value(row[0], category)
-        if val is not None:
-            values.append(val)
-    
-    conn.close()
+
+    if context is not None:
+        values = context.category_effects.get((equipment_type, category), [])
+    else:
+        conn = sqlite3.connect(DB_FILE)
+        cur = conn.cursor()
+
+        # 同じ装備種類内で同じカテゴリの全装備の効果量を取得
+        cur.execute("""
+            SELECT アビリティ 
+            FROM mart_equipments 
+            WHERE アビリティカテゴリ = ? AND 装備種類 = ? AND アビリティ IS NOT NULL
+        """, (category, equipment_type))
+
+        values = []
+        for row in cur.fetchall():
+            val = extract_effect_value(row[0], category)
+            if val is not None:
+                values.append(val)
+
+        conn.close()
     
     if not values or len(values) == 1:
         return 1.0
@@ -607,6 +1326,9 @@ def evaluate_ability(
     equipment_type: str,
     equipment_name: Optional[str] = None,
     rarity: Optional[str] = None,
+    effect_populations: Optional[Dict[str, List[float]]] = None,
+    settings: Optional[CategorySettings] = None,
+    context: Optional[EvaluationContext] = None,
 ) -> Dict:
     """
     アビリティの総合評価を計算
@@ -616,63 +1338,79 @@ def evaluate_ability(
         ability_text: アビリティテキスト
         category: アビリティカテゴリ (複数カテゴリの場合は区切り文字を許容)
         equipment_type: 装備種類 (武器/防具/装飾)
+        effect_populations: {カテゴリ: 母集団の効果量}。指定時は効果量スコアの計算でDBを参照しない
+        settings: カテゴリ設定（省略時は context の設定、なければ category_settings() の現在値）
+        context: 指定時は母集団・解析結果をコンテキストから取る（DBを参照しない）
     """
     if not ability_text or not category or category == "なし" or category == "":
-        return {
-            "score": 0,
-            "importance": 0,
-            "condition_rate": 0,
-            "condition_text": "",
-            "effect_score": 0,
-            "effect_value": None,
-            "min_effect_value": None,
-            "max_effect_value": None,
-            "representative_category": "",
-            "category_breakdown": [],
-            "categories": []
-        }
+        return _empty_ability_result()
     
     # 複数カテゴリの場合は分割して評価
-    categories = [c.strip() for c in re.split(r'[,，＋]', category) if c.strip()]
+    categories = _split_categories(category)
     
     if not categories:
-        return {
-            "score": 0,
-            "importance": 0,
-            "condition_rate": 0,
-            "condition_text": "",
-            "effect_score": 0,
-            "effect_value": None,
-            "min_effect_value": None,
-            "max_effect_value": None,
-            "representative_category": "",
-            "category_breakdown": [],
-            "categories": []
-        }
+        return _empty_ability_result()
 
-    condition_rate = evaluate_condition(ability_text)
+    if settings is None:
+        settings = context.settings if context is not None else category_settings()
+    if context is not None:
+        condition_rate, condition_text = context.condition(ability_text)
+    else:
+        condition_rate, condition_text = evaluate_condition(ability_text), extract_condition_text(ability_text)
     category_results = []
 
     for cat in categories:
-        importance = get_category_importance(cat)
+        importance = settings.importance(cat)
         effect_score, effect_value, min_val, max_val = calculate_effect_score(
             ability_text,
             cat,
             equipment_type,
             equipment_name=equipment_name,
             rarity=rarity,
+            population=None if effect_populations is None else effect_populations.get(cat, []),
+            context=context,
         )
-        cat_score = (importance + effect_score) * condition_rate * 0.5
-        category_results.append({
-            "category": cat,
-            "importance": importance,
-            "effect_score": effect_score,
-            "effect_value": effect_value,
-            "min_effect_value": min_val,
-            "max_effect_value": max_val,
-            "score": cat_score,
-        })
+        category_results.append(
+            _category_result(cat, importance, condition_rate, effect_score, effect_value, min_val, max_val)
+        )
+
+    return _ability_result(categories, category_results, condition_rate, condition_text)
+
+
+def _split_categories(category: Optional[str]) -> List[str]:
+    return [c.strip() for c in re.split(r'[,，＋]', category or '') if c.strip()]
+
+
+def _empty_ability_result() -> Dict:
+    return {
+        "score": 0,
+        "importance": 0,
+        "condition_rate": 0,
+        "condition_text": "",
+        "effect_score": 0,
+        "effect_value": None,
+        "min_effect_value": None,
+        "max_effect_value": None,
+        "representative_category": "",
+        "category_breakdown": [],
+        "categories": []
+    }
+
 
+def _category_result(category, importance, condition_rate, effect_score, effect_value, min_val, max_val) -> Dict:
+    return {
+        "category": category,
+        "importance": importance,
+        "effect_score": effect_score,
+        "effect_value": effect_value,
+        "min_effect_value": min_val,
+        "max_effect_value": max_val,
+        "score": (importance + effect_score) * condition_rate * 0.5,
+    }
+
+
+def _ability_result(categories: List[str], category_results: List[Dict], condition_rate: float, condition_text: str) -> Dict:
+    """カテゴリごとの評価から evaluate_ability の戻り値を組み立てる"""
     # 複数カテゴリ時は「重要度の最大値」を代表値に採用
     representative = max(category_results, key=lambda r: (r["importance"], r["score"]))
 
@@ -680,7 +1418,7 @@ def evaluate_ability(
         "score": round(representative["score"], 2),
         "importance": round(representative["importance"], 2),
         "condition_rate": round(condition_rate, 2),
-        "condition_text": extract_condition_text(ability_text),
+        "condition_text": condition_text,
         "effect_score": round(representative["effect_score"], 2),
         "effect_value": representative["effect_value"],
         "min_effect_value": representative["min_effect_value"],
@@ -695,6 +1433,147 @@ def evaluate_ability(
     }
 
 
+def _effect_ranges(conn: sqlite3.Connection, needed: set, extract) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """(装備種類, カテゴリ) ごとの効果量の (最小, 最大)。calculate_effect_score の母集団と同じ条件で mart を1回だけ読む"""
+    ranges: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    rows = conn.execute("""
+        SELECT 装備種類, アビリティ, アビリティカテゴリ
+        FROM mart_equipments
+        WHERE アビリティ IS NOT NULL
+          AND アビリティ != ''
+          AND アビリティカテゴリ IS NOT NULL
+          AND アビリティカテゴリ != ''
+    """).fetchall()
+    for equipment_type, ability, categories in rows:
+        for category in _split_categories(categories):
+            key = (equipment_type, category)
+            if key not in needed:
+                continue
+            val = extract(ability, category)
+            if val is None:
+                continue
+            if key in ranges:
+                low, high = ranges[key]
+                ranges[key] = (min(low, val), max(high, val))
+            else:
+                ranges[key] = (val, val)
+    return ranges
+
+
+def evaluate_abilities(
+    df: pd.DataFrame,
+    conn: Optional[sqlite3.Connection] = None,
+    settings: Optional[CategorySettings] = None,
+    context: Optional[EvaluationContext] = None,
+) -> pd.DataFrame:
+    """
+    evaluate_ability の一括版（各行の結果は1行ずつ evaluate_ability を呼んだ場合と同じ）
+    - 発動条件の解析はアビリティ文ごと、効果量の抽出は（アビリティ文, カテゴリ）ごとに1回
+    - 効果量の母集団（装備種類×カテゴリの最小・最大）は mart_equipments を1回読んで作る
+    - 発動条件・効果量は ability_parsed にある文はそれを使う（ない文だけその場で解析）
+
+    Args:
+        df: 列 アビリティ, アビリティカテゴリ, 装備種類（装備名, レアリティ は任意）
+        conn: 母集団を読む接続（省略時は DB_FILE）
+        settings: カテゴリ設定（省略時は context の設定、なければ category_settings() の現在値。全行で同じスナップショットを使う）
+        context: 指定時は母集団・解析結果をコンテキストから取る（conn は使わず、DBを参照しない）
+    Returns:
+        df と同じ index の DataFrame（列は ABILITY_RESULT_COLUMNS、値は evaluate_ability の戻り値と同じ）
+    """
+    def column(name: str) -> List:
+        if name not in df.columns:
+            return [None] * len(df)
+        return [None if not isinstance(v, str) and pd.isna(v) else v for v in df[name].tolist()]
+
+    if settings is None:
+        settings = context.settings if context is not None else category_settings()
+    abilities = column("アビリティ")
+    categories_list = column("アビリティカテゴリ")
+    equipment_types = column("装備種類")
+    names = column("装備名")
+    rarities = column("レアリティ")
+
+    conditions: Dict[str, Tuple[float, str]] = {}
+    effect_values: Dict[Tuple[str, str], Optional[float]] = {}
+
+    parsed: Dict[str, Dict] = {}
+
+    def extract(ability_text: str, category: str) -> Optional[float]:
+        key = (ability_text, category)
+        if key not in effect_values:
+            effect_values[key] = parsed_effect_value(parsed, ability_text, category)
+        return effect_values[key]
+
+    # 評価対象の行と、必要な母集団
+    targets = []
+    needed = set()
+    for ability_text, category, equipment_type in zip(abilities, categories_list, equipment_types):
+        if not ability_text or not category or category == "なし" or category == "":
+            targets.append(None)
+            continue
+        categories = _split_categories(category)
+        if not categories:
+            targets.append(None)
+            continue
+        targets.append(categories)
+        for cat in categories:
+            needed.add((equipment_type, cat))
+
+    ranges = {}
+    if needed and context is not None:
+        parsed.update(context.parsed)
+        for key in needed:
+            low, high = context.effect_range(*key)
+            if low is not None:
+                ranges[key] = (low, high)
+    elif needed:
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(DB_FILE)
+        try:
+            parsed.update(load_ability_parsed(conn))
+            ranges = _effect_ranges(conn, needed, extract)
+        finally:
+            if own_conn:
+                conn.close()
+
+    results = []
+    for ability_text, equipment_type, name, rarity, categories in zip(
+        abilities, equipment_types, names, rarities, targets
+    ):
+        if categories is None:
+            results.append(_empty_ability_result())
+            continue
+        if ability_text not in conditions:
+            conditions[ability_text] = parsed_condition(parsed, ability_text)
+        condition_rate, condition_text = conditions[ability_text]
+
+        category_results = []
+        for cat in categories:
+            effect_value = extract(ability_text, cat)
+            # 例外: 神田のスーツ_SSRは e=25（calculate_effect_score と同じ）
+            if name == "神田のスーツ" and rarity == "SSR":
+                effect_value = 25.0
+            if effect_value is None:
+                effect_score, min_val, max_val = 0.0, None, None
+            else:
+                effect_score, effect_value, min_val, max_val = _normalize_effect_value(
+                    effect_value, *ranges.get((equipment_type, cat), (None, None))
+                )
+            category_results.append(
+                _category_result(cat, settings.importance(cat), condition_rate, effect_score, effect_value, min_val, max_val)
+            )
+        results.append(_ability_result(categories, category_results, condition_rate, condition_text))
+
+    # None を NaN にしないよう object 列で組み立てる（数値の列だけ数値型にする）
+    result_df = pd.DataFrame(
+        {col: pd.Series([r.get(col) for r in results], index=df.index, dtype=object) for col in ABILITY_RESULT_COLUMNS}
+    )
+    for col in ["score", "importance", "condition_rate", "effect_score"]:
+        result_df[col] = result_df[col].astype(float)
+    return result_df
+
+
 def get_ability_rating(score: float) -> Tuple[str, str, str]:
     """アビリティ評価コメントを返す（css_class, emoji, label）"""
     if score >= 80:
@@ -1,10 +1,28 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-import re
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
+from ability_evaluator import load_ability_parsed
+from app_view import (
+    APP_SNAPSHOT_FILE,
+    APP_TABLE,
+    EQUIP_TYPES,
+    build_filter_index,
+    filter_mask,
+    finalize_app_frame,
+    read_app_data_version,
+    read_app_snapshot,
+    split_app_equipments,
+)
+from change_markers import table_fingerprints
+from equipment_search import has_search_index, search_equipments
+from score_history import LATEST_TABLE
+from loadout_optimizer import DEFAULT_WEIGHTS, MAX_REQUIRED, STATUS_COLUMNS, WEIGHT_COLUMNS, top_loadouts
+from similar_equipment import FEATURE_COLUMNS, build_similarity_index, similar_equipments
+from thumbnails import load_manifest, manifest_path, thumbnail_url
+
 # ページのタイトルとアイコンを設定
 st.set_page_config(page_title="Ryuon_Apricot_Equipmentdata")
 
@@ -13,21 +31,17 @@ SCORE_DB_FILE = "equipments_mart_score.db"
 EVALUATION_SHEETS_IMAGE_DIR = Path("evaluation_sheets/images")
 
 
-def _extract_probability_percent(text: str) -> float | None:
-    if not isinstance(text, str):
-        return None
-    normalized = text.replace('％', '%')
-    bracket_match = re.search(r'(\d+)\[(\d+)\]%の確率', normalized)
-    if bracket_match:
-        return float(max(int(bracket_match.group(1)), int(bracket_match.group(2))))
-    match = re.search(r'(\d+(?:\.\d+)?)%の確率', normalized)
-    if match:
-        return float(match.group(1))
-    return None
-
-
 def _get_latest_mart_score_table(conn: sqlite3.Connection) -> str | None:
-    """score DB から最新の *_equipments_mart_score テーブル名を取得"""
+    """
+    score DB から最新のスコア表のテーブル名を取得
+    差分履歴の equipments_mart_score_latest があればそれ、なければ最新の {yyyymmdd}_equipments_mart_score
+    """
+    row = conn.execute(
+        "SELECT 1 FROM scoredb.sqlite_master WHERE type = 'table' AND name = ?",
+        (LATEST_TABLE,),
+    ).fetchone()
+    if row is not None:
+        return LATEST_TABLE
     query = """
         SELECT name
         FROM scoredb.sqlite_master
@@ -41,13 +55,21 @@ def _get_latest_mart_score_table(conn: sqlite3.Connection) -> str | None:
         return None
     return row[0]
 
-@st.cache_data(ttl=3600)
-def load_data():
-    """SQLite DB からデータを読み込む"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.execute(f"ATTACH DATABASE '{SCORE_DB_FILE}' AS scoredb")
+def _read_app_equipments(conn: sqlite3.Connection) -> pd.DataFrame | None:
+    """score DB の app_equipments を1回で読み込む（古い score DB でテーブルがなければ None）"""
+    row = conn.execute(
+        "SELECT 1 FROM scoredb.sqlite_master WHERE type = 'table' AND name = ?",
+        (APP_TABLE,),
+    ).fetchone()
+    if row is None:
+        return None
+    return pd.read_sql(f'SELECT * FROM scoredb."{APP_TABLE}"', conn)
 
+
+def _load_equipment_frames_legacy(conn: sqlite3.Connection) -> list[pd.DataFrame]:
+    """app_equipments がない場合の従来経路（装備種類ごとに mart / スコア表 + src_equipments を読む）"""
     score_table = _get_latest_mart_score_table(conn)
+    parsed = load_ability_parsed(conn)
 
     equipments_list = ["武器", "防具", "装飾"]
     df_list = []
@@ -114,42 +136,93 @@ WHERE s.装備種類 = '{equipments}'
             df = pd.read_sql(query, conn)
         else:
             df = pd.read_sql(base_query, conn)
-        
-        df = df.sort_values('装備番号', ignore_index=True)
-        df = df.replace('', pd.NA)
-        if 'ステータススコア' not in df.columns:
-            df['ステータススコア'] = 0.0
-        if 'アビリティスコア' not in df.columns:
-            df['アビリティスコア'] = 0.0
-        if '発動条件' not in df.columns:
-            df['発動条件'] = ''
-        if 'アビリティ_抽出効果値' not in df.columns:
-            df['アビリティ_抽出効果値'] = None
-        if 'アビリティ_発動条件' not in df.columns:
-            df['アビリティ_発動条件'] = None
-
-        # デフォルト: アビリティ_抽出効果値 -> 効果量
-        df.rename(columns={'アビリティ_抽出効果値': '効果量'}, inplace=True)
-
-        # 状態異常付与: アビリティ文中の発動確率(%)を効果量として採用
-        status_abnormal_mask = df['アビリティカテゴリ'] == '状態異常付与'
-        abnormal_probability = df.loc[status_abnormal_mask, 'アビリティ'].apply(_extract_probability_percent)
-        df.loc[status_abnormal_mask, '効果量'] = abnormal_probability
 
+        df_list.append(finalize_app_frame(df, parsed))
+    return df_list
+
+
+def _file_stamp(path: str | Path) -> str:
+    """ファイルの更新日時（ns）とサイズ。ファイルがなければ 'missing'"""
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return "missing"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def data_version() -> str:
+    """
+    load_data のキャッシュキー（再実行のたびに呼ぶ。数行読むだけ）
+    - score DB: パイプラインが書いた app_data_version
+    - ryuon_equipments.db: アプリが読む mst_ability_category の変更マーカー（なければ内容の sha256）
+    - app_data_version がない古い score DB では、従来経路の読み込み元になる両DBのファイル更新日時・サイズ
+    - サムネイルの manifest.json の更新日時・サイズ（内容が変わったときだけ書き直される）
+    """
+    app_version = None
+    if Path(SCORE_DB_FILE).exists():
+        conn = sqlite3.connect(f"file:{SCORE_DB_FILE}?mode=ro", uri=True)
+        try:
+            app_version = read_app_data_version(conn, APP_TABLE)
+        finally:
+            conn.close()
+    thumbs_version = _file_stamp(manifest_path())
+    if app_version is None:
+        return f"{_file_stamp(SCORE_DB_FILE)}|{_file_stamp(DB_FILE)}|{thumbs_version}"
+
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    try:
+        category_version = table_fingerprints(conn, ["mst_ability_category"])["mst_ability_category"]
+    finally:
+        conn.close()
+    return f"{app_version}|{category_version}|{thumbs_version}"
+
+
+@st.cache_resource(max_entries=1)
+def load_data(version: str):
+    """
+    SQLite DB からデータを読み込む
+    version（data_version()）がキャッシュキー。データが変わったときだけ読み直す（古い版は破棄）
+    - cache_resource なので戻り値は全セッションで同じオブジェクトを共有する（セッションごとの pickle・コピーをしない）
+      返した DataFrame・インデックスは読み取り専用として扱い、列の追加・値の書き換えは絞り込み後のコピーに対して行う
+    """
+    conn = sqlite3.connect(DB_FILE)
+    conn.execute(f"ATTACH DATABASE '{SCORE_DB_FILE}' AS scoredb")
+
+    # パイプラインが作った app_equipments があれば1回の読み込みで済ませる
+    # （バージョンが一致する Arrow スナップショットがあればメモリマップで読む）
+    app_version = read_app_data_version(conn, APP_TABLE, schema="scoredb")
+    app_df = read_app_snapshot(APP_SNAPSHOT_FILE, app_version)
+    if app_df is None:
+        app_df = _read_app_equipments(conn)
+    if app_df is not None:
+        df_list = split_app_equipments(app_df)
+    else:
+        df_list = _load_equipment_frames_legacy(conn)
+
+    # 画像はローカルのサムネイル（static/thumbs/）を参照。サムネイルがない画像は元のURLのまま
+    manifest = load_manifest()
+    for i, df in enumerate(df_list):
+        if manifest:
+            df['画像'] = df['画像'].map(lambda url: thumbnail_url(url, manifest))
         df['check'] = False
         # チェック列を一番左に移動
         columns = ['check'] + [col for col in df.columns if col != 'check']
-        df = df[columns]
-        df['アビリティカテゴリ'] = df['アビリティカテゴリ'].fillna('アビリティなし')
-        df_list.append(df)
+        df_list[i] = df[columns]
 
     # アビリティカテゴリ
     df_category = pd.read_sql("SELECT * FROM 'mst_ability_category'", conn)
     df_nan = pd.DataFrame({'アビリティカテゴリ分類': ['アビリティなし']})
     df_category = pd.concat([df_category, df_nan])
 
+    # 検索フィルタ用ビットマップ（装備種類ごと、フィルタ変更時は AND するだけ）
+    category_options = df_category['アビリティカテゴリ分類'].dropna().unique()
+    filter_indexes = [build_filter_index(df, category_options) for df in df_list]
+
+    # 似た装備の検索用 KD-tree（装備種類ごと）
+    similarity_index = build_similarity_index(dict(zip(EQUIP_TYPES, df_list)))
+
     conn.close()
-    return df_list[0], df_list[1], df_list[2], df_category
+    return df_list[0], df_list[1], df_list[2], df_category, filter_indexes, similarity_index
 
 
 def rarity_select_list_ui():
@@ -259,6 +332,47 @@ def equipment_col_select_ui():
     return equipment_col_select_list
 
 
+def keyword_search_ui():
+    return st.text_input(
+        label='キーワード（装備名・アビリティ）',
+        value='',
+        placeholder='例: 会心率 / 敵の人数×（空白区切りで AND）',
+    )
+
+
+def keyword_search(keyword):
+    """キーワードに一致する（装備名, レアリティ）を関連度順に返す（検索インデックスがなければ None）"""
+    conn = sqlite3.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    try:
+        if not has_search_index(conn):
+            return None
+        return search_equipments(conn, keyword)
+    finally:
+        conn.close()
+
+
+def keyword_filtered_df(df, keyword, search_hits):
+    """キーワード検索の結果で絞り込み、関連度順に並べる"""
+    if not keyword.strip():
+        return df
+    if search_hits is None:
+        # 検索インデックスがない古い DB: 装備名・アビリティの部分一致
+        mask = pd.Series(True, index=df.index)
+        for term in keyword.split():
+            mask &= (
+                df['装備名'].str.contains(term, regex=False, na=False)
+                | df['アビリティ'].str.contains(term, regex=False, na=False)
+            )
+        return df[mask]
+    rank = {key: i for i, key in enumerate(zip(search_hits['装備名'], search_hits['レアリティ']))}
+    positions = pd.Series(
+        [rank.get(key) for key in zip(df['装備名'], df['レアリティ'].astype(object))],
+        index=df.index,
+        dtype='float',
+    )
+    return df.loc[positions.dropna().sort_values(kind='stable').index]
+
+
 def score_filter_ui():
     status_score_min = st.slider(
         label='ステータススコア（以上）',
@@ -283,34 +397,19 @@ def score_filter_ui():
     return status_score_min, ability_score_min, condition_select_list
 
 
-def index_filtered_df(df,rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list):
-    df_col = df.copy()
-    df = df[df['レアリティ'].isin(rarity_select_list)]
-    for status in status_select_list:
-        df = df[df[status].notnull() == True]
-    df = df[df['アビリティカテゴリ'].apply(lambda x: any(ab in x for ab in ability_select_list) if pd.notnull(x) else False)]
-
-    # ステータススコア（以上）
-    df = df[df['ステータススコア'].fillna(0) >= status_score_min]
-
-    # アビリティスコア（以上）
-    df = df[df['アビリティスコア'].fillna(0) >= ability_score_min]
-
-    # 発動条件
-    if condition_select_list:
-        condition_series = df['発動条件'].fillna('')
-        cond_mask = pd.Series(False, index=df.index)
-        if '常時' in condition_select_list:
-            cond_mask = cond_mask | (condition_series == '常時')
-        if '敵依存' in condition_select_list:
-            cond_mask = cond_mask | (condition_series == '敵依存')
-        if '(空欄)' in condition_select_list:
-            cond_mask = cond_mask | (condition_series == '')
-        df = df[cond_mask]
-
-    if df.shape[1]==0:
-        df = pd.DataFrame(columns=df_col.columns)
-    return df
+def index_filtered_df(df,filter_index,rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list):
+    # レアリティ・ステータス有無・アビリティカテゴリ（部分一致）・スコア（以上）・発動条件
+    # load_data で作ったビットマップの AND で絞り込む
+    mask = filter_mask(
+        filter_index,
+        rarity_select_list,
+        status_select_list,
+        ability_select_list,
+        status_score_min,
+        ability_score_min,
+        condition_select_list,
+    )
+    return df[mask]
 
 def equipment_checked_df_list(equipment, filtered_equipment_df, equipment_col_select_list):
     session_key = f"{equipment}_checked_rows"
@@ -377,6 +476,79 @@ def equipments_status_sum(final_selected_weapon,final_selected_armor,final_selec
             st.write(f'{final_selected_equipment[6][1]}')
 
 
+def loadout_optimizer_ui(weapon_df, armor_df, accesory_df, category_df, rarity_select_list):
+    """重み・必須アビリティ・レアリティ（サイドバーの選択）から上位の組み合わせを表示"""
+    ability_options = [ab for ab in category_df['アビリティカテゴリ分類'].unique() if ab != 'アビリティなし']
+    required = st.multiselect(
+        '必須アビリティ（いずれかの装備が持つこと）',
+        options=ability_options,
+        max_selections=MAX_REQUIRED,
+        key='loadout_required',
+    )
+    st.caption('評価値 = 各装備の Σ(重み × 値) の合計（レアリティはサイドバーの選択に従う）')
+    weight_cols = st.columns(4)
+    weights = {}
+    for i, col in enumerate(WEIGHT_COLUMNS):
+        with weight_cols[i % 4]:
+            weights[col] = st.number_input(
+                col,
+                min_value=0.0,
+                value=DEFAULT_WEIGHTS.get(col, 0.0),
+                step=0.1,
+                key=f'loadout_weight_{col}',
+            )
+    top_k = st.slider('表示件数', min_value=1, max_value=20, value=5, key='loadout_top_k')
+
+    loadouts = top_loadouts(
+        weapon_df, armor_df, accesory_df,
+        weights=weights,
+        required=required,
+        rarities=rarity_select_list,
+        k=top_k,
+    )
+    if loadouts.empty:
+        st.write('条件を満たす組み合わせがありません')
+        return
+    display_cols = ['順位', '評価値', '武器', '防具', '装飾'] + STATUS_COLUMNS
+    st.dataframe(loadouts[display_cols], hide_index=True)
+
+    # 選んだ組み合わせのステータス合算（equipments_status_sum と同じ表示）
+    rank = st.selectbox('ステータス合算を表示する順位', options=loadouts['順位'].tolist(), key='loadout_rank')
+    selected = loadouts[loadouts['順位'] == rank].iloc[0]
+    selected_lists = []
+    for df, name in [(weapon_df, '武器'), (armor_df, '防具'), (accesory_df, '装飾')]:
+        row_df = df.loc[[selected[f'{name}_index']], STATUS_COLUMNS + ['アビリティ']].fillna(0)
+        selected_lists.append(pd.melt(row_df).values.tolist())
+    equipments_status_sum(*selected_lists)
+
+
+def similar_equipment_ui(weapon_df, armor_df, accesory_df, similarity_index):
+    """選んだ装備とステータス（6種＋アビリティスコア）が近い装備を表示"""
+    equip_type = st.radio('装備種類', options=EQUIP_TYPES, horizontal=True, key='similar_type')
+    df = dict(zip(EQUIP_TYPES, [weapon_df, armor_df, accesory_df]))[equip_type]
+    options = list(zip(df['装備名'], df['レアリティ'].astype(object)))
+    selected = st.selectbox(
+        '装備',
+        options=options,
+        format_func=lambda key: f'{key[0]} [{key[1]}]',
+        key='similar_equipment',
+    )
+    top_k = st.slider('表示件数', min_value=1, max_value=20, value=5, key='similar_top_k')
+    if selected is None:
+        return
+    similar_df = similar_equipments(similarity_index, equip_type, selected[0], selected[1], k=top_k)
+    if similar_df.empty:
+        st.write('似た装備が見つかりません')
+        return
+    st.caption('距離: 装備種類内で標準化したステータス6種＋アビリティスコアのユークリッド距離（小さいほど近い）')
+    display_cols = ['画像', '装備名', 'レアリティ', '距離'] + FEATURE_COLUMNS + ['アビリティ']
+    st.dataframe(
+        similar_df[[col for col in display_cols if col in similar_df.columns]],
+        hide_index=True,
+        column_config={"画像": st.column_config.ImageColumn("画像")},
+    )
+
+
 def _guess_mime_type(file_path: Path) -> str:
     suffix = file_path.suffix.lower()
     if suffix == '.png':
@@ -447,25 +619,36 @@ def reload_time():
 def main():
     st.write('# 龍オン装備検索アプリケーション')
     st.write('データ最終更新日時：', reload_time())
-    weapon_df, armor_df, accesory_df, category_df = load_data()
+    weapon_df, armor_df, accesory_df, category_df, filter_indexes, similarity_index = load_data(data_version())
     
     with st.sidebar.expander("### 検索フィルタ", expanded=True):
+        keyword = keyword_search_ui()
         rarity_select_list = rarity_select_list_ui()
         status_select_list = status_select_list_ui()
         ability_select_list = ability_select_list_ui(category_df)
         status_score_min, ability_score_min, condition_select_list = score_filter_ui()
     equipment_col_select_list = equipment_col_select_ui()
+    search_hits = keyword_search(keyword) if keyword.strip() else None
 
     weapon, armor, accesory = st.tabs(["武器", "防具", "装飾"])
     with weapon:
-        filtered_weapon_df = index_filtered_df(weapon_df,rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_weapon_df = index_filtered_df(weapon_df,filter_indexes[0],rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_weapon_df = keyword_filtered_df(filtered_weapon_df,keyword,search_hits)
         weapon_select_index_num_list = equipment_checked_df_list('weapon',filtered_weapon_df,equipment_col_select_list)
     with armor:
-        filtered_armor_df = index_filtered_df(armor_df,rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_armor_df = index_filtered_df(armor_df,filter_indexes[1],rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_armor_df = keyword_filtered_df(filtered_armor_df,keyword,search_hits)
         armor_select_index_num_list = equipment_checked_df_list('armor',filtered_armor_df,equipment_col_select_list)
     with accesory:
-        filtered_accesory_df = index_filtered_df(accesory_df,rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_accesory_df = index_filtered_df(accesory_df,filter_indexes[2],rarity_select_list,status_select_list,ability_select_list,status_score_min,ability_score_min,condition_select_list)
+        filtered_accesory_df = keyword_filtered_df(filtered_accesory_df,keyword,search_hits)
         accesory_select_index_num_list = equipment_checked_df_list('accesory',filtered_accesory_df,equipment_col_select_list)
+
+    with st.expander("### 装備の組み合わせ検索", expanded=False):
+        loadout_optimizer_ui(weapon_df, armor_df, accesory_df, category_df, rarity_select_list)
+
+    with st.expander("### 似た装備を探す", expanded=False):
+        similar_equipment_ui(weapon_df, armor_df, accesory_df, similarity_index)
         
     with st.sidebar.expander("### ステータス合算", expanded=True):
         st.write('右のリストからセットしたい装備をcheckしてください')
@@ -0,0 +1,295 @@
+"""
+アプリ表示用テーブル（app_equipments）
+- generate_equipment_mart_score_db.py がスコア計算後に equipments_mart_score.db へ書き出す
+- app.py の load_data はこのテーブルを1回読んで装備種類ごとに分けるだけで表示用データになる
+- app_equipments がない古い score DB 向けに、app.py の従来経路でも finalize_app_frame で同じ整形を行う
+- 同じ内容を Arrow IPC ファイル（app_equipments.arrow）にも書き出し、app.py はメモリマップで直接読む
+  - score DB の app_data_version とファイル内のバージョンが一致するときだけ使う（古いスナップショットは無視）
+  - pyarrow がない環境では書き出し・読み込みとも行わない（SQLite の app_equipments を使う）
+- 検索フィルタ用のビットマップ（build_filter_index）も load_data で1回だけ作り、絞り込みは配列の AND で行う
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow は任意（Streamlit 環境には同梱）
+    pa = None
+
+from ability_evaluator import parsed_probability
+
+APP_TABLE = "app_equipments"
+APP_SNAPSHOT_FILE = "app_equipments.arrow"
+VERSION_TABLE = "app_data_version"
+SNAPSHOT_VERSION_KEY = b"app_data_version"
+EQUIP_TYPES = ["武器", "防具", "装飾"]
+# 値の種類が少ない列（スナップショットでは辞書エンコード → category 型で読み込む）
+CATEGORY_COLUMNS = ["レアリティ", "装備種類", "アビリティカテゴリ"]
+JST = timezone(timedelta(hours=9))
+
+# app_equipments の列（装備種類は分割用、それ以外は load_data が返す列の順）
+APP_COLUMNS = [
+    "装備種類",
+    "装備名",
+    "画像",
+    "装備番号",
+    "レアリティ",
+    "体力",
+    "攻撃力",
+    "防御力",
+    "会心率",
+    "命中率",
+    "回避率",
+    "ステータススコア",
+    "アビリティ",
+    "アビリティカテゴリ",
+    "アビリティスコア",
+    "発動条件",
+    "効果量",
+    "アビリティ_発動条件",
+]
+
+
+def finalize_app_frame(df: pd.DataFrame, parsed: dict | None = None) -> pd.DataFrame:
+    """
+    装備種類1つ分の DataFrame を表示用に整形（装備番号順・空文字→NA・効果量・カテゴリ補完）
+    parsed: load_ability_parsed の結果（発動確率はここから引き、ない文だけその場で解析）
+    """
+    df = df.sort_values('装備番号', ignore_index=True)
+    df = df.replace('', pd.NA)
+    if 'ステータススコア' not in df.columns:
+        df['ステータススコア'] = 0.0
+    if 'アビリティスコア' not in df.columns:
+        df['アビリティスコア'] = 0.0
+    if '発動条件' not in df.columns:
+        df['発動条件'] = ''
+    if 'アビリティ_抽出効果値' not in df.columns:
+        df['アビリティ_抽出効果値'] = None
+    if 'アビリティ_発動条件' not in df.columns:
+        df['アビリティ_発動条件'] = None
+
+    # デフォルト: アビリティ_抽出効果値 -> 効果量
+    df = df.rename(columns={'アビリティ_抽出効果値': '効果量'})
+
+    # 状態異常付与: アビリティ文中の発動確率(%)を効果量として採用
+    status_abnormal_mask = df['アビリティカテゴリ'] == '状態異常付与'
+    abnormal_probability = df.loc[status_abnormal_mask, 'アビリティ'].map(lambda text: parsed_probability(parsed, text))
+    df.loc[status_abnormal_mask, '効果量'] = abnormal_probability
+
+    df['アビリティカテゴリ'] = df['アビリティカテゴリ'].fillna('アビリティなし')
+    return df
+
+
+def build_app_equipments(score_df: pd.DataFrame, src_df: pd.DataFrame, parsed: dict | None = None) -> pd.DataFrame:
+    """
+    スコア計算済み DataFrame と src_equipments（装備名, レアリティ, IMG_URL）から app_equipments を作成
+    装備種類ごとに装備番号順で並べる（load_data はこの順のまま分割する）
+    """
+    images = src_df[['装備名', 'レアリティ', 'IMG_URL']].rename(columns={'IMG_URL': '画像'})
+    merged = score_df.merge(images, how='left', on=['装備名', 'レアリティ'])
+
+    source_cols = [
+        '装備種類', '装備名', '画像', '装備番号', 'レアリティ',
+        '体力', '攻撃力', '防御力', '会心率', '命中率', '回避率',
+        'ステータススコア', 'アビリティ', 'アビリティカテゴリ', 'アビリティスコア',
+        '発動条件', 'アビリティ_抽出効果値', 'アビリティ_発動条件',
+    ]
+    frames = []
+    for equip_type in EQUIP_TYPES:
+        df = merged.loc[merged['装備種類'] == equip_type, [c for c in source_cols if c in merged.columns]]
+        frames.append(finalize_app_frame(df, parsed))
+    return pd.concat(frames, ignore_index=True)[APP_COLUMNS]
+
+
+def split_app_equipments(app_df: pd.DataFrame) -> list[pd.DataFrame]:
+    """app_equipments を装備種類ごと（EQUIP_TYPES 順）に分割"""
+    frames = []
+    for equip_type in EQUIP_TYPES:
+        df = app_df[app_df['装備種類'] == equip_type].drop(columns='装備種類')
+        frames.append(df.reset_index(drop=True))
+    return frames
+
+
+def write_app_data_version(conn: sqlite3.Connection, name: str, version: str) -> None:
+    """
+    score DB の app_data_version に name のバージョンを記録
+    記録済みのバージョンと同じなら何も書かない（updated_at も変えない）
+    """
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{VERSION_TABLE}" (
+            name TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            updated_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO "{VERSION_TABLE}" (name, version, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at
+        WHERE version IS NOT excluded.version
+        """,
+        (name, version, datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    conn.commit()
+
+
+def read_app_data_version(conn: sqlite3.Connection, name: str = APP_TABLE, schema: str = "main") -> str | None:
+    row = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?",
+        (VERSION_TABLE,),
+    ).fetchone()
+    if row is None:
+        return None
+    row = conn.execute(f'SELECT version FROM {schema}."{VERSION_TABLE}" WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+
+def write_app_snapshot(app_df: pd.DataFrame, path: str | Path, version: str) -> bool:
+    """app_equipments を Arrow IPC（非圧縮・メモリマップ可）で書き出す。pyarrow がなければ False"""
+    if pa is None:
+        return False
+    df = app_df.copy()
+    for col in CATEGORY_COLUMNS:
+        # 欠損があると後段の fillna で category に新しい値を入れられないため、欠損なしの列だけ category 化
+        if col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype("category")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        SNAPSHOT_VERSION_KEY: version.encode("utf-8"),
+    })
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return True
+
+
+def app_snapshot_version(path: str | Path) -> str | None:
+    """スナップショットに記録したバージョン（中身は読まない）。pyarrow がない / ファイルがない場合は None"""
+    if pa is None or not Path(path).exists():
+        return None
+    with pa.memory_map(str(path), "r") as source:
+        version = (pa.ipc.open_file(source).schema.metadata or {}).get(SNAPSHOT_VERSION_KEY)
+    return None if version is None else version.decode("utf-8")
+
+
+def read_app_snapshot(path: str | Path, version: str | None) -> pd.DataFrame | None:
+    """
+    スナップショットをメモリマップで読み込む
+    pyarrow がない / ファイルがない / バージョン不一致（古いスナップショット）の場合は None
+    DataFrame への変換はここでの1回だけ（app.py の load_data は cache_resource で全セッションに共有する）
+    """
+    if pa is None or version is None or not Path(path).exists():
+        return None
+    source = pa.memory_map(str(path), "r")
+    reader = pa.ipc.open_file(source)
+    metadata = reader.schema.metadata or {}
+    if metadata.get(SNAPSHOT_VERSION_KEY) != version.encode("utf-8"):
+        return None
+    return reader.read_all().to_pandas()
+
+
+# =========================
+# 検索フィルタ用インデックス
+# =========================
+FILTER_STATUS_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "命中率", "回避率"]
+CONDITION_OPTIONS = ["常時", "敵依存", "(空欄)"]
+
+
+def _category_matrix(categories: pd.Series, options: list[str]) -> np.ndarray:
+    """行 × 選択肢の multi-hot 行列（選択肢がアビリティカテゴリの部分文字列なら True、欠損行は全て False）"""
+    codes, uniques = pd.factorize(categories.astype(object))
+    # 判定はユニークなカテゴリ文字列ごとに1回だけ行い、最後の行（欠損 = code -1）は全て False
+    unique_hits = np.zeros((len(uniques) + 1, len(options)), dtype=bool)
+    for i, category in enumerate(uniques):
+        unique_hits[i] = [option in category for option in options]
+    return unique_hits[codes]
+
+
+def build_filter_index(df: pd.DataFrame, category_options) -> dict:
+    """
+    index_filtered_df 用のビットマップを作成（load_data で1回だけ）
+    - category: 行 × アビリティカテゴリ分類の multi-hot 行列（従来の「ab in アビリティカテゴリ」と同じ判定）
+    - rarity / status / condition: 値ごと・列ごとの bool 配列
+    - スコアは欠損を 0 にした配列（スライダーとの比較用）
+    各配列は df の行と位置で対応する
+    """
+    options = [str(option) for option in category_options]
+    condition = df["発動条件"].astype(object).fillna("")
+    rarity = df["レアリティ"].astype(object)
+    return {
+        "rows": len(df),
+        "category_options": {option: i for i, option in enumerate(options)},
+        "category": _category_matrix(df["アビリティカテゴリ"], options),
+        "category_values": df["アビリティカテゴリ"].astype(object).to_numpy(),
+        "rarity": {value: (rarity == value).to_numpy() for value in rarity.dropna().unique()},
+        "status": {col: df[col].notna().to_numpy() for col in FILTER_STATUS_COLUMNS},
+        "condition": {
+            "常時": (condition == "常時").to_numpy(),
+            "敵依存": (condition == "敵依存").to_numpy(),
+            "(空欄)": (condition == "").to_numpy(),
+        },
+        "status_score": pd.to_numeric(df["ステータススコア"], errors="coerce").fillna(0).to_numpy(),
+        "ability_score": pd.to_numeric(df["アビリティスコア"], errors="coerce").fillna(0).to_numpy(),
+    }
+
+
+def filter_mask(
+    index: dict,
+    rarity_select_list,
+    status_select_list,
+    ability_select_list,
+    status_score_min: float,
+    ability_score_min: float,
+    condition_select_list,
+) -> np.ndarray:
+    """build_filter_index のビットマップを AND して、条件に合う行の bool 配列を返す"""
+    rows = index["rows"]
+    mask = np.zeros(rows, dtype=bool)
+    for rarity in rarity_select_list:
+        if rarity in index["rarity"]:
+            mask |= index["rarity"][rarity]
+
+    for status in status_select_list:
+        mask &= index["status"][status]
+
+    category_cols = []
+    ability_hit = np.zeros(rows, dtype=bool)
+    for ability in ability_select_list:
+        col = index["category_options"].get(ability)
+        if col is not None:
+            category_cols.append(col)
+        else:
+            # インデックス作成時になかった選択肢は従来どおり部分文字列で判定
+            ability_hit |= np.array(
+                [isinstance(value, str) and ability in value for value in index["category_values"]],
+                dtype=bool,
+            )
+    if category_cols:
+        ability_hit |= index["category"][:, category_cols].any(axis=1)
+    mask &= ability_hit
+
+    mask &= index["status_score"] >= status_score_min
+    mask &= index["ability_score"] >= ability_score_min
+
+    if condition_select_list:
+        cond_mask = np.zeros(rows, dtype=bool)
+        for option in condition_select_list:
+            if option in index["condition"]:
+                cond_mask |= index["condition"][option]
+        mask &= cond_mask
+    return mask
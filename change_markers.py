@@ -0,0 +1,136 @@
+"""
+テーブル変更マーカー
+- テーブル単位の「内容が変わったか」を table_change_markers テーブルに記録する
+- 書き込み側（03/04）がマーカーを更新し、読み込み側（05）は前回反映時のマーカーと比較して
+  変更のあったテーブルだけを処理する
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+MARKER_TABLE = "table_change_markers"
+JST = timezone(timedelta(hours=9))
+
+
+def ensure_marker_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{MARKER_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            marker TEXT NOT NULL,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def frame_marker(df: pd.DataFrame) -> str:
+    """DataFrame の内容（列名＋各行）からマーカー（sha256）を作成"""
+    digest = hashlib.sha256()
+    digest.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    if not df.empty:
+        row_hashes = pd.util.hash_pandas_object(df, index=False)
+        digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _canonical_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    内容比較用に正規化（列は名前順）
+    数値列は float にして小数8桁に丸め、それ以外は文字列（欠損は空文字）にする
+    （SQLite から読み戻したときに整数列が int64 / float64 のどちらになっても同じ値になる）
+    """
+    normalized = df.reindex(sorted(df.columns), axis=1)
+    canonical = {}
+    for col in normalized.columns:
+        if pd.api.types.is_numeric_dtype(normalized[col]):
+            # -0.0 と 0.0 を同じ値にする
+            canonical[col] = normalized[col].astype("float64").round(8) + 0.0
+        else:
+            canonical[col] = normalized[col].fillna("").astype(str)
+    return pd.DataFrame(canonical, index=df.index)
+
+
+def row_digests(df: pd.DataFrame) -> pd.Series:
+    """
+    行ごとの内容ハッシュ（16桁の16進文字列、列順は無視。df と同じ index）
+    列名の一覧（名前順）も含める（列名が変わった・列が増減した場合は値が同じでも全行のハッシュが変わる）
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    columns_hash = pd.util.hash_array(np.array(["\x1f".join(map(str, sorted(df.columns)))], dtype=object))[0]
+    hashes = pd.util.hash_pandas_object(_canonical_frame(df), index=False) ^ columns_hash
+    return hashes.map(lambda h: f"{h:016x}")
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """
+    内容比較用のダイジェスト（列名＋各行の sha256。列順・行順は無視）
+    frame_marker と違い、数値の型の違い（Int64 / int64 / float64）や丸め誤差では変わらない
+    """
+    digest = hashlib.sha256()
+    digest.update("\x1f".join(map(str, sorted(df.columns))).encode("utf-8"))
+    if not df.empty:
+        hashes = pd.util.hash_pandas_object(_canonical_frame(df), index=False).to_numpy()
+        digest.update(np.sort(hashes).tobytes())
+    return digest.hexdigest()
+
+
+def stamp_table_marker(conn: sqlite3.Connection, table_name: str, marker: str | None = None) -> str:
+    """
+    テーブルのマーカーを更新する
+    marker 未指定時は毎回異なるトークンを発行（＝必ず「変更あり」扱い）
+    """
+    ensure_marker_table(conn)
+    marker = marker or uuid.uuid4().hex
+    conn.execute(
+        f"""
+        INSERT INTO "{MARKER_TABLE}" (table_name, marker, updated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET
+            marker = excluded.marker,
+            updated_at = excluded.updated_at
+        WHERE "{MARKER_TABLE}".marker != excluded.marker
+        """,
+        (table_name, marker, datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    return marker
+
+
+def get_table_markers(conn: sqlite3.Connection) -> dict[str, str]:
+    """table_name -> marker の辞書を返す（マーカーテーブルがなければ空）"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
+        (MARKER_TABLE,),
+    ).fetchone()
+    if row is None:
+        return {}
+    return dict(conn.execute(f'SELECT table_name, marker FROM "{MARKER_TABLE}"').fetchall())
+
+
+def table_content_digest(conn: sqlite3.Connection, table_name: str) -> str | None:
+    """テーブル内容（列名＋全行、行順は無視）の sha256。テーブルがなければ None"""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    if not columns:
+        return None
+    digest = hashlib.sha256()
+    digest.update("\x1f".join(columns).encode("utf-8"))
+    order_by = ", ".join(str(i) for i in range(1, len(columns) + 1))
+    for row in conn.execute(f'SELECT * FROM "{table_name}" ORDER BY {order_by}'):
+        digest.update(repr(row).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def table_fingerprints(conn: sqlite3.Connection, table_names: list[str]) -> dict[str, str | None]:
+    """
+    テーブルごとの内容フィンガープリント
+    マーカーが記録されていればそれを使い、なければ内容から sha256 を計算する
+    """
+    markers = get_table_markers(conn)
+    return {t: markers.get(t) or table_content_digest(conn, t) for t in table_names}
@@ -0,0 +1,244 @@
+"""
+DBスキーマ管理（インデックス・統計情報）
+- 各パイプラインステップの最後に ensure_schema() を呼び出す
+  （02 の src_equipments 再作成や 03 のテーブル置き換えでインデックスが消えるため毎回補完する）
+- ANALYZE / PRAGMA optimize でクエリプランナ用の統計情報を更新
+- python db_schema.py で頻出クエリの実行計画レポートを表示
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "ryuon_equipments.db"
+
+STATUS_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "回避率", "命中率"]
+
+# (インデックス名, テーブル名, インデックス列/式, 必要な列)
+INDEXES = [
+    # ランキング計算（装備種類 [+ レアリティ] で絞り込み、各ステータスで並び替え）
+    (
+        "idx_mart_type_rarity_status",
+        "mart_equipments",
+        ["装備種類", "レアリティ", *STATUS_COLUMNS, "装備名"],
+        ["装備種類", "レアリティ", *STATUS_COLUMNS, "装備名"],
+    ),
+    # カテゴリ希少性・効果量スコア（装備種類 + アビリティカテゴリ、アビリティまでカバー）
+    (
+        "idx_mart_type_category",
+        "mart_equipments",
+        ["装備種類", "アビリティカテゴリ", "アビリティ"],
+        ["装備種類", "アビリティカテゴリ", "アビリティ"],
+    ),
+    # 装備の特定・05 の差分反映（装備名, レアリティ）
+    (
+        "idx_mart_name_rarity",
+        "mart_equipments",
+        ["装備名", "レアリティ"],
+        ["装備名", "レアリティ"],
+    ),
+    # mart との JOIN（画像URL・URL_Number までカバー）
+    (
+        "idx_src_name_rarity",
+        "src_equipments",
+        ["装備名", "レアリティ", "URL_Number", "IMG_URL", "画像名"],
+        ["装備名", "レアリティ", "URL_Number", "IMG_URL", "画像名"],
+    ),
+    # 直近装備の取得（ORDER BY CAST(URL_Number AS INTEGER) DESC）
+    (
+        "idx_src_url_number_int",
+        "src_equipments",
+        ["CAST(URL_Number AS INTEGER)"],
+        ["URL_Number"],
+    ),
+]
+
+# 実行計画レポート用の頻出クエリ（名前, SQL, パラメータ）
+HOT_QUERIES = [
+    (
+        "ランキング（同装備種類・同レアリティ）",
+        """
+        SELECT 攻撃力, 装備名, レアリティ
+        FROM mart_equipments
+        WHERE 装備種類 = ? AND レアリティ = ? AND 攻撃力 IS NOT NULL AND 攻撃力 > 0
+        ORDER BY 攻撃力 DESC
+        """,
+        ("武器", "UR"),
+    ),
+    (
+        "ランキング（同装備種類）",
+        """
+        SELECT 会心率, 装備名, レアリティ
+        FROM mart_equipments
+        WHERE 装備種類 = ? AND 会心率 IS NOT NULL AND 会心率 > 0
+        ORDER BY 会心率 DESC
+        """,
+        ("武器",),
+    ),
+    (
+        "calculate_category_rarity",
+        """
+        SELECT COUNT(*)
+        FROM mart_equipments
+        WHERE アビリティカテゴリ = ? AND 装備種類 = ?
+        """,
+        ("攻撃力上昇", "武器"),
+    ),
+    (
+        "calculate_effect_score",
+        """
+        SELECT アビリティ, アビリティカテゴリ
+        FROM mart_equipments
+        WHERE 装備種類 = ?
+          AND アビリティ IS NOT NULL AND アビリティ != ''
+          AND アビリティカテゴリ IS NOT NULL AND アビリティカテゴリ != ''
+        """,
+        ("武器",),
+    ),
+    (
+        "load_data（mart + src_equipments）",
+        """
+        SELECT m.装備名, e.IMG_URL AS 画像, m.装備番号, m.レアリティ
+        FROM mart_equipments AS m
+        LEFT JOIN src_equipments AS e
+        ON m.装備名 = e.装備名 AND m.レアリティ = e.レアリティ
+        WHERE m.装備種類 = ?
+        """,
+        ("武器",),
+    ),
+    (
+        "get_equipment_data",
+        """
+        SELECT m.*, s.URL_Number, s.IMG_URL, s.画像名
+        FROM mart_equipments m
+        LEFT JOIN src_equipments s
+            ON m.装備名 = s.装備名 AND m.レアリティ = s.レアリティ
+        WHERE m.装備名 = ? AND m.レアリティ = ?
+        """,
+        ("桐生の太鼓バチ", "UR"),
+    ),
+    (
+        "find_superior_equipment",
+        """
+        SELECT m.*, s.URL_Number, s.画像名 AS img_name, s.IMG_URL AS img_url
+        FROM mart_equipments m
+        LEFT JOIN src_equipments s ON m.装備名 = s.装備名 AND m.レアリティ = s.レアリティ
+        WHERE m.装備種類 = ?
+        AND NOT (m.装備名 = ? AND m.レアリティ = ?)
+        """,
+        ("武器", "桐生の太鼓バチ", "UR"),
+    ),
+    (
+        "get_latest_equipments",
+        """
+        SELECT DISTINCT s.装備名, s.レアリティ, s.URL_Number
+        FROM src_equipments s
+        WHERE s.URL_Number IS NOT NULL AND s.URL_Number != 0
+        ORDER BY CAST(s.URL_Number AS INTEGER) DESC
+        LIMIT ?
+        """,
+        (10,),
+    ),
+]
+
+
+def _table_columns(conn: sqlite3.Connection, table_name: str) -> set[str]:
+    return {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+
+
+def _index_exists(conn: sqlite3.Connection, index_name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name=? LIMIT 1",
+        (index_name,),
+    ).fetchone()
+    return row is not None
+
+
+def _index_term(term: str) -> str:
+    # 式（CAST(...) など）はそのまま、列名はクォート
+    return term if "(" in term else f'"{term}"'
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> list[str]:
+    """INDEXES のうち未作成のものを作成。戻り値: 新規作成したインデックス名"""
+    created = []
+    for index_name, table_name, terms, required_cols in INDEXES:
+        columns = _table_columns(conn, table_name)
+        if not columns or not set(required_cols).issubset(columns):
+            continue
+        if _index_exists(conn, index_name):
+            continue
+        index_terms = ", ".join(_index_term(t) for t in terms)
+        conn.execute(f'CREATE INDEX "{index_name}" ON "{table_name}" ({index_terms})')
+        created.append(index_name)
+    return created
+
+
+def ensure_schema(conn: sqlite3.Connection, analyze: bool = True) -> list[str]:
+    """
+    インデックスを補完し、統計情報を更新する
+    - インデックスを新規作成した場合は ANALYZE（全体）
+    - それ以外は PRAGMA optimize（必要なテーブルのみ再解析）
+    """
+    created = ensure_indexes(conn)
+    conn.commit()
+
+    if analyze:
+        if created:
+            conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+
+    if created:
+        print(f"🗂  インデックスを作成しました: {', '.join(created)}")
+    return created
+
+
+def explain_query_plans(conn: sqlite3.Connection) -> list[dict]:
+    """HOT_QUERIES の実行計画を取得"""
+    reports = []
+    for name, sql, params in HOT_QUERIES:
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plan = [row[3] for row in rows]
+        except sqlite3.Error as e:
+            plan = [f"エラー: {e}"]
+        reports.append({
+            "name": name,
+            "plan": plan,
+            # インデックスを使わない全件走査が残っているか
+            "full_scan": any(p.startswith("SCAN") and "INDEX" not in p for p in plan),
+        })
+    return reports
+
+
+def print_query_plan_report(conn: sqlite3.Connection) -> None:
+    print("=" * 60)
+    print("頻出クエリの実行計画")
+    print("=" * 60)
+    for report in explain_query_plans(conn):
+        mark = "⚠️ " if report["full_scan"] else "✓ "
+        print(f"{mark}{report['name']}")
+        for line in report["plan"]:
+            print(f"    {line}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="インデックス作成・ANALYZE・実行計画レポート")
+    parser.add_argument("--db", default=str(DB_PATH), help="対象DB (default: ryuon_equipments.db)")
+    parser.add_argument("--report-only", action="store_true", help="インデックス作成/ANALYZEを行わずレポートのみ表示")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if not args.report_only:
+            ensure_schema(conn)
+        print_query_plan_report(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
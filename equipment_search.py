@@ -0,0 +1,197 @@
+"""
+装備名・アビリティの全文検索（SQLite FTS5 trigram）
+- ryuon_equipments.db に equipment_search（FTS5 仮想テーブル, tokenize='trigram'）を持つ
+  - 対象: mart_equipments の全装備 ＋ mart にない src_equipments の装備（未登録の新装備）
+  - 02（src_equipments 再作成）と 05（mart_equipments 更新）の最後に refresh_search_index で差分だけ反映
+- 3文字以上の語は trigram インデックスで部分一致（bm25 順、装備名の一致を優先）
+  2文字以下の語は LIKE で部分一致（インデックスは使わないが件数は同じ）
+
+使い方:
+    python equipment_search.py 会心率
+    python equipment_search.py "敵の人数×"
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "ryuon_equipments.db"
+
+SEARCH_TABLE = "equipment_search"
+SEARCH_COLUMNS = ["装備名", "アビリティ"]
+# bm25 の列の重み（装備名, アビリティ, レアリティ）
+BM25_WEIGHTS = (10.0, 1.0, 0.0)
+TRIGRAM_MIN_LENGTH = 3
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    return _table_exists(conn, SEARCH_TABLE)
+
+
+def ensure_search_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS "{SEARCH_TABLE}" USING fts5(
+            装備名, アビリティ, レアリティ UNINDEXED, tokenize = 'trigram'
+        )
+        """
+    )
+
+
+def _source_select(conn: sqlite3.Connection) -> str | None:
+    """インデックス対象の (装備名, アビリティ, レアリティ)。mart の内容を優先し、mart にない装備は src から"""
+    selects = []
+    if _table_exists(conn, "mart_equipments"):
+        selects.append(
+            "SELECT 装備名, COALESCE(アビリティ, '') AS アビリティ, レアリティ FROM mart_equipments"
+        )
+    if _table_exists(conn, "src_equipments"):
+        not_in_mart = ""
+        if selects:
+            not_in_mart = """
+            WHERE NOT EXISTS (
+                SELECT 1 FROM mart_equipments AS m
+                WHERE m.装備名 = s.装備名 AND m.レアリティ IS s.レアリティ
+            )"""
+        selects.append(
+            f"SELECT s.装備名, COALESCE(s.アビリティ, ''), s.レアリティ FROM src_equipments AS s{not_in_mart}"
+        )
+    if not selects:
+        return None
+    return "\nUNION\n".join(selects)
+
+
+def refresh_search_index(conn: sqlite3.Connection) -> tuple[int, int]:
+    """
+    検索インデックスを元テーブルに合わせる（変わった行だけ削除・追加、変更がなければ書き込まない）
+    戻り値: (削除行数, 追加行数)
+    """
+    source = _source_select(conn)
+    if source is None:
+        return 0, 0
+    try:
+        ensure_search_table(conn)
+    except sqlite3.OperationalError as e:
+        # FTS5 / trigram（SQLite 3.34 以降）がない環境では作らない（アプリは部分一致検索にフォールバック）
+        print(f"⚠️  検索インデックスを作成できません: {e}")
+        return 0, 0
+    # 現在の内容と対象をキー付きの一時テーブルにして突き合わせる（FTS 表の全件走査を繰り返さない）
+    conn.execute("DROP TABLE IF EXISTS temp.search_source")
+    conn.execute("DROP TABLE IF EXISTS temp.search_current")
+    conn.execute(f"CREATE TEMP TABLE search_source AS {source}")
+    conn.execute(
+        f'CREATE TEMP TABLE search_current AS SELECT rowid AS id, 装備名, アビリティ, レアリティ FROM "{SEARCH_TABLE}"'
+    )
+    conn.execute("CREATE INDEX temp.idx_search_source ON search_source(装備名, レアリティ)")
+    conn.execute("CREATE INDEX temp.idx_search_current ON search_current(装備名, レアリティ)")
+
+    same_row = """
+        s.装備名 IS c.装備名 AND s.レアリティ IS c.レアリティ AND s.アビリティ IS c.アビリティ
+    """
+    deleted = conn.execute(
+        f"""
+        DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN (
+            SELECT c.id FROM temp.search_current AS c
+            WHERE NOT EXISTS (SELECT 1 FROM temp.search_source AS s WHERE {same_row})
+        )
+        """
+    ).rowcount
+    inserted = conn.execute(
+        f"""
+        INSERT INTO "{SEARCH_TABLE}" (装備名, アビリティ, レアリティ)
+        SELECT s.装備名, s.アビリティ, s.レアリティ FROM temp.search_source AS s
+        WHERE NOT EXISTS (SELECT 1 FROM temp.search_current AS c WHERE {same_row})
+        """
+    ).rowcount
+    conn.execute("DROP TABLE temp.search_source")
+    conn.execute("DROP TABLE temp.search_current")
+    conn.commit()
+    if deleted or inserted:
+        print(f"✓ 検索インデックス更新: 削除 {deleted} 行 / 追加 {inserted} 行")
+    return deleted, inserted
+
+
+def _quote_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_equipments(
+    conn: sqlite3.Connection,
+    text: str,
+    columns: list[str] | None = None,
+    limit: int | None = None,
+) -> pd.DataFrame:
+    """
+    空白区切りの各語をすべて含む装備（部分一致・AND）を関連度順に返す
+    columns: 検索する列（既定は装備名・アビリティ）
+    戻り値の列: 装備名, レアリティ, アビリティ, score（小さいほど上位）
+    """
+    columns = [col for col in (columns or SEARCH_COLUMNS) if col in SEARCH_COLUMNS]
+    terms = [term for term in text.split() if term]
+    if not terms or not columns:
+        return pd.DataFrame(columns=["装備名", "レアリティ", "アビリティ", "score"])
+
+    long_terms = [term for term in terms if len(term) >= TRIGRAM_MIN_LENGTH]
+    short_terms = [term for term in terms if len(term) < TRIGRAM_MIN_LENGTH]
+
+    where = []
+    params: list = []
+    if long_terms:
+        column_filter = "{" + " ".join(columns) + "}"
+        where.append(f'"{SEARCH_TABLE}" MATCH ?')
+        params.append(" AND ".join(f"{column_filter} : {_quote_phrase(term)}" for term in long_terms))
+    for term in short_terms:
+        where.append("(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in columns) + ")")
+        params.extend([f"%{_escape_like(term)}%"] * len(columns))
+
+    if long_terms:
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        score = f'bm25("{SEARCH_TABLE}", {weights})'
+    else:
+        # LIKE のみ: 装備名に含むものを先に
+        score = "CASE WHEN " + " AND ".join("装備名 LIKE ? ESCAPE '\\'" for _ in short_terms) + " THEN -1 ELSE 0 END"
+        params = [f"%{_escape_like(term)}%" for term in short_terms] + params
+
+    query = f"""
+        SELECT 装備名, レアリティ, アビリティ, {score} AS score
+        FROM "{SEARCH_TABLE}"
+        WHERE {" AND ".join(where)}
+        ORDER BY score, 装備名, レアリティ
+    """
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return pd.read_sql(query, conn, params=params)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="装備名・アビリティの全文検索")
+    parser.add_argument("text", help="検索語（空白区切りで AND）")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--refresh", action="store_true", help="検索前にインデックスを更新")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if args.refresh or not has_search_index(conn):
+            refresh_search_index(conn)
+        df = search_equipments(conn, args.text, limit=args.limit)
+    finally:
+        conn.close()
+    print(df.to_string(index=False) if not df.empty else "該当なし")
+
+
+if __name__ == "__main__":
+    main()
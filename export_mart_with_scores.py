@@ -5,7 +5,7 @@ mart_equipmentsをスコアと共にExcelにエクスポート
 import sqlite3
 import pandas as pd
 from typing import Dict, Optional
-from ability_evaluator import evaluate_ability
+from ability_evaluator import evaluate_abilities
 from itertools import combinations
 
 DB_FILE = "ryuon_equipments.db"
@@ -296,6 +296,9 @@ def export_to_excel(output_path: str = "mock_評価/mart_with_scores.xlsx"):
         'アビリティ_効果量': [],
     }
     
+    # アビリティ評価は全行まとめて（解析・効果量の母集団を行間で共有）
+    ability_results = evaluate_abilities(df, conn)
+    
     for idx, row in df.iterrows():
         equipment = row.to_dict()
         
@@ -345,14 +348,7 @@ def export_to_excel(output_path: str = "mock_評価/mart_with_scores.xlsx"):
         equipment_type = equipment.get("装備種類", "")
         
         if ability_text and ability_category and equipment_type:
-            from ability_evaluator import evaluate_ability
-            ability_result = evaluate_ability(
-                ability_text,
-                ability_category,
-                equipment_type,
-                equipment_name=equipment.get("装備名"),
-                rarity=equipment.get("レアリティ"),
-            )
+            ability_result = ability_results.loc[idx]
             ability_score = ability_result["score"]
             detail_cols['アビリティ_重要度'].append(ability_result.get("importance", 0))
             detail_cols['アビリティ_希少性'].append(ability_result.get("rarity", 0))
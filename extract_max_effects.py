@@ -2,11 +2,15 @@
 各装備のアビリティから最大効果値を抽出
 生存人数×5% → 5人で計算 → 25%
 不在人数×N% → 4人で計算 → N*4%
+効果量・発動確率は ability_parsed（05 で更新）から読む
 """
 import sqlite3
 import re
 from pathlib import Path
-from ability_evaluator import extract_effect_value, evaluate_ability
+
+import pandas as pd
+
+from ability_evaluator import evaluate_abilities, load_ability_parsed, parsed_effect_value, parsed_probability
 
 DB_FILE = "ryuon_equipments.db"
 OUTPUT_FILE = "mock_評価/equipment_max_effects.csv"
@@ -14,26 +18,12 @@ OUTPUT_LONG_FILE = "mock_評価/equipment_max_effects_long.csv"
 OUTPUT_SCORE_FILE = "mock_評価/equipment_ability_scores.csv"
 
 
-def extract_activation_probability(ability_text: str):
-    """アビリティテキストから発動確率(%)を抽出。なければNone。"""
-    if not ability_text:
-        return None
-
-    text = ability_text.replace('％', '%')
-    # 4[12]% のような表記は高い方を採用
-    bracket_match = re.search(r'(\d+)\[(\d+)\]%の確率', text)
-    if bracket_match:
-        return float(max(int(bracket_match.group(1)), int(bracket_match.group(2))))
-
-    match = re.search(r'(\d+(?:\.\d+)?)%の確率', text)
-    if match:
-        return float(match.group(1))
-    return None
-
-def get_all_abilities_with_max_effects():
+def get_all_abilities_with_max_effects(parsed=None):
     """全装備のアビリティと最大効果値を取得"""
     conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
+    if parsed is None:
+        parsed = load_ability_parsed(conn)
     
     cur.execute("""
         SELECT 装備名, レアリティ, アビリティカテゴリ, アビリティ, 装備種類
@@ -49,8 +39,8 @@ def get_all_abilities_with_max_effects():
         is_multi_category = len(categories) > 1
 
         # 複数カテゴリは一旦空欄運用
-        effect_value = None if is_multi_category else extract_effect_value(ability_text, category)
-        activation_probability = extract_activation_probability(ability_text)
+        effect_value = None if is_multi_category else parsed_effect_value(parsed, ability_text, category)
+        activation_probability = parsed_probability(parsed, ability_text)
         
         results.append({
             '装備名': name,
@@ -66,7 +56,7 @@ def get_all_abilities_with_max_effects():
     return results
 
 
-def to_long_format_rows(rows):
+def to_long_format_rows(rows, parsed=None):
     """横持ち行を縦持ち（1カテゴリ=1行）に展開"""
     long_rows = []
 
@@ -93,13 +83,13 @@ def to_long_format_rows(rows):
             copied['カテゴリ連番'] = index
 
             # 縦持ち側は各カテゴリ単位で効果値を再抽出
-            copied['抽出効果値'] = extract_effect_value(copied['アビリティ'], single_category) or ''
+            copied['抽出効果値'] = parsed_effect_value(parsed, copied['アビリティ'], single_category) or ''
             long_rows.append(copied)
 
     return long_rows
 
 
-def build_ability_score_rows():
+def build_ability_score_rows(parsed=None):
     """
     指定フォーマットのアビリティスコア行を作成
     列: 装備名, レアリティ, 装備種類, カテゴリ, アビリティ, 重要度,
@@ -107,6 +97,8 @@ def build_ability_score_rows():
     """
     conn = sqlite3.connect(DB_FILE)
     cur = conn.cursor()
+    if parsed is None:
+        parsed = load_ability_parsed(conn)
     cur.execute("""
         SELECT 装備名, レアリティ, 装備種類, アビリティカテゴリ, アビリティ
         FROM mart_equipments
@@ -114,18 +106,21 @@ def build_ability_score_rows():
         ORDER BY レアリティ DESC, 装備名
     """)
 
-    rows = []
-    for name, rarity, equipment_type, categories, ability_text in cur.fetchall():
-        if not categories or categories == "なし":
-            continue
+    targets = [
+        (name, rarity, equipment_type, categories, ability_text)
+        for name, rarity, equipment_type, categories, ability_text in cur.fetchall()
+        if categories and categories != "なし"
+    ]
+    # アビリティ評価は全行まとめて（解析・効果量の母集団を行間で共有）
+    eval_results = evaluate_abilities(
+        pd.DataFrame(targets, columns=['装備名', 'レアリティ', '装備種類', 'アビリティカテゴリ', 'アビリティ']),
+        conn,
+    )
 
-        eval_result = evaluate_ability(
-            ability_text,
-            categories,
-            equipment_type,
-            equipment_name=name,
-            rarity=rarity,
-        )
+    rows = []
+    for (name, rarity, equipment_type, categories, ability_text), (_, eval_result) in zip(
+        targets, eval_results.iterrows()
+    ):
 
         rows.append({
             '装備名': name,
@@ -136,7 +131,7 @@ def build_ability_score_rows():
             '重要度': eval_result.get('importance', 0),
             '抽出効果値': eval_result.get('effect_value', ''),
             '効果量スコア': eval_result.get('effect_score', 0),
-            '発動確率': extract_activation_probability(ability_text) or '',
+            '発動確率': parsed_probability(parsed, ability_text) or '',
             'アビリティスコア': eval_result.get('score', 0),
         })
 
@@ -144,9 +139,13 @@ def build_ability_score_rows():
     return rows
 
 if __name__ == "__main__":
-    results = get_all_abilities_with_max_effects()
-    long_results = to_long_format_rows(results)
-    score_rows = build_ability_score_rows()
+    conn = sqlite3.connect(DB_FILE)
+    parsed = load_ability_parsed(conn)
+    conn.close()
+
+    results = get_all_abilities_with_max_effects(parsed)
+    long_results = to_long_format_rows(results, parsed)
+    score_rows = build_ability_score_rows(parsed)
     
     # CSV出力
     Path("mock_評価").mkdir(exist_ok=True)
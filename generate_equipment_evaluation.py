@@ -7,12 +7,15 @@ import pandas as pd
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Tuple, List
-from ability_evaluator import format_ability_evaluation
+from ability_evaluator import EvaluationContext, format_ability_evaluation, load_evaluation_context
+from similar_equipment import FEATURE_COLUMNS, load_similarity_index, nearest_equipments
 from itertools import combinations
 import asyncio
-from playwright.async_api import async_playwright
 
 DB_FILE = "ryuon_equipments.db"
+# 似た装備の検索に使う（01_generate_evaluations.py で先に生成される）
+SCORE_DB_FILE = "equipments_mart_score.db"
+SIMILAR_TOP_K = 3
 OUTPUT_DIR = Path("evaluation_sheets")
 IMAGE_DIR = OUTPUT_DIR / "images"
 
@@ -24,6 +27,15 @@ STATUS_COLUMNS = {
     "装飾": ["体力", "攻撃力", "防御力", "会心率", "回避率", "命中率"]
 }
 
+# 同装備種類 AND 同レアリティで比較するステータス（それ以外は同装備種類のみで比較）
+RARITY_BASED_STATS = ["体力", "攻撃力", "防御力"]
+
+BUILD_TYPE_DISPLAY = {
+    "襲撃編成型": "⚡ 襲撃編成型",
+    "迎撃編成耐久型": "🛡️ 迎撃編成耐久型",
+    "迎撃編成撃退型": "⚔️ 迎撃編成撃退型",
+}
+
 
 def get_equipment_data(conn: sqlite3.Connection, equipment_name: str, rarity: str) -> Dict:
     """
@@ -83,22 +95,22 @@ def get_equipment_data(conn: sqlite3.Connection, equipment_name: str, rarity: st
     return dict(zip(columns, row))
 
 
-def calculate_status_rankings(conn: sqlite3.Connection, equipment: Dict) -> Dict:
+def calculate_status_rankings(conn: sqlite3.Connection, equipment: Dict, context: EvaluationContext = None) -> Dict:
     """
     同装備種類内でのステータスランキングを計算
     
     - 体力、攻撃力、防御力: 同装備種類 AND 同レアリティで比較
     - 会心率、回避率、命中率: 同装備種類のみで比較
+    - context: 指定時は DB を参照しない（EvaluationContext.status_rankings）
     """
+    if context is not None:
+        return context.status_rankings(equipment)
     equipment_type = equipment["装備種類"]
     rarity = equipment.get("レアリティ")
     status_cols = STATUS_COLUMNS.get(equipment_type, [])
     
     rankings = {}
     
-    # レアリティで区分するステータス
-    rarity_based_stats = ["体力", "攻撃力", "防御力"]
-    
     for status in status_cols:
         # 現在の装備のステータス値を取得
         current_value = equipment.get(status)
@@ -113,7 +125,7 @@ def calculate_status_rankings(conn: sqlite3.Connection, equipment: Dict) -> Dict
             continue
         
         # ステータスに応じてフィルタ条件を変更
-        if status in rarity_based_stats:
+        if status in RARITY_BASED_STATS:
             # 体力・攻撃力・防御力: 同装備種類 AND 同レアリティ
             df = pd.read_sql(f"""
                 SELECT {status}, 装備名, レアリティ
@@ -160,7 +172,33 @@ def calculate_status_rankings(conn: sqlite3.Connection, equipment: Dict) -> Dict
     return rankings
 
 
-def calculate_build_type_combination_rankings(conn: sqlite3.Connection, equipment: Dict, build_type_statuses: List[str]) -> Dict:
+def build_type_pairs(equipment: Dict) -> Dict[str, List[Tuple[str, str]]]:
+    """装備が持つステータス（0・NaN以外）から、型ごとの2ステータス組み合わせ候補を列挙"""
+    status_cols = STATUS_COLUMNS.get(equipment.get("装備種類"), [])
+    active_statuses = {
+        col for col in status_cols
+        if pd.notna(equipment.get(col)) and equipment.get(col) not in [None, 0]
+    }
+
+    offense_stats = {"攻撃力", "会心率", "命中率"}
+    defense_stats = {"体力", "防御力", "回避率"}
+
+    type_pairs = {
+        "襲撃編成型": [pair for pair in combinations(sorted(active_statuses & offense_stats), 2)],
+        "迎撃編成耐久型": [pair for pair in combinations(sorted(active_statuses & defense_stats), 2)],
+        "迎撃編成撃退型": []
+    }
+
+    if {"防御力", "命中率"}.issubset(active_statuses):
+        type_pairs["迎撃編成撃退型"].append(("防御力", "命中率"))
+    if {"防御力", "会心率"}.issubset(active_statuses):
+        type_pairs["迎撃編成撃退型"].append(("防御力", "会心率"))
+    return type_pairs
+
+
+def calculate_build_type_combination_rankings(
+    conn: sqlite3.Connection, equipment: Dict, build_type_statuses: List[str], context: EvaluationContext = None
+) -> Dict:
     """
     型内での2種ステータス組み合わせランキングを計算（新仕様）
 
@@ -173,10 +211,14 @@ def calculate_build_type_combination_rankings(conn: sqlite3.Connection, equipmen
         conn: データベース接続
         equipment: 装備データ
         build_type_statuses: 型に含まれるステータスのリスト
+        context: 指定時は DB を参照しない（EvaluationContext.build_type_rankings）
     
     Returns:
         各組み合わせでのランキング情報
     """
+    if context is not None:
+        return context.build_type_rankings(equipment)
+
     equipment_type = equipment.get("装備種類")
     rarity = equipment.get("レアリティ")
     combination_rankings = {}
@@ -184,33 +226,7 @@ def calculate_build_type_combination_rankings(conn: sqlite3.Connection, equipmen
     if not equipment_type or not rarity:
         return combination_rankings
 
-    status_cols = STATUS_COLUMNS.get(equipment_type, [])
-    active_statuses = {
-        col for col in status_cols
-        if pd.notna(equipment.get(col)) and equipment.get(col) not in [None, 0]
-    }
-
-    offense_stats = {"攻撃力", "会心率", "命中率"}
-    defense_stats = {"体力", "防御力", "回避率"}
-
-    type_pairs = {
-        "襲撃編成型": [pair for pair in combinations(sorted(active_statuses & offense_stats), 2)],
-        "迎撃編成耐久型": [pair for pair in combinations(sorted(active_statuses & defense_stats), 2)],
-        "迎撃編成撃退型": []
-    }
-
-    if {"防御力", "命中率"}.issubset(active_statuses):
-        type_pairs["迎撃編成撃退型"].append(("防御力", "命中率"))
-    if {"防御力", "会心率"}.issubset(active_statuses):
-        type_pairs["迎撃編成撃退型"].append(("防御力", "会心率"))
-
-    type_display = {
-        "襲撃編成型": "⚡ 襲撃編成型",
-        "迎撃編成耐久型": "🛡️ 迎撃編成耐久型",
-        "迎撃編成撃退型": "⚔️ 迎撃編成撃退型",
-    }
-
-    for build_type, pairs in type_pairs.items():
+    for build_type, pairs in build_type_pairs(equipment).items():
         for status1, status2 in pairs:
             # 同種装備・同レアリティ・同ステータス組み合わせ（2ステータスを持つ）で比較
             df = pd.read_sql(f"""
@@ -258,7 +274,7 @@ def calculate_build_type_combination_rankings(conn: sqlite3.Connection, equipmen
                 "score": float(combo_score),
                 "statuses": [status1, status2],
                 "build_type": build_type,
-                "build_type_display": type_display[build_type],
+                "build_type_display": BUILD_TYPE_DISPLAY[build_type],
                 "combo_name": f"{status1}・{status2}",
             }
 
@@ -353,9 +369,12 @@ def calculate_overall_status_score(rankings: Dict, build_type_rankings: Dict = N
     return (avg_score, "平均値")
 
 
-def find_superior_equipment(conn: sqlite3.Connection, equipment: Dict, ability_score: float) -> Dict:
+def find_superior_equipment(
+    conn: sqlite3.Connection, equipment: Dict, ability_score: float, context: EvaluationContext = None
+) -> Dict:
     """
     上位互換装備を検索
+    context: 指定時は候補のアビリティ評価で DB を参照しない
     
     条件：
     - 同じ装備種類
@@ -407,9 +426,11 @@ def find_superior_equipment(conn: sqlite3.Connection, equipment: Dict, ability_s
     status_superior_list = []
     ability_superior_list = []
     
+    # ステータスが同等以上の候補を先に絞り、アビリティ評価はまとめて行う
+    columns = [desc[0] for desc in cursor.description]
+    candidates = []
     for row in cursor.fetchall():
         # 辞書形式に変換
-        columns = [desc[0] for desc in cursor.description]
         candidate = dict(zip(columns, row))
         
         # ステータス比較
@@ -436,9 +457,29 @@ def find_superior_equipment(conn: sqlite3.Connection, equipment: Dict, ability_s
         
         if not all_equal_or_higher:
             continue
-        
+        candidates.append((candidate, candidate_stats, has_higher_stat))
+    
+    from ability_evaluator import evaluate_abilities
+    candidate_evals = evaluate_abilities(
+        pd.DataFrame(
+            [
+                {
+                    'アビリティ': candidate.get('アビリティ'),
+                    'アビリティカテゴリ': candidate.get('アビリティカテゴリ'),
+                    '装備種類': equipment_type,
+                    '装備名': candidate.get('装備名'),
+                    'レアリティ': candidate.get('レアリティ'),
+                }
+                for candidate, _, _ in candidates
+            ],
+            columns=['アビリティ', 'アビリティカテゴリ', '装備種類', '装備名', 'レアリティ'],
+        ),
+        conn,
+        context=context,
+    )
+    
+    for (candidate, candidate_stats, has_higher_stat), ability_score_value in zip(candidates, candidate_evals['score']):
         # アビリティスコアを計算
-        from ability_evaluator import evaluate_ability
         candidate_ability_score = 0
         abilities = []
         
@@ -447,14 +488,7 @@ def find_superior_equipment(conn: sqlite3.Connection, equipment: Dict, ability_s
         if ability_text and ability_text.strip() and ability_text != "なし":
             ability_category = candidate.get('アビリティカテゴリ', 'なし')
             if ability_category and ability_category != "なし":
-                ability_eval = evaluate_ability(
-                    ability_text,
-                    ability_category,
-                    equipment_type,
-                    equipment_name=candidate.get('装備名'),
-                    rarity=candidate.get('レアリティ'),
-                )
-                candidate_ability_score = ability_eval.get('score', 0)
+                candidate_ability_score = ability_score_value
                 abilities.append(ability_text)
         
         # URL取得（JOINで取得した画像情報を優先）
@@ -510,8 +544,85 @@ def find_superior_equipment(conn: sqlite3.Connection, equipment: Dict, ability_s
     }
 
 
-def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rarity: str) -> Tuple[str, int]:
-    """装備評価のHTMLを生成（2カラムレイアウト）。戻り値: (HTML文字列, URL_Number)"""
+def similar_equipment_html(equipment: Dict, ability_score: float) -> str:
+    """
+    ステータス6種＋アビリティスコアが近い装備（同じ装備種類、SIMILAR_TOP_K 件）のHTML
+    score DB の app_equipments から作った KD-tree を引く。score DB がなければ空文字列
+    """
+    index = load_similarity_index(SCORE_DB_FILE)
+    if index is None:
+        return ""
+    vector = {col: equipment.get(col) for col in FEATURE_COLUMNS}
+    vector["アビリティスコア"] = ability_score
+    similar_df = nearest_equipments(
+        index,
+        equipment['装備種類'],
+        vector,
+        k=SIMILAR_TOP_K,
+        exclude=(equipment['装備名'], equipment['レアリティ']),
+    )
+    if similar_df.empty:
+        return ""
+
+    html = '<div class="content">'
+    html += '<h2>📐 ステータスが近い装備</h2>'
+    html += '<p class="superior-note">ステータス6種とアビリティスコアが近い順（同じ装備種類）</p>'
+    html += '<table class="superior-table">'
+    html += '<thead><tr>'
+    html += '<th style="width: 20%;">画像</th>'
+    html += '<th style="width: 30%;">ステータス</th>'
+    html += '<th style="width: 50%;">アビリティ</th>'
+    html += '</tr></thead>'
+    html += '<tbody>'
+    for _, row in similar_df.iterrows():
+        name = row['装備名']
+        image_url = row.get('画像') or ''
+        html += '<tr>'
+
+        # 画像列
+        html += '<td>'
+        if isinstance(image_url, str) and image_url:
+            html += f'<img src="{image_url}" alt="{name}" width="80">'
+        html += f'<div class="equipment-name-small">{name}<br>({row["レアリティ"]})</div>'
+        html += '</td>'
+
+        # ステータス列
+        html += '<td class="stats-compact">'
+        status_lines = []
+        for stat_name in STATUS_COLUMNS.get(equipment['装備種類'], []):
+            stat_value = pd.to_numeric(row.get(stat_name), errors='coerce')
+            if pd.notna(stat_value) and stat_value > 0:
+                if float(stat_value) != int(stat_value):
+                    status_lines.append(f'{stat_name}: {stat_value:.1f}')
+                else:
+                    status_lines.append(f'{stat_name}: {int(stat_value)}')
+        html += '<br>'.join(status_lines) if status_lines else 'なし'
+        html += '</td>'
+
+        # アビリティ列
+        html += '<td class="ability-compact">'
+        ability = row.get('アビリティ')
+        if isinstance(ability, str) and ability.strip():
+            html += f'<div class="ability-item">{ability}</div>'
+            ability_score_value = pd.to_numeric(row.get('アビリティスコア'), errors='coerce')
+            ability_score_value = 0.0 if pd.isna(ability_score_value) else float(ability_score_value)
+            html += f'<div class="ability-score-small">スコア: {ability_score_value:.1f}点</div>'
+        else:
+            html += 'なし'
+        html += '</td>'
+        html += '</tr>'
+    html += '</tbody></table>'
+    html += '</div>'  # content
+    return html
+
+
+def generate_evaluation_html(
+    conn: sqlite3.Connection, equipment_name: str, rarity: str, context: EvaluationContext = None
+) -> Tuple[str, int]:
+    """
+    装備評価のHTMLを生成（2カラムレイアウト）。戻り値: (HTML文字列, URL_Number)
+    context: 指定時はステータス順位・アビリティ評価で DB を参照しない（複数装備を続けて生成するときは1回作って使い回す）
+    """
     equipment = get_equipment_data(conn, equipment_name, rarity)
     
     if not equipment:
@@ -548,11 +659,11 @@ def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rari
     ability = equipment.get("アビリティ", "なし") or "なし"
     
     # ステータス評価HTML
-    rankings = calculate_status_rankings(conn, equipment)
+    rankings = calculate_status_rankings(conn, equipment, context)
     build_type_name, build_type_statuses = analyze_build_type(equipment, rankings)
 
     # 型内評価（新仕様: 型候補の全2種組み合わせを再計算）
-    build_type_rankings = calculate_build_type_combination_rankings(conn, equipment, build_type_statuses)
+    build_type_rankings = calculate_build_type_combination_rankings(conn, equipment, build_type_statuses, context)
 
     # 複数型に当てはまる場合は最高スコアの型を採用
     if build_type_rankings:
@@ -600,6 +711,7 @@ def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rari
             equipment_type,
             equipment_name=equipment.get('装備名'),
             rarity=equipment.get('レアリティ'),
+            context=context,
         )
         
         if eval_result["score"] > 0:
@@ -639,10 +751,11 @@ def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rari
                 equipment['装備種類'],
                 equipment_name=equipment.get('装備名'),
                 rarity=equipment.get('レアリティ'),
+                context=context,
             )
             total_ability_score += ability_eval.get('score', 0)
     
-    superior_data = find_superior_equipment(conn, equipment, total_ability_score)
+    superior_data = find_superior_equipment(conn, equipment, total_ability_score, context)
     
     # 上位互換装備HTML
     superior_html = ""
@@ -749,6 +862,9 @@ def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rari
         superior_html += '</tbody></table>'
         superior_html += '</div>'  # content
     
+    # 似た装備HTML
+    similar_html = similar_equipment_html(equipment, total_ability_score)
+    
     # HTML作成
     html = f"""
 <!DOCTYPE html>
@@ -1039,6 +1155,8 @@ def generate_evaluation_html(conn: sqlite3.Connection, equipment_name: str, rari
         
         {superior_html}
         
+        {similar_html}
+        
         <div class="footer">
             <p><em>この評価は自動生成されたものです</em></p>
             <h4>スコア算出方法</h4>
@@ -1083,6 +1201,9 @@ def save_evaluation_file(equipment_name: str, rarity: str, content: str, url_num
 
 async def generate_preview_image_async(html_filepath: Path, output_path: Path):
     """HTMLファイルから画像を生成（非同期）"""
+    # 画像生成のときだけ必要（評価計算だけを使う whatif_evaluation.py などは playwright なしで動く）
+    from playwright.async_api import async_playwright
+
     async with async_playwright() as p:
         browser = await p.chromium.launch()
         page = await browser.new_page(viewport={"width": 1200, "height": 1600})
@@ -1126,6 +1247,7 @@ def generate_all_evaluations(generate_images: bool = True):
     """, conn)
     
     print(f"評価ファイル生成開始: {len(df)}件")
+    context = load_evaluation_context(conn)
     
     success_count = 0
     error_count = 0
@@ -1136,7 +1258,7 @@ def generate_all_evaluations(generate_images: bool = True):
         rarity = row["レアリティ"]
         
         try:
-            content, url_number = generate_evaluation_html(conn, equipment_name, rarity)
+            content, url_number = generate_evaluation_html(conn, equipment_name, rarity, context)
             if content:
                 html_filepath = save_evaluation_file(equipment_name, rarity, content, url_number)
                 success_count += 1
@@ -1,9 +1,14 @@
 """
 装備スコアDB生成スクリプト
 - equipments_mart_score.db を生成
-- {yyyymmdd}_equipments_mart_score テーブル作成
+- スコア表は差分履歴（score_history.py）に書く（前回から変わった行だけ。最新の全件は equipments_mart_score_latest）
+  - 従来の {yyyymmdd}_equipments_mart_score テーブルが残っていれば履歴に取り込んで削除する
 - {yyyymmdd}_max_status_score テーブル作成
-- 前回と同一内容なら当日テーブル作成を省略
+- 前回と同一内容なら当日の書き込みを省略
+  - 日付付きテーブルごとの内容ダイジェストを score_table_digests に記録し、前回テーブルを読み直さずに比較する
+- アプリ表示用の app_equipments テーブルを毎回作り直す（app.py の load_data が1回で読めるように）
+  - 同じ内容を app_equipments.arrow（Arrow IPC）にも書き出し、バージョンを app_data_version に記録
+- 計算に使ったカテゴリ設定のバージョンも app_data_version（category_settings）に記録
 """
 
 import json
@@ -15,7 +20,18 @@ from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 
-from ability_evaluator import evaluate_ability
+from ability_evaluator import CategorySettings, category_settings, evaluate_abilities, load_ability_parsed
+from app_view import (
+    APP_SNAPSHOT_FILE,
+    APP_TABLE,
+    app_snapshot_version,
+    build_app_equipments,
+    read_app_data_version,
+    write_app_data_version,
+    write_app_snapshot,
+)
+from change_markers import JST, frame_digest, frame_marker
+from score_history import LATEST_TABLE, migrate_dated_tables, write_score_history
 from export_mart_with_scores import (
     STATUS_COLUMNS,
     analyze_build_type,
@@ -26,6 +42,8 @@ from export_mart_with_scores import (
 
 SOURCE_DB = "ryuon_equipments.db"
 OUTPUT_DB = "equipments_mart_score.db"
+SETTINGS_VERSION_KEY = "category_settings"
+DIGEST_TABLE = "score_table_digests"
 
 STATUS_LIST = ["体力", "攻撃力", "防御力", "会心率", "命中率", "回避率"]
 MAX_STATUS_INDEX = ["体力", "攻撃力", "防御力", "会心率", "命中率", "回避率"]
@@ -40,7 +58,7 @@ def _to_numeric_safe(df: pd.DataFrame, cols: List[str], as_int: bool = False) ->
             df[col] = df[col].round().astype("Int64")
 
 
-def build_mart_score_dataframe(source_conn: sqlite3.Connection) -> pd.DataFrame:
+def build_mart_score_dataframe(source_conn: sqlite3.Connection, settings: Optional[CategorySettings] = None) -> pd.DataFrame:
     df = pd.read_sql("SELECT * FROM mart_equipments", source_conn)
 
     # 装備番号は ryuon_equipments.db の mart_equipments 由来を明示
@@ -90,6 +108,9 @@ def build_mart_score_dataframe(source_conn: sqlite3.Connection) -> pd.DataFrame:
         detail_cols[f"{stat}_max"] = []
         detail_cols[f"{stat}_diff"] = []
 
+    # アビリティ評価は全行まとめて（解析・効果量の母集団を行間で共有）
+    ability_results = evaluate_abilities(df, source_conn, settings)
+
     for idx, row in df.iterrows():
         equipment = row.to_dict()
 
@@ -147,13 +168,7 @@ def build_mart_score_dataframe(source_conn: sqlite3.Connection) -> pd.DataFrame:
         equipment_type = equipment.get("装備種類") or ""
 
         if ability_text and ability_category and equipment_type and ability_category != "なし":
-            ability_result = evaluate_ability(
-                ability_text,
-                ability_category,
-                equipment_type,
-                equipment_name=equipment.get("装備名"),
-                rarity=equipment.get("レアリティ"),
-            )
+            ability_result = ability_results.loc[idx]
             ability_score = ability_result.get("score", 0.0)
             detail_cols["発動条件"].append(ability_result.get("condition_text", ""))
             detail_cols["アビリティ_重要度"].append(ability_result.get("importance", 0))
@@ -313,27 +328,45 @@ def _build_json_payload(row: pd.Series, index_stat: str) -> str:
 
 
 def build_max_status_score_dataframe(df_scores: pd.DataFrame) -> pd.DataFrame:
-    rows = []
+    """
+    ステータスごと・装備種類ごとに最大値の装備を1行にまとめる（同値はアビリティスコアが高い方、さらに同じなら先の行）
+    ステータス列を縦持ちにして、(ステータス, 装備種類) ごとの最大を1回の並べ替えでまとめて求める
+    """
     equipment_types = ["武器", "防具", "装飾"]
 
+    wide = df_scores[["装備種類", "アビリティスコア", *MAX_STATUS_INDEX]].reset_index(drop=True)
+    wide[MAX_STATUS_INDEX] = wide[MAX_STATUS_INDEX].apply(pd.to_numeric, errors="coerce")
+    long_df = wide.rename_axis("行").reset_index().melt(
+        id_vars=["行", "装備種類", "アビリティスコア"],
+        value_vars=MAX_STATUS_INDEX,
+        var_name="index",
+        value_name="値",
+    )
+    long_df = long_df[(long_df["値"] > 0) & long_df["装備種類"].isin(equipment_types)]
+    top = long_df.sort_values(by=["値", "アビリティスコア", "行"], ascending=[False, False, True]).drop_duplicates(
+        ["index", "装備種類"]
+    )
+    winners = {
+        (stat, eq_type): (pos, value)
+        for stat, eq_type, pos, value in top[["index", "装備種類", "行", "値"]].itertuples(index=False)
+    }
+
+    rows = []
     for index_stat in MAX_STATUS_INDEX:
         row_data = {"index": index_stat, "武器": None, "防具": None, "装飾": None, "計": 0.0}
         total = 0.0
 
         for eq_type in equipment_types:
-            sub = df_scores[df_scores["装備種類"] == eq_type].copy()
-            sub[index_stat] = pd.to_numeric(sub[index_stat], errors="coerce")
-            sub = sub[sub[index_stat] > 0]
-
-            if sub.empty:
+            winner = winners.get((index_stat, eq_type))
+            if winner is None:
                 row_data[eq_type] = json.dumps({}, ensure_ascii=False)
                 continue
 
-            sub = sub.sort_values(by=[index_stat, "アビリティスコア"], ascending=[False, False])
-            top_row = sub.iloc[0]
-
+            pos, value = winner
+            top_row = df_scores.iloc[pos].copy()
+            top_row[index_stat] = value
             row_data[eq_type] = _build_json_payload(top_row, index_stat)
-            total += float(top_row[index_stat])
+            total += float(value)
 
         row_data["計"] = float(total)
         rows.append(row_data)
@@ -371,34 +404,51 @@ def _find_latest_table(conn: sqlite3.Connection, suffix: str, current_date: str)
     return candidates[0][1]
 
 
-def _normalize_for_compare(df: pd.DataFrame) -> pd.DataFrame:
-    normalized = df.copy()
-    normalized = normalized.reindex(sorted(normalized.columns), axis=1)
-    normalized = normalized.sort_values(by=list(normalized.columns), na_position="first").reset_index(drop=True)
-
-    for col in normalized.columns:
-        if pd.api.types.is_numeric_dtype(normalized[col]):
-            normalized[col] = normalized[col].round(8)
-        else:
-            normalized[col] = normalized[col].fillna("").astype(str)
+def _ensure_digest_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{DIGEST_TABLE}" (
+            table_name TEXT PRIMARY KEY,
+            digest TEXT NOT NULL,
+            row_count INTEGER,
+            updated_at TEXT
+        )
+        """
+    )
 
-    return normalized
 
+def _record_digest(conn: sqlite3.Connection, table_name: str, digest: str, row_count: int) -> None:
+    _ensure_digest_table(conn)
+    conn.execute(
+        f"""
+        INSERT INTO "{DIGEST_TABLE}" (table_name, digest, row_count, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(table_name) DO UPDATE SET
+            digest = excluded.digest,
+            row_count = excluded.row_count,
+            updated_at = excluded.updated_at
+        """,
+        (table_name, digest, row_count, datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    conn.commit()
 
-def _is_same_as_previous(conn: sqlite3.Connection, current_df: pd.DataFrame, suffix: str, current_date: str) -> bool:
-    prev_table = _find_latest_table(conn, suffix, current_date)
-    if not prev_table:
-        return False
 
-    prev_df = pd.read_sql(f'SELECT * FROM "{prev_table}"', conn)
+def _table_digest(conn: sqlite3.Connection, table_name: str) -> str:
+    """記録済みのダイジェスト（未記録のテーブルは1回だけ読み込んで計算し、記録しておく）"""
+    _ensure_digest_table(conn)
+    row = conn.execute(f'SELECT digest FROM "{DIGEST_TABLE}" WHERE table_name = ?', (table_name,)).fetchone()
+    if row is not None:
+        return row[0]
+    df = pd.read_sql(f'SELECT * FROM "{table_name}"', conn)
+    digest = frame_digest(df)
+    _record_digest(conn, table_name, digest, len(df))
+    return digest
 
-    curr_norm = _normalize_for_compare(current_df)
-    prev_norm = _normalize_for_compare(prev_df)
 
-    if list(curr_norm.columns) != list(prev_norm.columns):
+def _is_same_as_previous(conn: sqlite3.Connection, current_digest: str, suffix: str, current_date: str) -> bool:
+    prev_table = _find_latest_table(conn, suffix, current_date)
+    if not prev_table:
         return False
-
-    return curr_norm.equals(prev_norm)
+    return _table_digest(conn, prev_table) == current_digest
 
 
 def _write_table(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame) -> None:
@@ -408,11 +458,14 @@ def _write_table(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame) ->
 
 def main() -> None:
     current_date = datetime.now().strftime("%Y%m%d")
-    score_table = f"{current_date}_equipments_mart_score"
     max_status_table = f"{current_date}_max_status_score"
 
+    # 実行中に CSV が編集されても全行を同じ設定で計算する
+    settings = category_settings()
     source_conn = sqlite3.connect(SOURCE_DB)
-    score_df = build_mart_score_dataframe(source_conn)
+    score_df = build_mart_score_dataframe(source_conn, settings)
+    src_df = pd.read_sql("SELECT 装備名, レアリティ, IMG_URL FROM src_equipments", source_conn)
+    parsed = load_ability_parsed(source_conn)
     source_conn.close()
 
     max_status_df = build_max_status_score_dataframe(score_df)
@@ -420,24 +473,47 @@ def main() -> None:
     output_db_path = Path(OUTPUT_DB)
     output_conn = sqlite3.connect(output_db_path)
 
-    score_same = _is_same_as_previous(output_conn, score_df, "equipments_mart_score", current_date)
-    max_same = _is_same_as_previous(output_conn, max_status_df, "max_status_score", current_date)
-
     created_tables = []
     skipped_tables = []
 
-    if score_same:
-        skipped_tables.append(score_table)
+    migrated = migrate_dated_tables(output_conn)
+    if migrated:
+        print(f"✓ 日付付きスコア表を履歴に取り込み: {len(migrated)}テーブル")
+
+    history = write_score_history(output_conn, score_df, current_date)
+    if history["changed"]:
+        created_tables.append(f'{LATEST_TABLE}（変更 {history["upserts"]} / 削除 {history["deletes"]}）')
     else:
-        _write_table(output_conn, score_table, score_df)
-        created_tables.append(score_table)
+        skipped_tables.append(LATEST_TABLE)
+
+    max_digest = frame_digest(max_status_df)
+    max_same = _is_same_as_previous(output_conn, max_digest, "max_status_score", current_date)
 
     if max_same:
         skipped_tables.append(max_status_table)
     else:
         _write_table(output_conn, max_status_table, max_status_df)
+        _record_digest(output_conn, max_status_table, max_digest, len(max_status_df))
         created_tables.append(max_status_table)
 
+    # app_equipments は毎回組み立て、記録済みのバージョンと内容が同じなら書かない
+    # （変更のない日は score DB を書き換えない）
+    app_df = build_app_equipments(score_df, src_df, parsed)
+    app_version = frame_marker(app_df)
+    snapshot_path = output_db_path.with_name(APP_SNAPSHOT_FILE)
+    if read_app_data_version(output_conn, APP_TABLE) == app_version and _table_exists(output_conn, APP_TABLE):
+        skipped_tables.append(APP_TABLE)
+    else:
+        _write_table(output_conn, APP_TABLE, app_df)
+        created_tables.append(APP_TABLE)
+    # スナップショットは score DB の外なので、バージョンが違う・ない場合だけ書き直す
+    if app_snapshot_version(snapshot_path) != app_version and write_app_snapshot(app_df, snapshot_path, app_version):
+        created_tables.append(snapshot_path.name)
+    # スナップショットを書いてからバージョンを更新（app.py は一致したときだけスナップショットを使う）
+    write_app_data_version(output_conn, APP_TABLE, app_version)
+    # どのカテゴリ設定で計算したスコアか（category_settings_version() と比べれば設定の変更を検知できる）
+    write_app_data_version(output_conn, SETTINGS_VERSION_KEY, settings.version)
+
     output_conn.close()
 
     print("=" * 60)
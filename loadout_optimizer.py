@@ -0,0 +1,162 @@
+"""
+装備の組み合わせ（武器×防具×装飾）の上位 k 件検索
+- 評価値 = 各装備の Σ(重み × 列の値) の合計（列はステータス6種・ステータススコア・アビリティスコア。欠損は 0）
+- 必須アビリティカテゴリ: 3つの装備のいずれかのアビリティカテゴリに含まれていること（検索フィルタと同じ部分一致）
+- レアリティ: 指定したレアリティの装備のみ
+
+全組み合わせ（約2,000万通り）は列挙せず、以下で絞り込む
+1. パレート枝刈り: 同じ枠で「評価値が以上 かつ 必須カテゴリの充足が包含する」装備が k 個以上ある装備は除外
+2. 分枝限定法: 評価値の降順に武器 → 防具 → 装飾を辿り、残りの枠で到達できる上限が
+   現在の k 位以下なら打ち切る（上限は未充足の必須カテゴリごとに事前計算）
+"""
+from __future__ import annotations
+
+import heapq
+
+import numpy as np
+import pandas as pd
+
+STATUS_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "命中率", "回避率"]
+WEIGHT_COLUMNS = STATUS_COLUMNS + ["ステータススコア", "アビリティスコア"]
+SLOT_NAMES = ["武器", "防具", "装飾"]
+DEFAULT_WEIGHTS = {"ステータススコア": 1.0, "アビリティスコア": 1.0}
+# 必須カテゴリはビットマスクで扱う（2^N 通りの未充足パターンごとに上限を持つため上限を設ける）
+MAX_REQUIRED = 8
+
+
+def _coverage(df: pd.DataFrame, required: list[str]) -> np.ndarray:
+    """装備ごとの必須カテゴリ充足ビットマスク（bit i = required[i] を含む）"""
+    categories = df["アビリティカテゴリ"].astype(object)
+    coverage = np.zeros(len(df), dtype=np.int64)
+    for bit, option in enumerate(required):
+        hit = categories.map(lambda value, option=option: isinstance(value, str) and option in value)
+        coverage |= hit.to_numpy(dtype=bool).astype(np.int64) << bit
+    return coverage
+
+
+def _prepare_slot(df: pd.DataFrame, weights: dict, required: list[str], rarities, k: int) -> dict:
+    """1枠分の候補（評価値の降順、パレート枝刈り済み）"""
+    if rarities is not None:
+        df = df[df["レアリティ"].isin(list(rarities))]
+    values = np.zeros(len(df))
+    for col, weight in weights.items():
+        if weight:
+            values += weight * pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float)
+    coverage = _coverage(df, required)
+
+    # 評価値の降順に見て、充足が包含する装備が既に k 個以上あれば除外（それらで置き換えた組み合わせの方が上位）
+    kept = []
+    for pos in np.argsort(-values, kind="stable"):
+        cov = coverage[pos]
+        dominators = 0
+        for other in kept:
+            if coverage[other] & cov == cov:
+                dominators += 1
+                if dominators >= k:
+                    break
+        if dominators < k:
+            kept.append(pos)
+
+    kept = np.array(kept, dtype=np.int64)
+    return {
+        "rows": df.index.to_numpy()[kept] if len(kept) else np.array([], dtype=df.index.dtype),
+        "values": values[kept] if len(kept) else np.array([]),
+        "coverage": coverage[kept] if len(kept) else np.array([], dtype=np.int64),
+        "candidates": len(df),
+    }
+
+
+def top_loadouts(
+    weapon_df: pd.DataFrame,
+    armor_df: pd.DataFrame,
+    accessory_df: pd.DataFrame,
+    weights: dict | None = None,
+    required: list[str] | None = None,
+    rarities=None,
+    k: int = 5,
+) -> pd.DataFrame:
+    """
+    評価値の上位 k 件の組み合わせ
+    戻り値の列: 順位, 評価値, 武器, 防具, 装飾（装備名 [レアリティ]）, ステータス6種の合計,
+               武器_index / 防具_index / 装飾_index（元の DataFrame の index）
+    必須カテゴリを満たす組み合わせがなければ空の DataFrame
+    """
+    weights = {col: float(w) for col, w in (weights or DEFAULT_WEIGHTS).items() if col in WEIGHT_COLUMNS}
+    required = list(dict.fromkeys(required or []))
+    if len(required) > MAX_REQUIRED:
+        raise ValueError(f"必須アビリティカテゴリは {MAX_REQUIRED} 個までです（指定: {len(required)} 個）")
+    k = max(int(k), 1)
+    frames = [weapon_df, armor_df, accessory_df]
+    weapon, armor, accessory = (_prepare_slot(df, weights, required, rarities, k) for df in frames)
+
+    full = (1 << len(required)) - 1
+    masks = range(full + 1)
+    neg_inf = float("-inf")
+
+    # 装飾: 未充足マスクごとに、それを満たす候補（評価値の降順）と最大値
+    acc_values, acc_cov = accessory["values"], accessory["coverage"]
+    acc_by_need = {m: [p for p in range(len(acc_values)) if acc_cov[p] & m == m] for m in masks}
+    acc_best = {m: (acc_values[lst[0]] if lst else neg_inf) for m, lst in acc_by_need.items()}
+
+    # 防具＋装飾: 武器の後で未充足のマスクごとの上限
+    arm_values, arm_cov = armor["values"], armor["coverage"]
+    arm_acc_best = {}
+    for m in masks:
+        best = neg_inf
+        for j in range(len(arm_values)):
+            best = max(best, arm_values[j] + acc_best[m & ~int(arm_cov[j])])
+        arm_acc_best[m] = best
+    arm_acc_any = max(arm_acc_best.values()) if arm_acc_best else neg_inf
+    acc_any = max(acc_best.values()) if acc_best else neg_inf
+
+    # 上位 k 件（最小ヒープ）。同点は先に見つかった方を残す
+    heap: list[tuple[float, int, tuple[int, int, int]]] = []
+    counter = 0
+    threshold = neg_inf
+    weap_values, weap_cov = weapon["values"], weapon["coverage"]
+    for i in range(len(weap_values)):
+        if weap_values[i] + arm_acc_any <= threshold:
+            break
+        need_w = full & ~int(weap_cov[i])
+        if weap_values[i] + arm_acc_best[need_w] <= threshold:
+            continue
+        for j in range(len(arm_values)):
+            base = weap_values[i] + arm_values[j]
+            if base + acc_any <= threshold:
+                break
+            need = need_w & ~int(arm_cov[j])
+            if base + acc_best[need] <= threshold:
+                continue
+            for p in acc_by_need[need]:
+                score = base + acc_values[p]
+                if score <= threshold:
+                    break
+                entry = (score, -counter, (i, j, p))
+                counter += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heapreplace(heap, entry)
+                if len(heap) == k:
+                    threshold = heap[0][0]
+
+    results = sorted(heap, reverse=True)
+    return _loadout_frame(results, frames, (weapon, armor, accessory))
+
+
+def _loadout_frame(results: list, frames: list[pd.DataFrame], slots: tuple) -> pd.DataFrame:
+    columns = ["順位", "評価値", *SLOT_NAMES, *STATUS_COLUMNS, *[f"{name}_index" for name in SLOT_NAMES]]
+    rows = []
+    for rank, (score, _, positions) in enumerate(results, 1):
+        row = {"順位": rank, "評価値": round(float(score), 3)}
+        totals = dict.fromkeys(STATUS_COLUMNS, 0.0)
+        for name, df, slot, pos in zip(SLOT_NAMES, frames, slots, positions):
+            item = df.loc[slot["rows"][pos]]
+            row[name] = f"{item['装備名']} [{item['レアリティ']}]"
+            row[f"{name}_index"] = slot["rows"][pos]
+            for col in STATUS_COLUMNS:
+                value = pd.to_numeric(item[col], errors="coerce")
+                totals[col] += 0.0 if pd.isna(value) else float(value)
+        row.update(totals)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,326 @@
+"""
+パイプライン各ステップの実行メトリクス計測
+- 壁時計時間・CPU時間・ピークRSS・SQL実行回数・変更行数をステップ単位で計測
+  - ピークRSSはそのステップ実行中の最大値（プロセス起動からの最大値ではない）
+- 結果は pipeline_run_metrics テーブルに追記（任意で JSON にも出力）し、日ごとの性能劣化を追えるようにする
+
+使い方:
+    records = []
+    with measure_stage("05_create_mart_master", conn, records) as record:
+        ...
+    record["status"] = "ok"
+    save_metrics(conn, records, run_name="reload-db")
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows ではピークRSS/子プロセスCPUを計測しない
+    resource = None
+
+METRICS_TABLE = "pipeline_run_metrics"
+JST = timezone(timedelta(hours=9))
+# ステップ実行中に RSS を読む間隔（秒）
+RSS_SAMPLE_INTERVAL_SEC = 0.05
+_STATM_PATH = Path("/proc/self/statm")
+
+METRIC_COLUMNS = [
+    ("run_id", "TEXT NOT NULL"),
+    ("run_name", "TEXT"),
+    ("stage", "TEXT NOT NULL"),
+    ("status", "TEXT"),
+    ("started_at", "TEXT"),
+    ("wall_sec", "REAL"),
+    ("cpu_sec", "REAL"),
+    ("peak_rss_mb", "REAL"),
+    ("query_count", "INTEGER"),
+    ("rows_touched", "INTEGER"),
+]
+
+# 計測中のレコード（ネスト可）。SQL 実行回数・変更行数はここにあるもの全てに加算する
+_ACTIVE: list[dict] = []
+# SQL 実行・接続のたびに呼ぶ追加フック（sql_profiler など）。hook(event, sql) / event: "connect" or "statement"
+_HOOKS: list = []
+_ORIGINAL_CONNECT = sqlite3.connect
+_connect_hook_users = 0
+
+
+def new_run_id() -> str:
+    return datetime.now(JST).strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+# =========================
+# SQL 実行回数・変更行数
+# =========================
+def _on_statement(sql: str) -> None:
+    for record in _ACTIVE:
+        record["query_count"] += 1
+    for hook in _HOOKS:
+        hook("statement", sql)
+
+
+def _rows_since_baseline(conn: sqlite3.Connection, baseline: int) -> int:
+    try:
+        return conn.total_changes - baseline
+    except sqlite3.ProgrammingError:  # close 済み
+        return 0
+
+
+class _MeteredConnection(sqlite3.Connection):
+    """計測中に開かれた接続。close 時に変更行数を計測中レコードへ反映する"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_on_statement)
+        for record in _ACTIVE:
+            record["_conns"].append((self, 0))
+        for hook in _HOOKS:
+            hook("connect", None)
+
+    def close(self):
+        for record in _ACTIVE:
+            kept = []
+            for tracked, base in record["_conns"]:
+                if tracked is self:
+                    record["rows_touched"] += _rows_since_baseline(self, base)
+                else:
+                    kept.append((tracked, base))
+            record["_conns"] = kept
+        super().close()
+
+
+def _metered_connect(*args, **kwargs):
+    kwargs.setdefault("factory", _MeteredConnection)
+    return _ORIGINAL_CONNECT(*args, **kwargs)
+
+
+def _acquire_connect_hook() -> None:
+    global _connect_hook_users
+    _connect_hook_users += 1
+    sqlite3.connect = _metered_connect
+
+
+def _release_connect_hook() -> None:
+    global _connect_hook_users
+    _connect_hook_users -= 1
+    if _connect_hook_users == 0:
+        sqlite3.connect = _ORIGINAL_CONNECT
+
+
+def watch_connection(conn: sqlite3.Connection) -> None:
+    """既に開いている接続を計測対象にする（SQL 実行時に計測・フックが呼ばれる）"""
+    conn.set_trace_callback(_on_statement)
+
+
+def add_hook(hook) -> None:
+    """以降に開かれる接続の SQL 実行・接続のたびに hook(event, sql) を呼ぶ"""
+    _HOOKS.append(hook)
+    _acquire_connect_hook()
+
+
+def remove_hook(hook) -> None:
+    _HOOKS.remove(hook)
+    _release_connect_hook()
+
+
+# =========================
+# CPU・メモリ
+# =========================
+def _children_cpu_sec() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _maxrss_mb() -> tuple[float, float] | None:
+    """(プロセス, 終了済み子プロセス) の起動からのピークRSS（MB）。Linux は KB、macOS は byte 単位"""
+    if resource is None:
+        return None
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    )
+
+
+def _current_rss_mb() -> float | None:
+    """現在のRSS（MB）。/proc がない環境（macOS・Windows）では None"""
+    try:
+        pages = int(_STATM_PATH.read_text().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class _RssSampler:
+    """ステップ実行中の RSS を一定間隔で読み、最大値を持つ（/proc がない環境では何もしない）"""
+
+    def __init__(self):
+        self.peak = _current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _sample(self) -> None:
+        rss = _current_rss_mb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL_SEC):
+            self._sample()
+
+    def stop(self) -> float | None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._sample()
+        return self.peak
+
+
+def _stage_peak_rss_mb(sampled: float | None, maxrss_start: tuple[float, float] | None) -> float | None:
+    """
+    ステップ実行中のピークRSS（MB）
+    - 基本はサンプリングした最大値
+    - ru_maxrss（起動からの最大値）がステップ中に更新されていれば、それがステップ中の最大値なので採用する
+      （サンプリング間隔より短い山や、ステップ中に終了した子プロセスの分も拾える）
+    - 起動からの最大値を超えない短い山（RSS_SAMPLE_INTERVAL_SEC 未満）は取りこぼすことがある
+    - どちらも得られない場合は None
+    """
+    peak = sampled
+    maxrss_end = _maxrss_mb()
+    if maxrss_start is not None and maxrss_end is not None:
+        for before, after in zip(maxrss_start, maxrss_end):
+            if after > before:
+                peak = after if peak is None else max(peak, after)
+    return None if peak is None else round(peak, 1)
+
+
+# =========================
+# 計測
+# =========================
+@contextmanager
+def measure_stage(stage: str, conn: sqlite3.Connection | None = None, records: list | None = None):
+    """
+    ブロック内の実行メトリクスを計測する
+    - conn: 共有接続（渡した場合はこの接続の SQL と変更行数も計測）
+    - ブロック内で sqlite3.connect された接続も自動で計測対象になる
+    - 戻り値の dict の status はブロック内で書き換え可（例外時は "failed"）
+    """
+    record = {
+        "stage": stage,
+        "status": "ok",
+        "started_at": datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S"),
+        "query_count": 0,
+        "rows_touched": 0,
+        "_conns": [],
+    }
+    if conn is not None:
+        record["_conns"].append((conn, conn.total_changes))
+        watch_connection(conn)
+
+    _ACTIVE.append(record)
+    _acquire_connect_hook()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time() + _children_cpu_sec()
+    maxrss_start = _maxrss_mb()
+    rss_sampler = _RssSampler()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "failed"
+        raise
+    finally:
+        record["wall_sec"] = round(time.perf_counter() - wall_start, 3)
+        record["cpu_sec"] = round(time.process_time() + _children_cpu_sec() - cpu_start, 3)
+        record["peak_rss_mb"] = _stage_peak_rss_mb(rss_sampler.stop(), maxrss_start)
+        for tracked, base in record.pop("_conns"):
+            record["rows_touched"] += _rows_since_baseline(tracked, base)
+        _ACTIVE.remove(record)
+        _release_connect_hook()
+        if conn is not None and not _ACTIVE and not _HOOKS:
+            conn.set_trace_callback(None)
+        if records is not None:
+            records.append(record)
+
+
+def merge_metrics(records: list[dict]) -> list[dict]:
+    """同じ stage のレコードを1件に集約（装備ごとに計測した HTML/PNG 生成など）"""
+    merged: dict[str, dict] = {}
+    for record in records:
+        current = merged.get(record["stage"])
+        if current is None:
+            merged[record["stage"]] = dict(record)
+            continue
+        for key in ("wall_sec", "cpu_sec"):
+            current[key] = round(current[key] + record[key], 3)
+        for key in ("query_count", "rows_touched"):
+            current[key] += record[key]
+        if record["peak_rss_mb"] is not None:
+            current["peak_rss_mb"] = max(current["peak_rss_mb"] or 0, record["peak_rss_mb"])
+        if record["status"] != "ok":
+            current["status"] = record["status"]
+    return list(merged.values())
+
+
+# =========================
+# 保存・表示
+# =========================
+def ensure_metrics_table(conn: sqlite3.Connection) -> None:
+    column_defs = ",\n".join(f"    {col} {sql_type}" for col, sql_type in METRIC_COLUMNS)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS "{METRICS_TABLE}" (\n{column_defs}\n)')
+
+
+def save_metrics(
+    conn: sqlite3.Connection | None,
+    records: list[dict],
+    run_name: str,
+    run_id: str | None = None,
+    json_path: str | Path | None = None,
+) -> str:
+    """
+    計測結果を pipeline_run_metrics に追記（json_path 指定時は JSON にも出力）。戻り値: run_id
+    conn が None のときは DB に書かない（JSON のみ）
+    """
+    run_id = run_id or new_run_id()
+    rows = [{**record, "run_id": run_id, "run_name": run_name} for record in records]
+    columns = [col for col, _ in METRIC_COLUMNS]
+
+    if conn is not None:
+        ensure_metrics_table(conn)
+        conn.executemany(
+            f'INSERT INTO "{METRICS_TABLE}" ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})',
+            [tuple(row.get(col) for col in columns) for row in rows],
+        )
+        conn.commit()
+
+    if json_path:
+        Path(json_path).write_text(
+            json.dumps([{col: row.get(col) for col in columns} for row in rows], ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+    return run_id
+
+
+def print_metrics(records: list[dict]) -> None:
+    print(f"{'stage':<36} {'status':<8} {'wall':>8} {'cpu':>8} {'rss(MB)':>8} {'SQL':>7} {'rows':>7}")
+    for r in records:
+        rss = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+        print(
+            f"{r['stage']:<36} {r['status']:<8} {r['wall_sec']:>7.2f}s {r['cpu_sec']:>7.2f}s "
+            f"{rss:>8} {r['query_count']:>7} {r['rows_touched']:>7}"
+        )
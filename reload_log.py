@@ -1,11 +1,15 @@
 import sqlite3
+from contextlib import closing
+
 import pandas as pd
 import streamlit as st
 
+from equipment_search import has_search_index, search_equipments
+
 def load_log():
     """ログテーブルの更新履歴を読み込み"""
     try:
-        with sqlite3.connect("ryuon_equipments.db") as conn:
+        with closing(sqlite3.connect("ryuon_equipments.db")) as conn:
             # SQLiteでdatetime()に変換してORDER
             query = 'SELECT * FROM load_log ORDER BY datetime("更新日時") DESC;'
             df = pd.read_sql(query, conn)
@@ -21,7 +25,7 @@ def load_log():
 def load_scraiping():
     """スクレイピング結果の更新履歴を読み込み"""
     try:
-        with sqlite3.connect("ryuon_equipments.db") as conn:
+        with closing(sqlite3.connect("ryuon_equipments.db")) as conn:
             # SQLiteでdatetime()に変換してORDER
             query = 'SELECT * FROM src_equipments ORDER BY URL_Number DESC;'
             df = pd.read_sql(query, conn)
@@ -31,6 +35,20 @@ def load_scraiping():
         df = pd.DataFrame()
     return df
 
+def filter_by_name(df, search_word):
+    """
+    装備名の部分一致で絞り込み（入力全体を1つの文字列として大文字・小文字を区別して探す）
+    - equipment_search の trigram インデックスがあれば候補を絞ってから str.contains で確かめる
+      （trigram の MATCH・LIKE は英字の大文字・小文字を区別せず、空白区切りの語の AND なので候補は広めに出る）
+    """
+    with closing(sqlite3.connect("ryuon_equipments.db")) as conn:
+        if not search_word.split() or not has_search_index(conn):
+            return df[df["装備名"].str.contains(search_word, regex=False, na=False)]
+        hits = search_equipments(conn, search_word, columns=["装備名"])
+    keys = set(zip(hits["装備名"], hits["レアリティ"]))
+    candidates = df[[key in keys for key in zip(df["装備名"], df["レアリティ"])]]
+    return candidates[candidates["装備名"].str.contains(search_word, regex=False, na=False)]
+
 def load_equipments_data():
     """SQLite DB からデータを読み込む"""
     conn = sqlite3.connect("ryuon_equipments.db")
@@ -95,9 +113,9 @@ def main():
         df = load_scraiping()
         search_word = st.text_input("装備名で検索", "")
 
-        # 入力がある場合は部分一致でフィルター
+        # 入力がある場合は部分一致でフィルター（検索インデックスがあれば FTS5 で検索）
         if search_word:
-            df = df[df["装備名"].str.contains(search_word, na=False)]
+            df = filter_by_name(df, search_word)
         if not df.empty:
             st.dataframe(df, use_container_width=True)
         else:
@@ -0,0 +1,194 @@
+"""
+カテゴリ重要度を変えたときのアビリティスコアの試算
+- アビリティスコア = (カテゴリ重要度 + 効果量スコア) × 発動倍率 × 0.5 で、重みを変えても変わるのは重要度だけ
+- mart_equipments を evaluate_abilities で1回評価し、(装備, カテゴリ) ごとの効果量スコア・発動倍率を配列で保持
+  新しい重み（カテゴリごとの重要度ベクトル）は全装備に配列演算1回で適用する
+  - 複数カテゴリの装備は evaluate_ability と同じく (重要度, 評価点) が最大のカテゴリを代表にする（重みで代表が変わりうる）
+- 現在の設定との比較で、装備種類内のアビリティスコア順位がどう動くかを表示する
+
+使い方:
+    python rescore_abilities.py --set BSCT加速=80 --set 不死=95
+    python rescore_abilities.py --settings 試案.csv --top 30
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ability_evaluator import (
+    DB_FILE,
+    CategorySettings,
+    category_settings,
+    category_settings_version,
+    evaluate_abilities,
+    load_ability_parsed,
+    load_category_settings_file,
+    parsed_condition,
+)
+from change_markers import table_fingerprints
+
+KEY_COLUMNS = ["装備名", "レアリティ", "装備種類"]
+
+# DB パス -> ((mart_equipments のフィンガープリント, カテゴリ設定のバージョン), 配列)
+_ARRAYS_CACHE: dict[str, tuple[tuple[str | None, str], dict]] = {}
+
+
+# =========================
+# 配列
+# =========================
+def build_rescore_arrays(conn: sqlite3.Connection) -> dict:
+    """
+    mart_equipments から再計算用の配列を作成
+    - keys: 装備ごとの (装備名, レアリティ, 装備種類)
+    - categories: カテゴリ名の一覧（重みベクトルの並び）
+    - owner / category_index / effect_score / condition_rate: (装備, カテゴリ) ごと
+    - scores / settings: 作成時の設定で evaluate_abilities を実行したスコアとその設定（check_rescore で照合する）
+    """
+    mart = pd.read_sql(
+        "SELECT 装備名, レアリティ, 装備種類, アビリティ, アビリティカテゴリ FROM mart_equipments", conn
+    )
+    settings = category_settings()
+    results = evaluate_abilities(mart, conn, settings)
+    # 結果の condition_rate は丸め済みなので、スコア計算と同じ丸める前の発動倍率を取り直す
+    parsed = load_ability_parsed(conn)
+
+    categories: list[str] = []
+    category_pos: dict[str, int] = {}
+    owner, category_index, effect_score, condition_rate = [], [], [], []
+    for row, (ability_text, breakdown) in enumerate(zip(mart["アビリティ"], results["category_breakdown"])):
+        if not breakdown:
+            continue
+        rate = parsed_condition(parsed, ability_text)[0]
+        for item in breakdown:
+            category = item["category"]
+            if category not in category_pos:
+                category_pos[category] = len(categories)
+                categories.append(category)
+            owner.append(row)
+            category_index.append(category_pos[category])
+            effect_score.append(item["effect_score"])
+            condition_rate.append(rate)
+
+    return {
+        "keys": mart[KEY_COLUMNS].reset_index(drop=True),
+        "categories": categories,
+        "owner": np.array(owner, dtype=np.int64),
+        "category_index": np.array(category_index, dtype=np.int64),
+        "effect_score": np.array(effect_score, dtype=float),
+        "condition_rate": np.array(condition_rate, dtype=float),
+        "scores": results["score"].to_numpy(dtype=float),
+        "settings": settings,
+    }
+
+
+def load_rescore_arrays(db_path: str = DB_FILE) -> dict:
+    """配列を取得（mart_equipments の内容とカテゴリ設定が変わるまでプロセス内で再利用）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        key = (table_fingerprints(conn, ["mart_equipments"])["mart_equipments"], category_settings_version())
+        cached = _ARRAYS_CACHE.get(db_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        arrays = build_rescore_arrays(conn)
+    finally:
+        conn.close()
+    _ARRAYS_CACHE[db_path] = (key, arrays)
+    return arrays
+
+
+def weight_vector(arrays: dict, settings: CategorySettings, overrides: dict[str, float] | None = None) -> np.ndarray:
+    """arrays["categories"] の並びの重要度ベクトル（overrides で個別に上書き）"""
+    overrides = overrides or {}
+    return np.array(
+        [overrides.get(cat, settings.importance(cat)) for cat in arrays["categories"]],
+        dtype=float,
+    )
+
+
+# =========================
+# 再計算
+# =========================
+def rescore(arrays: dict, weights: np.ndarray) -> np.ndarray:
+    """
+    重要度ベクトルを全装備に適用したアビリティスコア（装備ごと、アビリティなしは 0）
+    evaluate_ability と同じく代表カテゴリ＝(重要度, 評価点) が最大のカテゴリ、スコアは小数2桁に丸める
+    （丸めは Python の round。np.round とは 43.225 などの端数で結果が変わる）
+    """
+    scores = np.zeros(len(arrays["keys"]))
+    owner = arrays["owner"]
+    if not len(owner):
+        return scores
+    importance = weights[arrays["category_index"]]
+    pair_score = (importance + arrays["effect_score"]) * arrays["condition_rate"] * 0.5
+    # 装備ごとに (重要度, 評価点) の昇順に並べ、各装備の最後の行が代表
+    order = np.lexsort((pair_score, importance, owner))
+    last = np.r_[owner[order][1:] != owner[order][:-1], True]
+    representative = order[last]
+    scores[owner[representative]] = [round(score, 2) for score in pair_score[representative].tolist()]
+    return scores
+
+
+def check_rescore(arrays: dict) -> int:
+    """作成時の設定の重要度ベクトルで再計算し、evaluate_abilities のスコアと一致しない装備の件数を返す"""
+    scores = rescore(arrays, weight_vector(arrays, arrays["settings"]))
+    return int((scores != arrays["scores"]).sum())
+
+
+def rank_changes(arrays: dict, base_scores: np.ndarray, new_scores: np.ndarray) -> pd.DataFrame:
+    """装備種類内のアビリティスコア順位（同点は同順位）の変化。順位が動いた装備を変動の大きい順に"""
+    df = arrays["keys"].copy()
+    df["旧スコア"] = base_scores
+    df["新スコア"] = new_scores
+    by_type = df.groupby("装備種類")
+    df["旧順位"] = by_type["旧スコア"].rank(method="min", ascending=False).astype(int)
+    df["新順位"] = by_type["新スコア"].rank(method="min", ascending=False).astype(int)
+    df["順位変動"] = df["旧順位"] - df["新順位"]
+    changed = df[df["順位変動"] != 0]
+    return changed.reindex(changed["順位変動"].abs().sort_values(ascending=False, kind="stable").index).reset_index(drop=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="カテゴリ重要度を変えたときのアビリティスコア・順位の試算")
+    parser.add_argument("--settings", default=None, help="試算に使うカテゴリ設定CSV（省略時は現在の設定）")
+    parser.add_argument("--set", action="append", default=[], metavar="カテゴリ=重要度", help="例: --set BSCT加速=80")
+    parser.add_argument("--top", type=int, default=20, help="表示する件数（順位変動の大きい順）")
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.set:
+        category, _, value = item.partition("=")
+        try:
+            overrides[category.strip()] = float(value)
+        except ValueError:
+            parser.error(f"重要度が数値ではありません: {item}")
+
+    base_settings = category_settings()
+    new_settings = load_category_settings_file(Path(args.settings)) if args.settings else base_settings
+
+    arrays = load_rescore_arrays()
+    mismatched = check_rescore(arrays)
+    if mismatched:
+        print(f"⚠️  現在の設定での再計算が evaluate_abilities の結果と {mismatched}件一致しません（試算結果は参考値）")
+    unknown = [cat for cat in overrides if cat not in arrays["categories"]]
+    if unknown:
+        print(f"⚠️  mart に存在しないカテゴリ（無視）: {', '.join(unknown)}")
+
+    base_weights = weight_vector(arrays, base_settings)
+    new_weights = weight_vector(arrays, new_settings, overrides)
+    base_scores = rescore(arrays, base_weights)
+    # 重要度ベクトルが同じならスコアも同じ
+    new_scores = base_scores if np.array_equal(base_weights, new_weights) else rescore(arrays, new_weights)
+    changes = rank_changes(arrays, base_scores, new_scores)
+
+    changed_scores = int((base_scores != new_scores).sum())
+    print(f"スコアが変わった装備: {changed_scores}件 / 順位が動いた装備: {len(changes)}件（全 {len(base_scores)}件）")
+    if not changes.empty:
+        print(changes.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
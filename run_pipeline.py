@@ -0,0 +1,366 @@
+"""
+DB更新パイプライン（01〜07＋サムネイル生成）を1プロセス・1接続で実行する
+- 各ステップの入力/出力フィンガープリントを pipeline_stage_state テーブルに記録
+- 入力が前回成功時から変わっておらず、出力も前回のままのステップはスキップする
+  （ニュース更新なし・シート変更なしの日は数秒で終わる）
+- ステップごとの実行メトリクス（時間・CPU・RSS・SQL回数・変更行数）を pipeline_run_metrics に追記
+
+使い方:
+    python run_pipeline.py                 # 全ステップ（スキップ判定あり）
+    python run_pipeline.py --force         # スキップ判定なしで全ステップ実行
+    python run_pipeline.py --stages 05 06  # 指定ステップのみ
+    python run_pipeline.py --metrics-json metrics.json  # メトリクスを JSON にも出力
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import thumbnails
+from change_markers import table_fingerprints
+from pipeline_metrics import measure_stage, print_metrics, save_metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+DB_PATH = BASE_DIR / "ryuon_equipments.db"
+STATE_TABLE = "pipeline_stage_state"
+JST = timezone(timedelta(hours=9))
+
+# 01 は従来の timeout 120s 相当で打ち切る
+SCRAPE_TIME_BUDGET_SEC = 110
+
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+
+# =========================
+# フィンガープリント
+# =========================
+def _digest(value) -> str | None:
+    if value is None:
+        return None
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _file_digest(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _confirmed_tables(conn: sqlite3.Connection) -> list[str]:
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'confirmed_%' ORDER BY name"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _source_tables(conn: sqlite3.Connection) -> list[str]:
+    """mart_equipments の元テーブル（confirmed_* + unconfirmed_equipments）"""
+    return _confirmed_tables(conn) + ["unconfirmed_equipments"]
+
+
+def _scrape_inputs(conn: sqlite3.Connection):
+    # ニュース一覧の掲載IDが変わらなければスクレイピング範囲も変わらない
+    scrape = _stage_module("01_scrape_equipment")
+    return {"news_ids": scrape.get_news_ids()}
+
+
+def _src_inputs(conn: sqlite3.Connection):
+    return table_fingerprints(conn, ["src_equipments"])
+
+
+def _export_inputs(conn: sqlite3.Connection):
+    return table_fingerprints(conn, ["src_equipments", *_source_tables(conn)])
+
+
+def _mart_inputs(conn: sqlite3.Connection):
+    return table_fingerprints(conn, _source_tables(conn))
+
+
+def _mart_outputs(conn: sqlite3.Connection):
+    return table_fingerprints(conn, ["mart_equipments", "ability_parsed"])
+
+
+def _load_log_inputs(conn: sqlite3.Connection):
+    return _stage_module("06_update_load_log").fetch_counts(conn)
+
+
+def _load_log_outputs(conn: sqlite3.Connection):
+    return {"load_log.csv": _file_digest(_stage_module("06_update_load_log").CSV_PATH)}
+
+
+def _thumbnail_inputs(conn: sqlite3.Connection):
+    # 装備画像の一覧（ファイル名・サイズ）。内容の比較は build_thumbnails 側で sha256 で行う
+    static_dir = BASE_DIR / "static"
+    return {
+        p.name: p.stat().st_size
+        for p in static_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in thumbnails.IMAGE_SUFFIXES
+    }
+
+
+def _thumbnail_outputs(conn: sqlite3.Connection):
+    return {"manifest": _file_digest(thumbnails.manifest_path(BASE_DIR / thumbnails.THUMB_DIR))}
+
+
+def _vacuum_inputs(conn: sqlite3.Connection):
+    # いずれかのテーブル内容が変わった or 空きページがある場合のみ VACUUM
+    tables = ["src_equipments", "mst_ability_category", "mart_equipments", *_source_tables(conn)]
+    return {
+        "tables": table_fingerprints(conn, tables),
+        "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+
+
+# =========================
+# ステップ定義
+# =========================
+def _stage_module(module_name: str):
+    # 01_〜07_ はファイル名が数字始まりのため importlib で読み込む（スキップ時は import しない）
+    return importlib.import_module(module_name)
+
+
+def _run_scrape(conn: sqlite3.Connection, inputs: dict):
+    # ニュース一覧は入力の判定で取得済みのものを使う（1回の実行で取得は1回）
+    scrape = _stage_module("01_scrape_equipment")
+    return scrape.run(
+        conn,
+        os.getenv("NOW_BRANCH"),
+        time_budget_sec=SCRAPE_TIME_BUDGET_SEC,
+        news_ids=inputs["news_ids"],
+    )
+
+
+def _run_rebuild_src(conn: sqlite3.Connection):
+    _stage_module("02_index_drop_db").run(conn)
+
+
+def _run_reload_sheets(conn: sqlite3.Connection):
+    _stage_module("03_reload_ss_to_db").run(conn)
+
+
+def _run_export_unconfirmed(conn: sqlite3.Connection):
+    # GitHub Actions と同じく --no-write-db 相当（シートのみ更新）
+    _stage_module("04_export_unconfirmed_to_gsheet").run(conn, static_dir=BASE_DIR / "static", write_db=False)
+
+
+def _run_create_mart(conn: sqlite3.Connection):
+    _stage_module("05_create_mart_master").create_mart_equipments(conn)
+
+
+def _run_create_mart_full(conn: sqlite3.Connection):
+    _stage_module("05_create_mart_master").create_mart_equipments(conn, full_refresh=True)
+
+
+def _run_update_load_log(conn: sqlite3.Connection):
+    _stage_module("06_update_load_log").main(conn)
+
+
+def _run_vacuum(conn: sqlite3.Connection):
+    _stage_module("07_vacuum_db").vacuum_database(conn)
+
+
+def _run_build_thumbnails(conn: sqlite3.Connection):
+    stats = thumbnails.build_thumbnails(BASE_DIR / thumbnails.STATIC_DIR, BASE_DIR / thumbnails.THUMB_DIR)
+    print(f"サムネイル: 作成 {stats['created']}件 / 再利用 {stats['kept']}件 / 削除 {stats['removed']}件")
+    # 失敗した画像があれば次回もう一度試す
+    return not stats["failed"]
+
+
+# inputs が None のステップは毎回実行（03: シート側の変更を事前に検知できないため）
+# rewrites_inputs: 自分の入力を書き換えるステップ（02/07）は実行後の入力を記録する
+# run_full: 出力が前回から変わっていた場合（手作業での変更など）や --force 時に使う実行関数
+# pass_inputs: 実行関数に inputs の結果も渡す（01: 取得したニュース一覧をそのまま使う）
+STAGES = [
+    {"id": "01", "name": "01_scrape_equipment", "inputs": _scrape_inputs, "outputs": None,
+     "run": _run_scrape, "allow_failure": True, "pass_inputs": True},
+    {"id": "02", "name": "02_index_drop_db", "inputs": _src_inputs, "outputs": None,
+     "run": _run_rebuild_src, "allow_failure": False, "rewrites_inputs": True},
+    {"id": "03", "name": "03_reload_ss_to_db", "inputs": None, "outputs": None,
+     "run": _run_reload_sheets, "allow_failure": False},
+    {"id": "04", "name": "04_export_unconfirmed_to_gsheet", "inputs": _export_inputs, "outputs": None,
+     "run": _run_export_unconfirmed, "allow_failure": False},
+    {"id": "05", "name": "05_create_mart_master", "inputs": _mart_inputs, "outputs": _mart_outputs,
+     "run": _run_create_mart, "run_full": _run_create_mart_full, "allow_failure": False},
+    {"id": "06", "name": "06_update_load_log", "inputs": _load_log_inputs, "outputs": _load_log_outputs,
+     "run": _run_update_load_log, "allow_failure": False},
+    {"id": "07", "name": "07_vacuum_db", "inputs": _vacuum_inputs, "outputs": None,
+     "run": _run_vacuum, "allow_failure": False, "rewrites_inputs": True},
+    {"id": "08", "name": "08_build_thumbnails", "inputs": _thumbnail_inputs, "outputs": _thumbnail_outputs,
+     "run": _run_build_thumbnails, "allow_failure": True},
+]
+
+
+# =========================
+# 実行状態
+# =========================
+def ensure_state_table(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{STATE_TABLE}" (
+            stage TEXT PRIMARY KEY,
+            input_fingerprint TEXT,
+            output_fingerprint TEXT,
+            status TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT
+        )
+        """
+    )
+    conn.commit()
+
+
+def load_stage_state(conn: sqlite3.Connection, stage: str) -> dict | None:
+    row = conn.execute(
+        f'SELECT input_fingerprint, output_fingerprint, status FROM "{STATE_TABLE}" WHERE stage = ?',
+        (stage,),
+    ).fetchone()
+    if row is None:
+        return None
+    return {"input_fingerprint": row[0], "output_fingerprint": row[1], "status": row[2]}
+
+
+def save_stage_state(
+    conn: sqlite3.Connection,
+    stage: str,
+    input_fp: str | None,
+    output_fp: str | None,
+    status: str,
+    started_at: str,
+) -> None:
+    conn.execute(
+        f"""
+        INSERT INTO "{STATE_TABLE}" (stage, input_fingerprint, output_fingerprint, status, started_at, finished_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(stage) DO UPDATE SET
+            input_fingerprint = excluded.input_fingerprint,
+            output_fingerprint = excluded.output_fingerprint,
+            status = excluded.status,
+            started_at = excluded.started_at,
+            finished_at = excluded.finished_at
+        """,
+        (stage, input_fp, output_fp, status, started_at, _now()),
+    )
+    conn.commit()
+
+
+def _now() -> str:
+    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def should_skip(stage: dict, state: dict | None, input_fp: str | None, output_fp: str | None) -> bool:
+    """前回成功時と入力・出力のフィンガープリントが一致すればスキップ"""
+    if stage["inputs"] is None or input_fp is None or state is None:
+        return False
+    if state["status"] != STATUS_OK:
+        return False
+    return state["input_fingerprint"] == input_fp and state["output_fingerprint"] == output_fp
+
+
+# =========================
+# main
+# =========================
+def run_stage(conn: sqlite3.Connection, stage: dict, force: bool = False) -> str:
+    """1ステップ実行。戻り値: ok / partial / failed / skipped"""
+    started_at = _now()
+    started = time.perf_counter()
+
+    input_fp = None
+    outputs_fn = stage["outputs"]
+    try:
+        inputs = stage["inputs"](conn) if stage["inputs"] else None
+        input_fp = _digest(inputs) if stage["inputs"] else None
+        run_fn = stage["run"]
+        if force:
+            run_fn = stage.get("run_full", run_fn)
+        else:
+            state = load_stage_state(conn, stage["name"])
+            output_fp = _digest(outputs_fn(conn)) if outputs_fn else None
+            if should_skip(stage, state, input_fp, output_fp):
+                print(f"⏭  {stage['name']}: 入力・出力とも前回から変更なしのためスキップ")
+                return STATUS_SKIPPED
+            if state is not None and output_fp != state["output_fingerprint"]:
+                print(f"⚠️  {stage['name']}: 出力が前回実行時から変わっています")
+                run_fn = stage.get("run_full", run_fn)
+
+        print(f"\n▶ {stage['name']}")
+        result = run_fn(conn, inputs) if stage.get("pass_inputs") else run_fn(conn)
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        if not stage["allow_failure"]:
+            raise
+        traceback.print_exc()
+        print(f"⚠️  {stage['name']} は失敗しましたが続行します")
+        save_stage_state(conn, stage["name"], input_fp, None, STATUS_FAILED, started_at)
+        return STATUS_FAILED
+
+    # run が False を返した場合（01 の時間切れ等）は次回スキップしない
+    status = STATUS_PARTIAL if result is False else STATUS_OK
+    if stage.get("rewrites_inputs"):
+        input_fp = _digest(stage["inputs"](conn))
+    output_fp = _digest(outputs_fn(conn)) if outputs_fn else None
+    save_stage_state(conn, stage["name"], input_fp, output_fp, status, started_at)
+    print(f"✓ {stage['name']}: {status} ({time.perf_counter() - started:.1f}s)")
+    return status
+
+
+def run_pipeline(
+    conn: sqlite3.Connection,
+    stage_ids: list[str] | None = None,
+    force: bool = False,
+    metrics: list | None = None,
+) -> dict[str, str]:
+    """metrics にリストを渡すとステップごとの計測結果を追加する"""
+    ensure_state_table(conn)
+    results = {}
+    for stage in STAGES:
+        if stage_ids and stage["id"] not in stage_ids and stage["name"] not in stage_ids:
+            continue
+        with measure_stage(stage["name"], conn, metrics) as record:
+            results[stage["name"]] = run_stage(conn, stage, force=force)
+            record["status"] = results[stage["name"]]
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="01〜08 を1プロセスで実行（変更のないステップはスキップ）")
+    parser.add_argument("--force", action="store_true", help="スキップ判定をせず全ステップを実行")
+    parser.add_argument("--stages", nargs="+", default=None, help="実行するステップ（例: 05 06 / 05_create_mart_master）")
+    parser.add_argument("--metrics-json", default=None, help="実行メトリクスの JSON 出力先（任意）")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    started = time.perf_counter()
+    metrics = []
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        run_pipeline(conn, stage_ids=args.stages, force=args.force, metrics=metrics)
+    finally:
+        # 失敗したステップも含めて記録する
+        if metrics:
+            save_metrics(conn, metrics, run_name="reload-db", json_path=args.metrics_json)
+        conn.close()
+
+    print("\n" + "=" * 60)
+    print(f"パイプライン完了 ({time.perf_counter() - started:.1f}s)")
+    print("=" * 60)
+    print_metrics(metrics)
+
+
+if __name__ == "__main__":
+    main()
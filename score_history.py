@@ -0,0 +1,329 @@
+"""
+スコア表の差分履歴（equipments_mart_score.db）
+- 日付ごとの全件テーブル（{yyyymmdd}_equipments_mart_score）の代わりに、最初の日の全件（ベース）と
+  以降の日ごとの行差分を (装備名, レアリティ) をキーに1つの履歴テーブルへ積む（保存量は変わった行数に比例）
+  - equipments_mart_score_history: スコア表の列＋history_date / history_op（upsert: 追加・変更、delete: 削除）/ row_hash
+  - equipments_mart_score_dates: 日付ごとの列一覧・行数・内容ダイジェスト・差分件数
+  - equipments_mart_score_latest: 最新日の全件（最新だけ読む側はこれを読む）
+- 任意の日付の表は reconstruct_score_table(conn, date) で復元（その日以前の、キーごとの最後の操作）
+  - 行順は 装備番号, 装備名, レアリティ 順（日付付きテーブルの行順は保存しない）
+- 既存の日付付きテーブルは migrate_dated_tables(conn) で履歴に取り込み、復元結果が一致したものだけ削除する
+
+使い方:
+    python score_history.py                   # 履歴の日付一覧
+    python score_history.py --date 20250101   # その日の表を復元して件数を表示
+    python score_history.py --migrate         # 日付付きテーブルを履歴に取り込む
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+from change_markers import JST, frame_digest, row_digests
+
+SCORE_DB = "equipments_mart_score.db"
+SCORE_SUFFIX = "equipments_mart_score"
+HISTORY_TABLE = "equipments_mart_score_history"
+DATES_TABLE = "equipments_mart_score_dates"
+LATEST_TABLE = "equipments_mart_score_latest"
+# 日付付きテーブルの内容ダイジェストの記録先（generate_equipment_mart_score_db.py と同じ）
+DIGEST_TABLE = "score_table_digests"
+
+KEY_COLUMNS = ["装備名", "レアリティ"]
+ORDER_COLUMNS = ["装備番号", "装備名", "レアリティ"]
+
+
+# =========================
+# テーブル
+# =========================
+def _table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=? LIMIT 1",
+        (table_name,),
+    ).fetchone()
+    return row is not None
+
+
+def _ensure_tables(conn: sqlite3.Connection) -> None:
+    # スコア表の列は書き込み時に足す（型は宣言せず、書いた値をそのまま持つ）
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{HISTORY_TABLE}" (
+            history_date TEXT NOT NULL,
+            history_op TEXT NOT NULL,
+            row_hash TEXT,
+            "装備名",
+            "レアリティ"
+        )
+        """
+    )
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_{HISTORY_TABLE}_key" ON "{HISTORY_TABLE}" ("装備名", "レアリティ", history_date)'
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS "{DATES_TABLE}" (
+            history_date TEXT PRIMARY KEY,
+            columns TEXT NOT NULL,
+            row_count INTEGER,
+            digest TEXT NOT NULL,
+            upserts INTEGER,
+            deletes INTEGER,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def _add_missing_columns(conn: sqlite3.Connection, columns: list[str]) -> None:
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info("{HISTORY_TABLE}")')}
+    for col in columns:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE "{HISTORY_TABLE}" ADD COLUMN "{col}"')
+
+
+def history_dates(conn: sqlite3.Connection) -> list[str]:
+    """履歴に記録されている日付（昇順）。履歴がなければ空"""
+    if not _table_exists(conn, DATES_TABLE):
+        return []
+    return [row[0] for row in conn.execute(f'SELECT history_date FROM "{DATES_TABLE}" ORDER BY history_date')]
+
+
+def _date_entry(conn: sqlite3.Connection, date: str, before: bool = False) -> dict | None:
+    """date 以前（before=True なら date より前）の最後の記録"""
+    if not _table_exists(conn, DATES_TABLE):
+        return None
+    op = "<" if before else "<="
+    row = conn.execute(
+        f"""
+        SELECT history_date, columns, digest
+        FROM "{DATES_TABLE}"
+        WHERE history_date {op} ?
+        ORDER BY history_date DESC
+        LIMIT 1
+        """,
+        (date,),
+    ).fetchone()
+    if row is None:
+        return None
+    return {"date": row[0], "columns": json.loads(row[1]), "digest": row[2]}
+
+
+def _last_ops_query(columns: str) -> str:
+    """キーごとに history_date <= ? の最後の操作を1行ずつ返す SQL"""
+    return f"""
+        SELECT {columns}
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY "装備名", "レアリティ" ORDER BY history_date DESC, rowid DESC
+            ) AS rn
+            FROM "{HISTORY_TABLE}"
+            WHERE history_date <= ?
+        )
+        WHERE rn = 1
+    """
+
+
+def _live_row_hashes(conn: sqlite3.Connection, date: str) -> dict[tuple, str]:
+    """date 時点で存在するキー -> 行ハッシュ（行の中身は読まない）"""
+    rows = conn.execute(_last_ops_query('"装備名", "レアリティ", history_op, row_hash'), (date,)).fetchall()
+    return {(name, rarity): row_hash for name, rarity, op, row_hash in rows if op == "upsert"}
+
+
+# =========================
+# 復元
+# =========================
+def reconstruct_score_table(conn: sqlite3.Connection, date: str) -> pd.DataFrame | None:
+    """
+    date（yyyymmdd）時点のスコア表を復元（その日に変更がなければ直前の変更日の内容）
+    date 以前の記録がなければ None
+    """
+    entry = _date_entry(conn, date)
+    if entry is None:
+        return None
+    select = ", ".join(f'"{col}"' for col in entry["columns"] + ["history_op"])
+    df = pd.read_sql(_last_ops_query(select), conn, params=(entry["date"],))
+    df = df[df["history_op"] == "upsert"].drop(columns="history_op")
+    order = [col for col in ORDER_COLUMNS if col in df.columns]
+    return df.sort_values(order, kind="stable").reset_index(drop=True)
+
+
+def read_latest_score_table(conn: sqlite3.Connection) -> pd.DataFrame | None:
+    """最新日のスコア表（equipments_mart_score_latest）。なければ None"""
+    if not _table_exists(conn, LATEST_TABLE):
+        return None
+    return pd.read_sql(f'SELECT * FROM "{LATEST_TABLE}"', conn)
+
+
+def _sql_rows(df: pd.DataFrame) -> list[tuple]:
+    """executemany 用の行（欠損は None、numpy の数値は Python の数値）"""
+    values = df.astype(object).where(df.notna(), None)
+    return [
+        tuple(v.item() if hasattr(v, "item") else v for v in row)
+        for row in values.itertuples(index=False, name=None)
+    ]
+
+
+def _insert_rows(conn: sqlite3.Connection, table_name: str, df: pd.DataFrame) -> None:
+    if df.empty:
+        return
+    columns = ", ".join(f'"{col}"' for col in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    conn.executemany(f'INSERT INTO "{table_name}" ({columns}) VALUES ({placeholders})', _sql_rows(df))
+
+
+def _write_latest(conn: sqlite3.Connection, df: pd.DataFrame) -> None:
+    # to_sql は途中で commit するため、列の型だけ pandas と同じにして自分で作る
+    conn.execute(f'DROP TABLE IF EXISTS "{LATEST_TABLE}"')
+    conn.execute(pd.io.sql.get_schema(df, LATEST_TABLE))
+    _insert_rows(conn, LATEST_TABLE, df)
+
+
+# =========================
+# 書き込み
+# =========================
+def write_score_history(conn: sqlite3.Connection, df: pd.DataFrame, date: str) -> dict:
+    """
+    date（yyyymmdd）のスコア表を履歴に書く
+    - 直前の日付と内容が同じなら何も書かない（同じ日の再実行で前回書いた差分は取り消す）
+    - 変わっていれば、追加・変更された行（upsert）と消えた行（delete）だけを書き、latest を置き換える
+    戻り値: {"changed": bool, "upserts": 件数, "deletes": 件数}
+    """
+    if df.duplicated(KEY_COLUMNS).any():
+        raise ValueError(f"スコア表の {KEY_COLUMNS} が重複しています")
+
+    # 差分・日付の記録・latest は1つのトランザクションで書く（途中で失敗したら何も残さない）
+    with conn:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        _ensure_tables(conn)
+        # 同じ日の再実行（前回が途中で失敗した場合も含む）: その日の差分を取り消してから直前の日付との差分を作り直す
+        rerun = conn.execute(f'DELETE FROM "{HISTORY_TABLE}" WHERE history_date = ?', (date,)).rowcount > 0
+        rerun = conn.execute(f'DELETE FROM "{DATES_TABLE}" WHERE history_date = ?', (date,)).rowcount > 0 or rerun
+
+        digest = frame_digest(df)
+        previous = _date_entry(conn, date, before=True)
+        if previous is not None and previous["digest"] == digest:
+            if rerun or not _table_exists(conn, LATEST_TABLE):
+                _write_latest(conn, reconstruct_score_table(conn, previous["date"]))
+            return {"changed": False, "upserts": 0, "deletes": 0}
+
+        live = _live_row_hashes(conn, previous["date"]) if previous is not None else {}
+        hashes = row_digests(df)
+        keys = list(zip(df["装備名"], df["レアリティ"]))
+        changed = [live.get(key) != row_hash for key, row_hash in zip(keys, hashes)]
+        current_keys = set(keys)
+        removed = [key for key in live if key not in current_keys]
+
+        columns = list(df.columns)
+        _add_missing_columns(conn, columns)
+        upserts = df[changed].copy()
+        upserts.insert(0, "history_date", date)
+        upserts.insert(1, "history_op", "upsert")
+        upserts.insert(2, "row_hash", hashes[changed].to_numpy())
+        _insert_rows(conn, HISTORY_TABLE, upserts)
+        conn.executemany(
+            f"""INSERT INTO "{HISTORY_TABLE}" (history_date, history_op, "装備名", "レアリティ") VALUES (?, 'delete', ?, ?)""",
+            [(date, name, rarity) for name, rarity in removed],
+        )
+        conn.execute(
+            f'INSERT INTO "{DATES_TABLE}" VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                date,
+                json.dumps(columns, ensure_ascii=False),
+                len(df),
+                digest,
+                len(upserts),
+                len(removed),
+                datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S"),
+            ),
+        )
+        _write_latest(conn, df)
+    return {"changed": True, "upserts": len(upserts), "deletes": len(removed)}
+
+
+# =========================
+# 移行
+# =========================
+def dated_score_tables(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+    """(日付, テーブル名) の日付昇順"""
+    pattern = re.compile(rf"^(\d{{8}})_{re.escape(SCORE_SUFFIX)}$")
+    tables = []
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"):
+        m = pattern.match(name)
+        if m:
+            tables.append((m.group(1), name))
+    return sorted(tables)
+
+
+def migrate_dated_tables(conn: sqlite3.Connection, drop: bool = True) -> list[str]:
+    """
+    日付付きのスコア表を日付順に履歴へ取り込む
+    - 履歴の最終日より後の日付だけ取り込む（それ以前のテーブルは残す）
+    - drop=True なら、復元した内容が元のテーブルと一致したテーブルだけ削除する
+    戻り値: 取り込んだテーブル名
+    """
+    migrated = []
+    for date, table_name in dated_score_tables(conn):
+        dates = history_dates(conn)
+        if dates and date <= dates[-1]:
+            if date not in dates:
+                print(f"⚠️  履歴の最終日（{dates[-1]}）より前のため取り込みません: {table_name}")
+                continue
+        else:
+            write_score_history(conn, pd.read_sql(f'SELECT * FROM "{table_name}"', conn), date)
+        migrated.append(table_name)
+
+        if not drop:
+            continue
+        original = pd.read_sql(f'SELECT * FROM "{table_name}"', conn)
+        restored = reconstruct_score_table(conn, date)
+        if restored is None or frame_digest(restored) != frame_digest(original):
+            print(f"⚠️  復元結果が一致しないため残します: {table_name}")
+            continue
+        conn.execute(f'DROP TABLE "{table_name}"')
+        if _table_exists(conn, DIGEST_TABLE):
+            conn.execute(f'DELETE FROM "{DIGEST_TABLE}" WHERE table_name = ?', (table_name,))
+        conn.commit()
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="スコア表の差分履歴")
+    parser.add_argument("--db", default=SCORE_DB)
+    parser.add_argument("--date", default=None, help="この日付（yyyymmdd）の表を復元")
+    parser.add_argument("--migrate", action="store_true", help="日付付きテーブルを履歴に取り込む")
+    parser.add_argument("--keep", action="store_true", help="--migrate で取り込んだテーブルを削除しない")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.migrate:
+            migrated = migrate_dated_tables(conn, drop=not args.keep)
+            print(f"✓ 履歴に取り込み: {len(migrated)}テーブル")
+        if args.date:
+            df = reconstruct_score_table(conn, args.date)
+            if df is None:
+                print(f"✗ {args.date} 以前の履歴がありません")
+            else:
+                print(f"{args.date}: {len(df)}行 × {len(df.columns)}列")
+            return
+        if not _table_exists(conn, DATES_TABLE):
+            print("履歴がありません")
+            return
+        rows = conn.execute(
+            f'SELECT history_date, row_count, upserts, deletes FROM "{DATES_TABLE}" ORDER BY history_date'
+        ).fetchall()
+        for date, row_count, upserts, deletes in rows:
+            print(f"{date}: {row_count}行（変更 {upserts} / 削除 {deletes}）")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+似た装備の検索（k 近傍）
+- 装備種類ごとに、ステータス6種＋アビリティスコアを標準化したベクトルで KD-tree を作る
+  （欠損は 0。標準化は装備種類内の平均・標準偏差、標準偏差 0 の列はそのまま）
+- 問い合わせは KD-tree を辿って近い葉だけを調べる（mart 全件を毎回走査しない）
+- アプリは load_data で作った索引を使い、評価シートは score DB の app_equipments から作った索引を使う
+"""
+from __future__ import annotations
+
+import heapq
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app_view import APP_TABLE, EQUIP_TYPES, read_app_data_version
+
+FEATURE_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "命中率", "回避率", "アビリティスコア"]
+DISPLAY_COLUMNS = ["装備名", "レアリティ", "画像", "アビリティ", *FEATURE_COLUMNS]
+LEAF_SIZE = 16
+
+# score DB のパス -> (app_data_version, 索引)
+_INDEX_CACHE: dict[str, tuple[str | None, dict]] = {}
+
+
+# =========================
+# KD-tree
+# =========================
+def _build_kdtree(points: np.ndarray) -> dict:
+    """
+    nodes の各要素: (分割次元, 分割値, 左, 右, 開始, 終了)。葉は分割次元 -1
+    order[開始:終了] がそのノードに含まれる点の番号
+    """
+    order = np.arange(len(points))
+    nodes: list[tuple] = []
+
+    def build(start: int, end: int) -> int:
+        node_id = len(nodes)
+        nodes.append(None)
+        if end - start <= LEAF_SIZE:
+            nodes[node_id] = (-1, 0.0, -1, -1, start, end)
+            return node_id
+        idx = order[start:end]
+        spread = points[idx].max(axis=0) - points[idx].min(axis=0)
+        dim = int(np.argmax(spread))
+        if spread[dim] == 0:  # 全点が同じ位置
+            nodes[node_id] = (-1, 0.0, -1, -1, start, end)
+            return node_id
+        mid = (end - start) // 2
+        order[start:end] = idx[np.argpartition(points[idx, dim], mid)]
+        value = float(points[order[start + mid], dim])
+        left = build(start, start + mid)
+        right = build(start + mid, end)
+        nodes[node_id] = (dim, value, left, right, start, end)
+        return node_id
+
+    if len(points):
+        build(0, len(points))
+    return {"points": points, "order": order, "nodes": nodes}
+
+
+def _query_kdtree(tree: dict, q: np.ndarray, k: int, exclude: int | None = None) -> list[tuple[float, int]]:
+    """q に近い k 点の (二乗距離, 点番号)。距離が同じ場合は点番号の小さい方"""
+    points, order, nodes = tree["points"], tree["order"], tree["nodes"]
+    heap: list[tuple[float, int]] = []  # (-二乗距離, -点番号) の最小ヒープ = 最も遠い点が先頭
+    if not nodes or k <= 0:
+        return []
+
+    def worst() -> tuple[float, int]:
+        return -heap[0][0], -heap[0][1]
+
+    def search(node_id: int) -> None:
+        dim, value, left, right, start, end = nodes[node_id]
+        if dim < 0:
+            idx = order[start:end]
+            dists = ((points[idx] - q) ** 2).sum(axis=1)
+            for i, dist in zip(idx.tolist(), dists.tolist()):
+                if i == exclude:
+                    continue
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist, -i))
+                elif (dist, i) < worst():
+                    heapq.heapreplace(heap, (-dist, -i))
+            return
+        diff = q[dim] - value
+        near, far = (left, right) if diff < 0 else (right, left)
+        search(near)
+        if len(heap) < k or diff * diff <= worst()[0]:
+            search(far)
+
+    search(0)
+    return sorted((-d, -i) for d, i in heap)
+
+
+# =========================
+# 索引
+# =========================
+def _feature_matrix(df: pd.DataFrame) -> np.ndarray:
+    return np.column_stack([
+        pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype=float)
+        for col in FEATURE_COLUMNS
+    ])
+
+
+def build_similarity_index(frames: dict[str, pd.DataFrame]) -> dict:
+    """{装備種類: DataFrame} から装備種類ごとの KD-tree を作成"""
+    index = {}
+    for equip_type, df in frames.items():
+        df = df.reset_index(drop=True)
+        raw = _feature_matrix(df)
+        center = raw.mean(axis=0) if len(raw) else np.zeros(len(FEATURE_COLUMNS))
+        scale = raw.std(axis=0) if len(raw) else np.ones(len(FEATURE_COLUMNS))
+        scale[scale == 0] = 1.0
+        points = (raw - center) / scale
+        index[equip_type] = {
+            "center": center,
+            "scale": scale,
+            "tree": _build_kdtree(points),
+            "rows": df[[col for col in DISPLAY_COLUMNS if col in df.columns]],
+            "keys": {key: i for i, key in enumerate(zip(df["装備名"], df["レアリティ"].astype(object)))},
+        }
+    return index
+
+
+def nearest_equipments(
+    index: dict,
+    equip_type: str,
+    vector,
+    k: int = 5,
+    exclude: tuple[str, str] | None = None,
+) -> pd.DataFrame:
+    """
+    任意のステータスベクトル（FEATURE_COLUMNS 順の値 or {列名: 値}）に近い装備 k 件
+    exclude: 除外する（装備名, レアリティ）。戻り値は近い順、距離は標準化後のユークリッド距離
+    """
+    entry = index.get(equip_type)
+    if entry is None:
+        return pd.DataFrame(columns=[*DISPLAY_COLUMNS, "距離"])
+    if isinstance(vector, dict):
+        vector = [vector.get(col) for col in FEATURE_COLUMNS]
+    raw = np.array([0.0 if v is None or pd.isna(v) else float(v) for v in vector])
+    q = (raw - entry["center"]) / entry["scale"]
+    exclude_pos = entry["keys"].get(exclude) if exclude else None
+
+    hits = _query_kdtree(entry["tree"], q, k, exclude=exclude_pos)
+    result = entry["rows"].iloc[[i for _, i in hits]].copy()
+    result["距離"] = [round(float(np.sqrt(d)), 3) for d, _ in hits]
+    return result.reset_index(drop=True)
+
+
+def similar_equipments(index: dict, equip_type: str, name: str, rarity: str, k: int = 5) -> pd.DataFrame:
+    """指定した装備に近い装備 k 件（自分自身は除く）"""
+    entry = index.get(equip_type)
+    pos = entry["keys"].get((name, rarity)) if entry else None
+    if pos is None:
+        return pd.DataFrame(columns=[*DISPLAY_COLUMNS, "距離"])
+    vector = _feature_matrix(entry["rows"].iloc[[pos]])[0]
+    return nearest_equipments(index, equip_type, vector, k=k, exclude=(name, rarity))
+
+
+def load_similarity_index(score_db_path: str | Path) -> dict | None:
+    """
+    score DB の app_equipments から索引を作成（app_data_version が変わるまでプロセス内で再利用）
+    app_equipments がなければ None
+    """
+    path = Path(score_db_path)
+    if not path.exists():
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        version = read_app_data_version(conn, APP_TABLE)
+        cached = _INDEX_CACHE.get(str(path))
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (APP_TABLE,)
+        ).fetchone()
+        if row is None:
+            return None
+        app_df = pd.read_sql(f'SELECT * FROM "{APP_TABLE}"', conn)
+    finally:
+        conn.close()
+
+    frames = {t: app_df[app_df["装備種類"] == t] for t in EQUIP_TYPES}
+    index = build_similarity_index(frames)
+    _INDEX_CACHE[str(path)] = (version, index)
+    return index
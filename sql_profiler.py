@@ -0,0 +1,201 @@
+"""
+SQL プロファイラ（N+1 検出）
+- 有効化中に実行された SQL を「呼び出し元（リポジトリ内の最初のフレーム）× 正規化した SQL」で集計
+- 同じ呼び出し元から同じ形のクエリが何度も実行されているもの（N+1 の疑い）と、
+  同じ呼び出し元で sqlite3.connect が何度も呼ばれているもの（接続の開き直し）を1つのレポートに出す
+- 既定では無効。計測したいときだけ以下のどちらかで使う
+
+使い方:
+    python sql_profiler.py generate_equipment_mart_score_db.py
+    python sql_profiler.py --threshold 5 run_pipeline.py --stages 05
+
+    # コードから
+    import sql_profiler
+    sql_profiler.enable()
+    ...
+    sql_profiler.print_report()
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import runpy
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pipeline_metrics
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_THRESHOLD = 10
+
+# 呼び出し元の特定で読み飛ばすファイル（計測側）
+_SKIP_FILES = {str(Path(__file__).resolve()), str(Path(pipeline_metrics.__file__).resolve())}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w\"])")
+# バインドされた NULL（VALUES (..., NULL) / = NULL）。IS NULL / IS NOT NULL は残す
+_NULL_LITERAL = re.compile(r"([(,=]\s*)NULL\b", re.IGNORECASE)
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+# 区切りの空白（リテラルの置き換え方で ", ?" / ",?" のように揺れないよう揃える）
+_COMMA = re.compile(r"\s*,\s*")
+_OPEN_PAREN = re.compile(r"\(\s+")
+_CLOSE_PAREN = re.compile(r"\s+\)")
+
+# (呼び出し元, 正規化SQL) -> 回数 / 呼び出し元 -> 接続回数
+_statements: Counter = Counter()
+_connects: Counter = Counter()
+_repo_files: dict[str, bool] = {}
+_enabled = False
+
+
+def normalize_sql(sql: str) -> str:
+    """リテラルを ? に置き換え、空白を詰めて「クエリの形」にする（どの値が NULL かで形が変わらない）"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _NULL_LITERAL.sub(r"\1?", sql)
+    sql = _IN_LIST.sub("IN (?)", sql)
+    sql = _WHITESPACE.sub(" ", sql)
+    sql = _COMMA.sub(", ", sql)
+    sql = _OPEN_PAREN.sub("(", sql)
+    sql = _CLOSE_PAREN.sub(")", sql)
+    return sql.strip()
+
+
+def _is_repo_file(filename: str) -> bool:
+    # runpy で起動したスクリプトは相対パスになるため絶対パスで判定（結果はキャッシュ）
+    cached = _repo_files.get(filename)
+    if cached is None:
+        path = str(Path(filename).resolve())
+        cached = path.startswith(str(BASE_DIR)) and path not in _SKIP_FILES
+        _repo_files[filename] = cached
+    return cached
+
+
+def _call_site() -> str:
+    """リポジトリ内で最も内側の呼び出し元（ファイル名:行番号 関数名）"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if _is_repo_file(frame.f_code.co_filename):
+            return f"{Path(frame.f_code.co_filename).name}:{frame.f_lineno} ({frame.f_code.co_name})"
+        frame = frame.f_back
+    return "(リポジトリ外)"
+
+
+def _record(event: str, sql: str | None) -> None:
+    site = _call_site()
+    if event == "connect":
+        _connects[site] += 1
+    else:
+        _statements[(site, normalize_sql(sql))] += 1
+
+
+def enable() -> None:
+    """以降に開かれる接続の SQL を集計する（二重に呼んでも1回分）"""
+    global _enabled
+    if _enabled:
+        return
+    pipeline_metrics.add_hook(_record)
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    if not _enabled:
+        return
+    pipeline_metrics.remove_hook(_record)
+    _enabled = False
+
+
+def watch_connection(conn) -> None:
+    """enable() より前に開いた接続も集計対象にする"""
+    pipeline_metrics.watch_connection(conn)
+
+
+def reset() -> None:
+    _statements.clear()
+    _connects.clear()
+
+
+def _is_read(sql: str) -> bool:
+    return sql.split(" ", 1)[0].upper() in ("SELECT", "WITH", "PRAGMA")
+
+
+def build_report(threshold: int = DEFAULT_THRESHOLD) -> dict:
+    """
+    集計結果
+    - statements: (呼び出し元, SQL, 回数) の多い順
+    - shapes: 正規化 SQL ごとの合計回数
+    - n_plus_one: 同じ呼び出し元・同じ形の読み取りが threshold 回以上
+    - repeated_writes: 同じ呼び出し元・同じ形の書き込みが threshold 回以上
+      （トレース上は executemany も1行ずつ見えるため N+1 とは分けて出す）
+    - reconnects: 同じ呼び出し元で threshold 回以上 connect
+    """
+    statements = [(site, sql, count) for (site, sql), count in _statements.most_common()]
+    shapes = Counter()
+    for (_site, sql), count in _statements.items():
+        shapes[sql] += count
+    return {
+        "total": sum(_statements.values()),
+        "connects": sum(_connects.values()),
+        "statements": statements,
+        "shapes": shapes.most_common(),
+        "n_plus_one": [s for s in statements if s[2] >= threshold and _is_read(s[1])],
+        "repeated_writes": [s for s in statements if s[2] >= threshold and not _is_read(s[1])],
+        "reconnects": [(site, count) for site, count in _connects.most_common() if count >= threshold],
+    }
+
+
+def _shorten(sql: str, width: int = 110) -> str:
+    return sql if len(sql) <= width else sql[: width - 3] + "..."
+
+
+def print_report(threshold: int = DEFAULT_THRESHOLD, top: int = 15) -> None:
+    report = build_report(threshold)
+    print("=" * 60)
+    print(f"SQL プロファイル: 実行 {report['total']} 回 / 形 {len(report['shapes'])} 種 / 接続 {report['connects']} 回")
+    print("=" * 60)
+
+    if report["n_plus_one"]:
+        print(f"⚠️  N+1 の疑い（同じ呼び出し元から同じ形のクエリが {threshold} 回以上）")
+        for site, sql, count in report["n_plus_one"]:
+            print(f"  {count:>6}回  {site}")
+            print(f"          {_shorten(sql)}")
+    if report["repeated_writes"]:
+        print(f"ℹ️  同じ形の書き込みが {threshold} 回以上（executemany / to_sql なら問題なし）")
+        for site, sql, count in report["repeated_writes"]:
+            print(f"  {count:>6}回  {site}")
+            print(f"          {_shorten(sql)}")
+    if report["reconnects"]:
+        print(f"⚠️  接続の開き直し（同じ呼び出し元で sqlite3.connect が {threshold} 回以上）")
+        for site, count in report["reconnects"]:
+            print(f"  {count:>6}回  {site}")
+    if not report["n_plus_one"] and not report["reconnects"]:
+        print("✓ N+1 の疑いなし")
+
+    print(f"\n実行回数の多いクエリ（上位{top}件）")
+    for sql, count in report["shapes"][:top]:
+        print(f"  {count:>6}回  {_shorten(sql)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="スクリプトを SQL プロファイル付きで実行")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD, help="N+1 とみなす回数 (default: 10)")
+    parser.add_argument("--top", type=int, default=15, help="表示する上位クエリ数 (default: 15)")
+    parser.add_argument("script", help="実行するスクリプト（例: run_pipeline.py）")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="スクリプトに渡す引数")
+    args = parser.parse_args()
+
+    sys.argv = [args.script, *args.args]
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    enable()
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        disable()
+        print_report(threshold=args.threshold, top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+装備画像のサムネイル生成
+- static/ の装備画像（{装備名}_{レアリティ}.png）から一覧表示用の小さな WebP を static/thumbs/ に作成
+- ファイル名は内容ハッシュ（{sha256先頭16桁}.webp）。内容が変わればURLも変わるため、ブラウザに長期キャッシュさせてよい
+- 元画像 → サムネイルの対応は static/thumbs/manifest.json に記録
+  - 元画像の sha256 が前回と同じならサムネイルは作り直さない
+- app.py は manifest を読んで 画像 列を Streamlit の静的配信URL（app/static/thumbs/...）に置き換える
+  （.streamlit/config.toml の enableStaticServing が必要）
+
+使い方:
+    python thumbnails.py
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+STATIC_DIR = Path("static")
+THUMB_DIR = STATIC_DIR / "thumbs"
+MANIFEST_FILE = "manifest.json"
+# 一覧の行の高さ（約35px）の2倍程度。元画像は 160px 前後
+THUMB_SIZE = 64
+WEBP_QUALITY = 80
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+# Streamlit の静的配信（static/ 配下を app/static/ で配信）
+STATIC_URL_PREFIX = "app/static"
+
+
+def manifest_path(thumb_dir: Path = THUMB_DIR) -> Path:
+    return Path(thumb_dir) / MANIFEST_FILE
+
+
+def load_manifest(thumb_dir: Path = THUMB_DIR) -> dict:
+    """{元画像ファイル名: {"source_sha256": ..., "thumb": ...}}。manifest がなければ空"""
+    path = manifest_path(thumb_dir)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _source_images(static_dir: Path) -> list[Path]:
+    return sorted(
+        p for p in Path(static_dir).iterdir()
+        if p.is_file() and p.suffix.lower() in IMAGE_SUFFIXES
+    )
+
+
+def render_thumbnail(image_bytes: bytes, size: int = THUMB_SIZE) -> bytes:
+    """縦横比を保って size px 以内に縮小した WebP のバイト列"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        image.save(buf, format="WEBP", quality=WEBP_QUALITY)
+    return buf.getvalue()
+
+
+def build_thumbnails(static_dir: Path = STATIC_DIR, thumb_dir: Path = THUMB_DIR) -> dict:
+    """
+    static_dir の画像ごとにサムネイルを作成し manifest を更新
+    戻り値: {"created": 作成数, "kept": 再利用数, "removed": 削除した古いサムネイル数, "failed": [ファイル名]}
+    """
+    static_dir = Path(static_dir)
+    thumb_dir = Path(thumb_dir)
+    thumb_dir.mkdir(parents=True, exist_ok=True)
+
+    old_manifest = load_manifest(thumb_dir)
+    manifest = {}
+    stats = {"created": 0, "kept": 0, "removed": 0, "failed": []}
+
+    for source in _source_images(static_dir):
+        data = source.read_bytes()
+        source_sha256 = hashlib.sha256(data).hexdigest()
+        previous = old_manifest.get(source.name)
+        if (
+            previous
+            and previous["source_sha256"] == source_sha256
+            and (thumb_dir / previous["thumb"]).exists()
+        ):
+            manifest[source.name] = previous
+            stats["kept"] += 1
+            continue
+
+        try:
+            thumb = render_thumbnail(data)
+        except Exception as e:
+            print(f"⚠️  サムネイル作成失敗: {source.name} ({e})")
+            stats["failed"].append(source.name)
+            continue
+        thumb_name = f"{hashlib.sha256(thumb).hexdigest()[:16]}.webp"
+        thumb_path = thumb_dir / thumb_name
+        if not thumb_path.exists():
+            thumb_path.write_bytes(thumb)
+        manifest[source.name] = {"source_sha256": source_sha256, "thumb": thumb_name}
+        stats["created"] += 1
+
+    # どの元画像からも参照されなくなったサムネイルを削除
+    used = {entry["thumb"] for entry in manifest.values()}
+    for path in thumb_dir.glob("*.webp"):
+        if path.name not in used:
+            path.unlink()
+            stats["removed"] += 1
+
+    # 内容が変わったときだけ書き直す（アプリ側は manifest の更新をデータ変更として扱う）
+    if manifest != old_manifest or not manifest_path(thumb_dir).exists():
+        tmp_path = manifest_path(thumb_dir).with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, manifest_path(thumb_dir))
+    return stats
+
+
+def thumbnail_url(img_url: str | None, manifest: dict) -> str | None:
+    """
+    IMG_URL（raw.githubusercontent.com/.../static/{画像名}）に対応するサムネイルの静的配信URL
+    manifest にない画像は元のURLのまま返す
+    """
+    if not isinstance(img_url, str) or not img_url:
+        return img_url
+    name = unquote(Path(urlparse(img_url).path).name)
+    entry = manifest.get(name)
+    if entry is None:
+        return img_url
+    return f"{STATIC_URL_PREFIX}/{THUMB_DIR.name}/{entry['thumb']}"
+
+
+def main() -> None:
+    stats = build_thumbnails()
+    print(
+        f"✓ サムネイル: 作成 {stats['created']}件 / 再利用 {stats['kept']}件 / "
+        f"削除 {stats['removed']}件 / 失敗 {len(stats['failed'])}件"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+未登録装備（告知済み・実装前など）の仮評価
+- mart_equipments に入れて score DB を作り直さなくても、ステータス・装備種類・レアリティ・アビリティから
+  評価シート（generate_evaluation_html）と同じ内訳を返す
+  - ステータスごとの順位・スコア・1位との差分、型内2ステータス組み合わせ順位、型、ステータススコア、アビリティスコア
+- mart_equipments を1回だけ読んで（EvaluationContext）比較母集団ごとの昇順配列を作り（スナップショット）、評価時はDBを参照しない
+  - ステータス: (装備種類, レアリティ, 体力/攻撃力/防御力) / (装備種類, 会心率/回避率/命中率)
+  - 型内組み合わせ: (装備種類, レアリティ, ステータス1, ステータス2) の組み合わせスコア
+  - アビリティ効果量: (装備種類, カテゴリ)
+- include_self=True（既定）は「その装備を mart に追加した場合」の評価（母集団に自分を含める）
+  既に mart にある装備を評価するときは False にすると評価シートと一致する
+
+使い方:
+    python whatif_evaluation.py 武器 UR --stat 攻撃力=5200 --stat 会心率=9.5 \\
+        --ability "攻撃力が10%上昇" --category "攻撃力上昇"
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+
+import numpy as np
+
+from ability_evaluator import (
+    DB_FILE,
+    EvaluationContext,
+    _split_categories,
+    _with_value,
+    category_settings_version,
+    evaluate_ability,
+    load_evaluation_context,
+)
+from change_markers import table_fingerprints
+from generate_equipment_evaluation import STATUS_COLUMNS, analyze_build_type, calculate_overall_status_score
+
+ALL_STATUS_COLUMNS = ["体力", "攻撃力", "防御力", "会心率", "回避率", "命中率"]
+
+# DB パス -> ((mart_equipments のフィンガープリント, カテゴリ設定のバージョン), スナップショット)
+_SNAPSHOT_CACHE: dict[str, tuple[tuple[str | None, str], dict]] = {}
+
+
+# =========================
+# スナップショット
+# =========================
+def build_ranking_snapshot(context: EvaluationContext) -> dict:
+    """
+    評価コンテキスト（mart_equipments を読み込んだもの）から比較母集団ごとの昇順配列を作成
+    - ステータス・型内組み合わせの母集団は context 側（EvaluationContext.ranking_populations）に持つ
+    """
+    context.ranking_populations()
+    effects = {key: np.sort(np.array(values, dtype=float)) for key, values in context.effect_populations.items()}
+    return {"effects": effects, "context": context}
+
+
+def load_ranking_snapshot(db_path: str = DB_FILE) -> dict:
+    """
+    スナップショットを取得（mart_equipments の内容とカテゴリ設定が変わるまでプロセス内で再利用）
+    - コンテキストは作成時のカテゴリ設定を持つので、設定のバージョンもキーに含める
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        key = (table_fingerprints(conn, ["mart_equipments"])["mart_equipments"], category_settings_version())
+        cached = _SNAPSHOT_CACHE.get(db_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        snapshot = build_ranking_snapshot(load_evaluation_context(conn))
+    finally:
+        conn.close()
+    _SNAPSHOT_CACHE[db_path] = (key, snapshot)
+    return snapshot
+
+
+# =========================
+# 評価
+# =========================
+def _effect_populations(snapshot: dict, equipment: dict, include_self: bool) -> dict[str, list[float]]:
+    equipment_type = equipment["装備種類"]
+    ability = equipment.get("アビリティ")
+    populations = {}
+    for category in _split_categories(equipment.get("アビリティカテゴリ")):
+        values = snapshot["effects"].get((equipment_type, category), np.array([]))
+        if include_self and ability:
+            value = snapshot["context"].effect_value(ability, category)
+            if value is not None:
+                values = _with_value(values, value)
+        populations[category] = values.tolist()
+    return populations
+
+
+def evaluate_whatif(
+    snapshot: dict,
+    equipment_type: str,
+    rarity: str,
+    stats: dict,
+    ability: str | None = None,
+    category: str | None = None,
+    equipment_name: str | None = None,
+    include_self: bool = True,
+) -> dict:
+    """
+    仮の装備を評価（DBは参照しない）
+    stats: {ステータス名: 値}（ないステータスは省略 or 0/None）
+    category: アビリティカテゴリ（複数は「,」区切り）。未指定ならアビリティは評価しない（評価シートと同じ）
+    戻り値:
+        rankings / build_type_rankings: 評価シートの「ランキング」「型内ステータス組み合わせランキング」
+        build_type: 型（評価シートの「ステータス組み合わせ評価」、該当なしは空文字）
+        status_score / status_score_type: ステータススコアと算出方法（ランキングがなければ None）
+        ability: evaluate_ability の結果（アビリティなしは None）
+        ability_score: アビリティスコア（アビリティなしは 0）
+    """
+    equipment = {"装備名": equipment_name, "装備種類": equipment_type, "レアリティ": rarity}
+    for col in ALL_STATUS_COLUMNS:
+        equipment[col] = stats.get(col)
+    equipment["アビリティ"] = ability
+    equipment["アビリティカテゴリ"] = category
+
+    context = snapshot["context"]
+    rankings = context.status_rankings(equipment, include_self)
+    build_type_name, build_type_statuses = analyze_build_type(equipment, rankings)
+    build_type_rankings = context.build_type_rankings(equipment, include_self)
+    if build_type_rankings:
+        best_build = max(build_type_rankings.values(), key=lambda x: x["score"])
+        build_type_name = f'{best_build["build_type_display"]} ({best_build["combo_name"]})'
+
+    status_score, status_score_type = None, None
+    if rankings:
+        status_score, status_score_type = calculate_overall_status_score(rankings, build_type_rankings)
+
+    ability_text = ability or "なし"
+    ability_category = category or "なし"
+    eval_result = None
+    if ability_text != "なし" and ability_category != "なし":
+        eval_result = evaluate_ability(
+            ability_text,
+            ability_category,
+            equipment_type,
+            equipment_name=equipment_name,
+            rarity=rarity,
+            effect_populations=_effect_populations(snapshot, equipment, include_self),
+            context=context,
+        )
+
+    return {
+        "rankings": rankings,
+        "build_type_rankings": build_type_rankings,
+        "build_type": build_type_name,
+        "build_type_statuses": build_type_statuses,
+        "status_score": status_score,
+        "status_score_type": status_score_type,
+        "ability": eval_result,
+        "ability_score": eval_result["score"] if eval_result else 0,
+    }
+
+
+def format_whatif(result: dict, equipment_type: str) -> str:
+    """evaluate_whatif の結果を評価シートと同じ並びのテキストに整形"""
+    lines = []
+    if result["status_score"] is not None:
+        lines.append(f'ステータススコア: {result["status_score"]:.1f}点 ({result["status_score_type"]})')
+        lines.append(f"{equipment_type}内でのランキング")
+        for status, data in result["rankings"].items():
+            lines.append(
+                f'  {status}: {data["rank"]}位/{data["total"]}中 (スコア: {data["score"]:.1f}点) 1位との差分: {data["diff"]:.1f}'
+            )
+    if result["build_type_rankings"]:
+        lines.append("型内ステータス組み合わせランキング")
+        for data in sorted(result["build_type_rankings"].values(), key=lambda x: x["score"], reverse=True):
+            lines.append(
+                f'  {data["build_type_display"]} ({data["combo_name"]}): {data["rank"]}位/{data["total"]}中 '
+                f'(スコア: {data["score"]:.1f}点) 1位との差分: {data["diff"]:.1f}'
+            )
+    lines.append(f'ステータス組み合わせ評価: {result["build_type"] or "型分類なし"}')
+    ability = result["ability"]
+    if ability is None:
+        lines.append("アビリティ評価: アビリティなし")
+    else:
+        lines.append(
+            f'アビリティスコア: {ability["score"]:.1f}点 (カテゴリ重要度: {ability["importance"]}点 / '
+            f'発動条件倍率: {ability["condition_rate"]:.2f}倍 / 効果量スコア: {ability.get("effect_score", 0):.2f})'
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="未登録装備の仮評価（評価シートと同じ内訳）")
+    parser.add_argument("equipment_type", choices=list(STATUS_COLUMNS))
+    parser.add_argument("rarity")
+    parser.add_argument("--stat", action="append", default=[], metavar="ステータス=値", help="例: --stat 攻撃力=5200")
+    parser.add_argument("--ability", default=None)
+    parser.add_argument("--category", default=None, help="アビリティカテゴリ（複数は「,」区切り）")
+    parser.add_argument("--name", default=None, help="装備名（効果量の例外ルールの判定に使用）")
+    args = parser.parse_args()
+
+    stats = {}
+    for item in args.stat:
+        col, _, value = item.partition("=")
+        if col not in ALL_STATUS_COLUMNS:
+            parser.error(f"不明なステータス: {col}")
+        stats[col] = float(value)
+
+    snapshot = load_ranking_snapshot()
+    result = evaluate_whatif(
+        snapshot,
+        args.equipment_type,
+        args.rarity,
+        stats,
+        ability=args.ability,
+        category=args.category,
+        equipment_name=args.name,
+    )
+    print(format_whatif(result, args.equipment_type))
+
+
+if __name__ == "__main__":
+    main()